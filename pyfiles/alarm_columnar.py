@@ -0,0 +1,137 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 第一部分 (报警总体情况) 的列式统计
+# 与 api_server.aggregate_alarm_rows 的逐行循环口径完全一致，但分类与累加按列进行:
+# - 车站 / 描述 / 报警类型先去重编码，分类规则只对去重后的取值各执行一次，再用查找数组映射回每行
+# - 各表的累加用 np.unique + np.bincount 完成，不再逐行更新字典
+# - 输出字典的键顺序按首次出现的行排序，与逐行循环的插入顺序相同，保证 JSON 输出一致
+# numpy 未安装时 available() 为 False，调用方使用逐行循环。
+
+T2_CATEGORIES = ("elec_char", "switch_no_rep", "safety", "other")
+
+def available():
+    return np is not None
+
+def _factorize(values):
+    """按首次出现顺序编码，返回 (每行编码数组, 去重后的取值列表)"""
+    index = {}
+    codes = np.fromiter((index.setdefault(v, len(index)) for v in values), dtype=np.int64, count=len(values))
+    return codes, list(index)
+
+def _grouped_sum(keys, weights):
+    """按 keys 分组求和，返回按首次出现顺序排列的 (key, sum) 列表"""
+    if len(keys) == 0:
+        return []
+    uniq, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    sums = np.bincount(inverse, weights=weights, minlength=len(uniq))
+    order = np.argsort(first, kind="stable")
+    return [(int(uniq[i]), int(sums[i])) for i in order]
+
+def _numeric(column):
+    return np.asarray(column, dtype=np.float64)
+
+def aggregate(columns, stations, t2_category, t3_category, des_flags_of, flag_bits, des_is_text):
+    """
+    列式统计。columns 为 (telename, alarmlevel, devicetype, alarmtype, des, cnt) 六列；
+    des_is_text=True 时第五列为 alarmdes 文本 (由 des_flags_of 转为标记位)，否则已是 des_flags。
+    stations 为 station_dim.StationDimension，未知车站 / 未知电务段的行不计入各表 (仍计入总数)。
+    flag_bits 为 (外电网, 缺口, 监测) 标记位。
+    返回 (total_alarms, table1_stats, table2_stats, table3_stats, workshop_stats)。
+    """
+    tele_col, level_col, dtype_col, atype_col, des_col, cnt_col = columns
+    cnt = np.asarray(cnt_col, dtype=np.int64)
+    total_alarms = int(cnt.sum()) if len(cnt) else 0
+    if len(cnt) == 0:
+        return total_alarms, {}, {}, {}, {}
+    ext_bit, gap_bit, monitor_bit = flag_bits
+
+    # --- 车站 -> 电务段 / 车间 (每个车站只查一次，id 即车站维度中的编号) ---
+    tele_codes, teles = _factorize(tele_col)
+    tele_section, tele_workshop = stations.hierarchy_ids(teles)
+    sections = stations.sections
+
+    section = tele_section[tele_codes]
+    valid = section >= 0
+    if not valid.any():
+        return total_alarms, {}, {}, {}, {}
+
+    # --- 描述关键词标记 ---
+    if des_is_text:
+        des_codes, des_values = _factorize(des_col)
+        flags = np.array([des_flags_of(d) for d in des_values], dtype=np.int64)[des_codes]
+    else:
+        flags = np.asarray(des_col, dtype=np.int64)
+
+    # --- 报警类型 -> 表2 / 表3 分类 (每个类型只判定一次) ---
+    level = _numeric(level_col)
+    dtype = _numeric(dtype_col)
+    atype_values, atype_codes = np.unique(_numeric(atype_col), return_inverse=True)
+    t3_names = []
+    atype_t2 = np.full(len(atype_values), -1, dtype=np.int64)
+    atype_t3 = np.full(len(atype_values), -1, dtype=np.int64)
+    for i, value in enumerate(atype_values):
+        atype = None if np.isnan(value) else int(value)
+        t2_cat = t2_category(atype)
+        if t2_cat:
+            atype_t2[i] = T2_CATEGORIES.index(t2_cat) if t2_cat in T2_CATEGORIES else T2_CATEGORIES.index("other")
+            continue
+        t3_cat = t3_category(atype)
+        if t3_cat:
+            if t3_cat not in t3_names:
+                t3_names.append(t3_cat)
+            atype_t3[i] = t3_names.index(t3_cat)
+    for name in ("gap", "track_monitor", "other"):
+        if name not in t3_names:
+            t3_names.append(name)
+    gap_code, track_code, t3_other_code = (t3_names.index(n) for n in ("gap", "track_monitor", "other"))
+
+    t2 = atype_t2[atype_codes]
+    t3 = atype_t3[atype_codes]
+    no_t2 = t2 < 0
+    no_t3 = no_t2 & (t3 < 0)
+    is_gap = no_t3 & ((dtype == 51) | ((flags & gap_bit) != 0))
+    is_track = no_t3 & ~is_gap & (dtype == 65)
+    t3 = np.where(is_gap, gap_code, np.where(is_track, track_code, t3))
+    # 监测相关报警归为表2 other (兜底)，其余归为表3 other
+    is_monitor = no_t2 & (t3 < 0) & ((flags & monitor_bit) != 0)
+    t2 = np.where(is_monitor, T2_CATEGORIES.index("other"), t2)
+    t3 = np.where(no_t2 & ~is_monitor & (t3 < 0), t3_other_code, t3)
+
+    # --- 只保留已知电务段的行 ---
+    section, cnt, level, flags = section[valid], cnt[valid], level[valid], flags[valid]
+    t2, t3 = t2[valid], t3[valid]
+    workshop = tele_workshop[tele_codes][valid]
+
+    # 表1
+    table1_stats = {}
+    for key, total in _grouped_sum(section, cnt):
+        table1_stats[sections[key]] = {"total": total, "level1": 0, "level2": 0, "level3": 0, "total_no_ext": 0}
+    for col, mask in (("level1", level == 1), ("level2", level == 2), ("level3", level == 3),
+                      ("total_no_ext", (flags & ext_bit) == 0)):
+        for key, total in _grouped_sum(section[mask], cnt[mask]):
+            table1_stats[sections[key]][col] = total
+
+    # 表2 / 表3: 先写 total，其余分类按首次出现顺序
+    def breakdown(cat_codes, names):
+        stats = {}
+        mask = cat_codes >= 0
+        keys = section[mask] * len(names) + cat_codes[mask]
+        for key, total in _grouped_sum(keys, cnt[mask]):
+            row = stats.setdefault(sections[key // len(names)], {"total": 0})
+            row["total"] += total
+            row[names[key % len(names)]] = total
+        return stats
+
+    table2_stats = breakdown(t2, T2_CATEGORIES)
+    table3_stats = breakdown(t3, t3_names)
+
+    # 表4
+    workshop_stats = {}
+    for key, total in _grouped_sum(workshop, cnt):
+        section_name = sections[stations.workshop_section[key]]
+        workshop_stats.setdefault(section_name, {})[stations.workshops[key]] = total
+
+    return total_alarms, table1_stats, table2_stats, table3_stats, workshop_stats
@@ -0,0 +1,61 @@
+import re
+import functools
+import collections
+
+import rollup_store
+
+# 报警描述分析 (各报表共用)
+# 明细中反复出现的是同一批 alarmdes 字符串，每个不同的描述只分析一次，结果缓存在有界 LRU 中:
+#   text     去掉首尾空白后的描述，空值为 "Unknown" (第二部分的口径)
+#   generic  '#' 之后的部分，无 '#' 时为 text (第二部分未配置 ALARM_DESC_MAP 时的通用报警名)
+#   device   '#' 之前的设备前缀，无 '#' 时为 None
+#   flags    外电网 / 缺口 / 监测 关键词标记位，与日汇总库 des_flags 的口径一致
+# 关键词由一个多模式正则一次扫描完成，不再逐个关键词做子串查找。
+
+KEYWORD_FLAGS = {
+    "外电网": rollup_store.DES_FLAG_EXT_POWER,
+    "缺口": rollup_store.DES_FLAG_GAP,
+    "监测": rollup_store.DES_FLAG_MONITOR
+}
+
+DesInfo = collections.namedtuple("DesInfo", ("text", "generic", "device", "flags"))
+
+class DescriptionAnalyzer:
+    """报警描述 -> DesInfo，最多缓存 max_entries 个不同的描述 (LRU)"""
+
+    def __init__(self, max_entries=65536, keywords=None):
+        self.keywords = dict(keywords or KEYWORD_FLAGS)
+        # 长关键词优先，避免被其前缀抢先匹配
+        self._pattern = re.compile("|".join(
+            re.escape(k) for k in sorted(self.keywords, key=len, reverse=True)
+        ))
+        self.analyze = functools.lru_cache(maxsize=max_entries)(self._analyze)
+
+    def _analyze(self, des):
+        text = des.strip() if des else "Unknown"
+        if "#" in text:
+            device, generic = text.split("#", 1)
+        else:
+            device, generic = None, text
+        flags = 0
+        if des:
+            for keyword in self._pattern.findall(str(des)):
+                flags |= self.keywords[keyword]
+        return DesInfo(text, generic, device, flags)
+
+    def flags(self, des):
+        return self.analyze(des).flags
+
+    def clear(self):
+        self.analyze.cache_clear()
+
+    def snapshot(self):
+        info = self.analyze.cache_info()
+        lookups = info.hits + info.misses
+        return {
+            "entries": info.currsize,
+            "max_entries": info.maxsize,
+            "hits": info.hits,
+            "misses": info.misses,
+            "hit_rate": round(info.hits / lookups, 4) if lookups else 0.0
+        }
@@ -1,100 +1,217 @@
-import json
 import datetime
 import oracledb
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
 from pydantic import BaseModel
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from datetime import timedelta
 import collections
+import bisect
 import os
-import xml.etree.ElementTree as ET
 import re
+import time
+import threading
+import contextlib
+import contextvars
+import uuid
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from fastapi.concurrency import run_in_threadpool
+
+import alarm_source
+import config_snapshot
+import debug_writer
+import http_encoding
+import metrics
+import alarm_columnar
+import alarm_desc
+import rollup_store
+import slow_query
+import report_cache
+import report_scheduler
+import process_lease
+import request_timing
+import singleflight
+import station_dim
+
+# Oracle 客户端配置
+# Thick 模式在第一次连接数据库时才初始化 (lazy=True)，启动和工作进程重启不再等待加载客户端库，
+# 使用本地数据源时完全不加载。lazy=False 时启动即初始化并创建连接池，配置错误可尽早暴露。
+ORACLE_CLIENT_CONFIG = {
+    "lib_dir": r"C:\oracle\instantclient_19_29",
+    "lazy": True
+}
 
-# Attempt to initialize Oracle Instant Client (Thick mode)
-# This is required for connecting to older Oracle databases (e.g. 11g) that Thin mode doesn't support.
-try:
-    # Try explicit path first (User specific path detected during support)
-    explicit_lib_dir = r"C:\oracle\instantclient_19_29"
-    try:
-        oracledb.init_oracle_client(lib_dir=explicit_lib_dir)
-        print(f"Successfully initialized Oracle config from {explicit_lib_dir}")
-    except Exception:
-        # Fallback to PATH lookup
-        oracledb.init_oracle_client()
-        print("Successfully initialized Oracle config from PATH")
-except Exception as e:
-    print(f"Warning: Failed to enable python-oracledb Thick mode: {e}")
-    print("If you encounter 'DPY-3010', please install Oracle Instant Client and add it to PATH.")
+_oracle_client_lock = threading.Lock()
+_oracle_client_initialized = False
 
-app = FastAPI()
+def init_oracle_client():
+    """初始化 Oracle Instant Client (Thick 模式)，进程内只执行一次"""
+    global _oracle_client_initialized
+    with _oracle_client_lock:
+        if _oracle_client_initialized:
+            return
+        _oracle_client_initialized = True
+        # Attempt to initialize Oracle Instant Client (Thick mode)
+        # This is required for connecting to older Oracle databases (e.g. 11g) that Thin mode doesn't support.
+        try:
+            # Try explicit path first (User specific path detected during support)
+            explicit_lib_dir = ORACLE_CLIENT_CONFIG["lib_dir"]
+            try:
+                oracledb.init_oracle_client(lib_dir=explicit_lib_dir)
+                print(f"Successfully initialized Oracle config from {explicit_lib_dir}")
+            except Exception:
+                # Fallback to PATH lookup
+                oracledb.init_oracle_client()
+                print("Successfully initialized Oracle config from PATH")
+        except Exception as e:
+            print(f"Warning: Failed to enable python-oracledb Thick mode: {e}")
+            print("If you encounter 'DPY-3010', please install Oracle Instant Client and add it to PATH.")
 
-# Alarm Description Map: (type, subtype) -> description
-ALARM_DESC_MAP = {}
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    # lazy=False 时启动即创建连接池；关闭服务时释放所有会话
+    if DATA_SOURCE_CONFIG["type"] == "oracle" and not ORACLE_CLIENT_CONFIG["lazy"]:
+        try:
+            create_db_pool()
+        except Exception as e:
+            print(f"Warning: Failed to create Oracle session pool at startup: {e}")
+    start_rollup_refresher()
+    init_report_cache()
+    start_config_watcher()
+    init_debug_writer()
+    init_slow_query_log()
+    start_report_scheduler()
+    yield
+    await stop_report_scheduler()
+    stop_config_watcher()
+    close_debug_writer()
+    stop_rollup_refresher()
+    shutdown_query_executor()
+    close_slow_query_log()
+    close_db_pool()
+
+app = FastAPI(lifespan=lifespan)
+
+# 响应编码配置 (见 http_encoding)
+# fast_json=True 时报表接口直接把结果序列化为响应 (安装了 orjson 时用 orjson)，跳过 FastAPI 默认的 jsonable_encoder 遍历。
+# compress=True 时不小于 compress_min_bytes 的响应按 Accept-Encoding 压缩 (br 需安装 brotli，否则 gzip)，
+# 不小于 compress_thread_min_bytes 的响应在线程池中压缩。
+RESPONSE_CONFIG = {
+    "fast_json": True,
+    "compress": True,
+    "compress_min_bytes": 1024,
+    "compress_thread_min_bytes": 65536,
+    "gzip_level": 6,
+    "brotli_quality": 4
+}
 
-def load_alarm_config():
-    global ALARM_DESC_MAP
+if RESPONSE_CONFIG["compress"]:
+    app.add_middleware(
+        http_encoding.CompressionMiddleware,
+        minimum_size=RESPONSE_CONFIG["compress_min_bytes"],
+        gzip_level=RESPONSE_CONFIG["gzip_level"],
+        brotli_quality=RESPONSE_CONFIG["brotli_quality"],
+        threadpool_min_size=RESPONSE_CONFIG["compress_thread_min_bytes"]
+    )
+
+# --- 指标 (GET /metrics，Prometheus 文本格式) ---
+# 每条 SQL 在 run_queries / run_query 调用处有固定的名称 (如 part2.details)，作为 alarm_sql_* 指标的 query 标签。
+METRICS = metrics.Registry()
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+HTTP_REQUESTS = METRICS.counter(
+    "alarm_http_requests_total", "HTTP requests by endpoint, method and status", ("endpoint", "method", "status"))
+HTTP_DURATION = METRICS.histogram(
+    "alarm_http_request_duration_seconds", "HTTP request latency by endpoint", ("endpoint",))
+HTTP_IN_FLIGHT = METRICS.gauge(
+    "alarm_http_requests_in_flight", "HTTP requests currently being served")
+HTTP_RESPONSE_BYTES = METRICS.histogram(
+    "alarm_http_response_bytes", "Response body size on the wire (after compression)", ("endpoint",), BYTES_BUCKETS)
+REPORT_SERIALIZED_BYTES = METRICS.histogram(
+    "alarm_report_serialized_bytes", "Serialized report JSON size before compression", ("endpoint",), BYTES_BUCKETS)
+REPORT_CACHE_LOOKUPS = METRICS.counter(
+    "alarm_report_cache_lookups_total", "Report cache lookups by endpoint and result (hit/miss/bypass/coalesced)", ("endpoint", "result"))
+REPORT_COALESCED = METRICS.counter(
+    "alarm_report_coalesced_requests_total", "Report requests that shared a concurrent identical computation", ("endpoint",))
+CACHE_HIT_RATIO = METRICS.gauge(
+    "alarm_cache_hit_ratio", "Hit ratio since startup of the report cache and the description analyzer cache", ("cache",))
+PRECOMPUTE_RUNS = METRICS.counter(
+    "alarm_precompute_runs_total", "Scheduled report precompute attempts by endpoint and result", ("endpoint", "result"))
+SQL_QUERIES = METRICS.counter(
+    "alarm_sql_queries_total", "SQL statements executed by name and status", ("query", "status"))
+SQL_EXECUTE = METRICS.histogram(
+    "alarm_sql_execute_seconds", "Time spent in cursor.execute by statement name", ("query",))
+SQL_FETCH = METRICS.histogram(
+    "alarm_sql_fetch_seconds", "Time spent in fetchmany by statement name", ("query",))
+SQL_CONSUME = METRICS.histogram(
+    "alarm_sql_consume_seconds", "Python time spent consuming streamed rows by statement name", ("query",))
+SQL_ROWS = METRICS.counter(
+    "alarm_sql_rows_fetched_total", "Rows fetched by statement name", ("query",))
+SQL_SLOW = METRICS.counter(
+    "alarm_sql_slow_queries_total", "Statements over the slow query threshold by name", ("query",))
+POOL_ACQUIRE_WAIT = METRICS.histogram(
+    "alarm_pool_acquire_wait_seconds", "Time spent waiting for a pooled Oracle connection")
+POOL_SESSIONS = METRICS.gauge(
+    "alarm_pool_sessions", "Oracle pool sessions by state (open/busy)", ("state",))
+
+def record_query_metrics(name, timing, status):
+    SQL_QUERIES.inc(query=name, status=status)
+    SQL_EXECUTE.observe(timing.execute, query=name)
+    SQL_FETCH.observe(timing.fetch, query=name)
+    SQL_CONSUME.observe(timing.consume, query=name)
+    SQL_ROWS.inc(timing.rows, query=name)
+
+@app.middleware("http")
+async def record_request_metrics(request, call_next):
+    HTTP_IN_FLIGHT.inc()
+    t0 = time.perf_counter()
+    status = "500"
+    response = None
     try:
-        # Try multiple paths
-        paths = [
-            r"d:\chengxu\dify\docker\pyfiles\alarmconfig.xml",
-            "alarmconfig.xml"
-        ]
-        
-        config_path = None
-        for p in paths:
-            if os.path.exists(p):
-                config_path = p
-                break
-        
-        if not config_path:
-            print("Warning: alarmconfig.xml not found.")
-            return
+        response = await call_next(request)
+        status = str(response.status_code)
+        return response
+    finally:
+        HTTP_IN_FLIGHT.dec()
+        # 按路由模板聚合，未匹配的路径 (404) 归为一类，避免标签数量无限增长
+        route = request.scope.get("route")
+        endpoint = route.path if route is not None else "unmatched"
+        HTTP_DURATION.observe(time.perf_counter() - t0, endpoint=endpoint)
+        HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=status)
+        length = response.headers.get("content-length") if response is not None else None
+        if length:
+            HTTP_RESPONSE_BYTES.observe(int(length), endpoint=endpoint)
+
+def alarm_config_path():
+    # Try multiple paths
+    paths = [
+        r"d:\chengxu\dify\docker\pyfiles\alarmconfig.xml",
+        "alarmconfig.xml"
+    ]
+    for p in paths:
+        if os.path.exists(p):
+            return p
+    return None
 
-        with open(config_path, 'r', encoding='utf-8', errors='replace') as f:
-            content = f.read()
+def load_alarm_config(strict=False):
+    """
+    解析 alarmconfig.xml，返回 {(报警类型, 子类型): 描述}。
+    strict=False 时出错只打印警告并返回空表；strict=True (热加载) 时抛出异常，保留当前配置。
+    """
+    try:
+        config_path = alarm_config_path()
+        if not config_path:
+            raise FileNotFoundError("alarmconfig.xml not found.")
 
-        # Simple cleaning of encoding attr
-        content = content.replace('encoding="gb2312"', '')
-        
-        root = ET.fromstring(content)
-        
-        for alarm in root.findall("Alarm"):
-            type_hex = alarm.get("type")
-            if not type_hex: continue
-            try:
-                alarm_type = int(type_hex, 16)
-            except:
-                continue
-            
-            # Map subalarms
-            for sub in alarm.findall("SubAlarm"):
-                subtype_str = sub.get("subtype")
-                filename = sub.get("filename", "")
-                
-                if subtype_str and filename:
-                    try:
-                        subtype = int(subtype_str)
-                        # Clean filename: remove extension
-                        desc = os.path.splitext(filename)[0]
-                        ALARM_DESC_MAP[(alarm_type, subtype)] = desc
-                    except:
-                        pass
-            
-            # Map main alarm type default
-            main_subtype_str = alarm.get("subtype")
-            if main_subtype_str:
-                 try:
-                    main_subtype = int(main_subtype_str)
-                    main_name = alarm.get("name")
-                    if main_name:
-                         ALARM_DESC_MAP[(alarm_type, main_subtype)] = main_name
-                 except:
-                     pass
+        # 按文件的实际编码 (UTF-8 / GB2312) 解码后解析
+        return config_snapshot.parse_alarm_config(config_path)
 
     except Exception as e:
+        if strict:
+            raise
         print(f"Error loading alarm config: {e}")
-
-load_alarm_config()
+        return {}
 
 # 数据库配置
 DB_CONFIG = {
@@ -103,6 +220,139 @@ DB_CONFIG = {
     "dsn": "10.2.49.108:1521/orcl"
 }
 
+# 数据源配置
+# - oracle: 现场 Oracle (DB_CONFIG)
+# - sqlite: 本地 SQLite 报警库 (由 `python alarm_source.py <库文件> <csv...>` 从 CSV 导出装载)，
+#   用于离线性能分析、压测与回归测试；报表 SQL 会自动改写为 SQLite 方言
+# 也可通过环境变量 ALARM_DATA_SOURCE / ALARM_SQLITE_PATH 指定，无需修改代码。
+DATA_SOURCE_CONFIG = {
+    "type": os.environ.get("ALARM_DATA_SOURCE", "oracle"),
+    "sqlite_path": os.environ.get(
+        "ALARM_SQLITE_PATH",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "alarm_local.db")
+    )
+}
+
+# 连接池配置 (所有报表接口共用)
+# - ping_interval=0: 每次从池中借出连接前都 ping 一次，自动剔除已断开的会话
+# - wait_timeout: 连接池耗尽时的最长等待时间 (毫秒)
+# - timeout: 空闲会话超过该秒数后由池回收
+POOL_CONFIG = {
+    "min": 2,
+    "max": 8,
+    "increment": 1,
+    "ping_interval": 0,
+    "stmtcachesize": 40,
+    "wait_timeout": 10000,
+    "timeout": 300
+}
+
+# 并发查询配置
+# 同一报表中互不依赖的 SQL 各自从池中借用连接并行执行，报表耗时约等于最慢的一条查询。
+# Thick 模式 (11g 必需) 不支持 python-oracledb 的原生异步 API，因此使用有界线程池。
+# concurrent=False 时按顺序逐条执行 (便于排查问题)。
+QUERY_CONFIG = {
+    "concurrent": True,
+    "max_workers": POOL_CONFIG["max"]
+}
+
+# 取数配置 (所有查询的默认值，run_queries 中的单条查询可用第 4 项 dict 覆盖)
+# 结果按 fetchmany 分批取回，明细查询在取数的同时完成统计，不再整体 fetchall 到内存。
+# - arraysize / prefetchrows: 每次往返取回的行数 / 执行时随首包预取的行数 (Oracle 默认 100 / 2)
+# - max_rows / max_bytes: 单条查询的上限，超过立即中止并返回错误，防止超大日期范围耗尽内存 (None 为不限制)
+FETCH_CONFIG = {
+    "arraysize": 2000,
+    "prefetchrows": 2000,
+    "max_rows": 2000000,
+    "max_bytes": 512 * 1024 * 1024
+}
+
+# 只有几行结果的查询 (概览计数、Top N): 预取行数大于结果行数时随执行一次往返取完
+SMALL_FETCH = {"arraysize": 100, "prefetchrows": 101}
+
+# 慢查询记录配置 (见 slow_query)
+# 单条 SQL 总耗时达到 threshold 秒时写入 path (JSON 行，超过 max_bytes 轮转，保留 backup_count 个旧文件)，
+# 同一语句名每 plan_interval 秒最多抓取一次执行计划。GET /slow_queries 查看最近的记录。
+SLOW_QUERY_CONFIG = {
+    "enabled": True,
+    "threshold": 5.0,
+    "plan_interval": 3600,
+    "path": os.path.join(os.path.dirname(os.path.abspath(__file__)), "slow_queries.log"),
+    "max_bytes": 10 * 1024 * 1024,
+    "backup_count": 5
+}
+
+# 分类下推配置
+# in_sql=True 时第一部分的表2/表3 分类规则 (AlarmClassification) 编译为 SQL CASE 在库内执行，
+# 只返回 (车站, 等级, 分类) 级别的计数；False 时按描述取回明细在 Python 中分类。
+# hazards_top_n_in_sql=True 时第二部分用窗口函数 (ROW_NUMBER) 在库内排名，只取回各分类前 N 名。
+CLASSIFY_CONFIG = {
+    "in_sql": True,
+    "hazards_top_n_in_sql": True
+}
+
+# 列式统计配置
+# 第一部分的分类统计按列进行 (需要 numpy，未安装时自动使用逐行循环)，输出与逐行循环完全一致。
+# Oracle 端在 python-oracledb 支持 DataFrame 取数且安装了 pyarrow 时直接取为 Arrow 列。
+COLUMNAR_CONFIG = {
+    "enabled": True
+}
+
+# 日汇总库配置
+# 已关账的天按维度汇总存入本地 SQLite (与 api_server.py 同目录)，完整天的报表范围直接读本地库，
+# 只有尚未关账的天才查询 Oracle。后台刷新器每 refresh_interval 秒从水位线继续拉取，
+# 并重新拉取水位线前 recheck_days 天以吸收迟到的处理状态更新；首次启动回填 initial_days 天。
+# 多个 worker 进程时同一时间只有一个进程刷新 (库内租约，持有者失联 lease_ttl 秒后由其他进程接手)，
+# 其他进程的定时刷新在半个 refresh_interval 内已有进程刷新过时跳过。
+ROLLUP_CONFIG = {
+    "enabled": True,
+    "path": os.path.join(os.path.dirname(os.path.abspath(__file__)), "alarm_rollup.db"),
+    "recheck_days": 3,
+    "initial_days": 400,
+    "chunk_days": 7,
+    "refresh_interval": 3600,
+    "lease_ttl": 600
+}
+
+# 报表结果缓存配置
+# 按 (接口, 开始日期, 结束日期) 缓存计算结果：内存 LRU 最多 max_entries 条，另可选落地到 SQLite (disk_path=None 关闭)，
+# 重启后仍可命中。结束日期早于今天 (UTC) 的范围数据已不再变化，保存 closed_ttl 秒；包含今天的范围只保存 open_ttl 秒。
+CACHE_CONFIG = {
+    "enabled": True,
+    "max_entries": 256,
+    "closed_ttl": 7 * 86400,
+    "open_ttl": 300,
+    "disk_path": os.path.join(os.path.dirname(os.path.abspath(__file__)), "report_cache.db")
+}
+
+# 报表预计算配置 (见 report_scheduler)
+# 标准周期一结束就计算并缓存报表 (full 同时写入四个部分的缓存)，早上的调用直接命中缓存；需启用报表结果缓存。
+# cron 默认按 UTC 解释 (utc=True)，与缓存判断 "已关账" 的口径一致，周期结束时算出的结果按 closed_ttl 长期保存。
+# catch_up=True 时启动后先为每个任务补算一次最近的周期 (已在磁盘缓存中的直接命中)，避免错过触发时刻时早上缓存为空。
+# 所有任务共用 concurrency 个并发名额；失败后从 backoff 秒起指数退避重试，最多 max_attempts 次。
+# 报表缓存落地到磁盘时多个 worker 进程共用同一缓存，各进程的调度器通过缓存库中的租约 (lease_ttl 秒过期)
+# 保证同一周期只由一个进程计算；只有内存缓存时各进程各自计算。
+PRECOMPUTE_CONFIG = {
+    "enabled": os.environ.get("ALARM_PRECOMPUTE", "1") == "1",
+    "utc": True,
+    "catch_up": True,
+    "concurrency": 1,
+    "max_attempts": 4,
+    "backoff": 60,
+    "backoff_max": 1800,
+    "lease_ttl": 7200,
+    "jobs": [
+        {"name": "weekly", "cron": "5 0 * * 1", "period": "previous_week", "endpoints": ["full"]},
+        {"name": "monthly", "cron": "5 0 1 * *", "period": "previous_month", "endpoints": ["full"]}
+    ]
+}
+
+# 报警描述分析缓存 (见 alarm_desc)
+# 每个不同的 alarmdes 只做一次去空白 / 通用名拆分 / 关键词匹配，最多缓存 max_entries 个描述。
+DESCRIPTION_CONFIG = {
+    "max_entries": 65536
+}
+
 # 设备类型映射 (基于 gen_report.py 的补充)
 DEVICE_TYPE_MAP = {
     1: "道岔",
@@ -195,102 +445,909 @@ DEVICE_TYPE_MAP = {
     0xfe: "车站设备"
 }
 
-# 报警分类映射表 (Type based)
-# "道岔无表示报警" (0x96=150) -> switch_no_rep
-# "电气特性超限报警" (0x71=113) -> elec_char
-# "电气特性智能分析" (0x36=54) -> elec_char
-# "道岔动作智能分析" (0x90=144) -> other
-# "安全监督" (0xCF=207) -> safety (安全监督)
-ALARM_TYPE_MAP = {
-    150: 'switch_no_rep', 
-    113: 'elec_char', 
-    54: 'elec_char', 
-    144: 'other',
-    207: 'safety'
+# 第一部分表2/表3 的报警类型分类，读自 alarm_type_config.json 的 report_classification (随基础配置热加载):
+#   table2_types        报警类型 -> 表2 分类: 道岔无表示 150 -> switch_no_rep，电气特性超限 113 / 智能分析 54 -> elec_char，
+#                       道岔动作智能分析 144 -> other，安全监督 207 -> safety
+#   table2_other_types  其余监测系统自诊断报警 (163 故障通知、132 破封、135 灯丝、136 熔丝、124 采集机)，归为表2 other；
+#                       外电网相关 (67, 139, 140, 133) 属于自身逻辑判断 (含子报警)，同样归为表2
+#   table3_types        表3 外部接口分类 -> 报警类型，按顺序匹配 (电源屏 210 / UPS 237 -> power，ZPW2000 50，
+#                       列控 201 / CTC 209 -> atp，联锁 200，道岔缺口 138 -> dcqk，室外监测 219 -> track_monitor)
+ALARM_TYPE_CONFIG = {
+    "path": "alarm_type_config.json"
+}
+
+AlarmClassification = collections.namedtuple("AlarmClassification", ("table2_types", "table2_other_types", "table3_types"))
+
+def parse_alarm_classification(alarm_types):
+    """alarm_type_config.json 的内容 -> AlarmClassification"""
+    section = alarm_types["report_classification"]
+    return AlarmClassification(
+        {int(k): v for k, v in section["table2_types"].items()},
+        frozenset(int(t) for t in section["table2_other_types"]),
+        {cat: frozenset(int(t) for t in types) for cat, types in section["table3_types"].items()}
+    )
+
+def load_alarm_classification(strict=False, alarm_types=None):
+    """
+    读取报警类型分类 (alarm_types 为快照中已解析的 alarm_type_config.json，缺省时读文件)。
+    strict=False 时出错只打印警告并返回空分类 (全部归入表3 的兜底分类)；strict=True (热加载) 时抛出异常，保留当前配置。
+    """
+    try:
+        if alarm_types is None:
+            alarm_types = config_snapshot.parse_alarm_types(ALARM_TYPE_CONFIG["path"])
+        return parse_alarm_classification(alarm_types)
+    except Exception as e:
+        if strict:
+            raise
+        print(f"Warning: alarm classification load failed: {e}")
+        return AlarmClassification({}, frozenset(), {})
+
+# 加载基础数据映射
+# 车站维度 (电报码 -> 车站 -> 车间 -> 电务段，见 station_dim)，优先读取 station_map.json，缺失时解析 Stations.xml
+STATION_CONFIG = {
+    "json_path": "station_map.json",
+    "xml_path": "Stations.xml"
 }
 
-# 监测系统自诊断报警 (无子报警)
-# 包含: 163(故障通知), 132(破封), 135(灯丝), 136(熔丝), 124(采集机)
-# 外电网相关(67, 139, 140, 133) 因属于自身逻辑判断(含SubAlarm), 归为表2
-SELF_DIAG_ALARM_TYPES = {
-    163, 132, 135, 136, 124, 67, 139, 140, 133
+# 基础配置快照 (python config_snapshot.py 生成)
+# 快照存在且与源文件一致时直接加载 (毫秒级)；缺失、版本不符或源文件更新过时回退为逐个解析源文件。
+SNAPSHOT_CONFIG = {
+    "path": "config_snapshot.pkl"
 }
 
-# 表3 外部接口报警类型映射
-TABLE3_ALARM_MAP = {
-    # Power: 210(电源屏), 237(UPS) -- 移除了 67, 139, 140, 133 (外电网)
-    "power": {210, 237},
-    # ZPW2000: 50(ZPW)
-    "zpw2000": {50},
-    # ATP: 201(列控), 209(CTC)
-    "atp": {201, 209},
-    # Interlock: 200(联锁)
-    "interlock": {200},
-    "dcqk": {138}, # 138(道岔缺口)
-    # Track Monitor: 219(室外监测)
-    "track_monitor": {219}
+# 基础配置热加载
+# 车站表、alarmconfig.xml、设备类型文件或快照变化后在后台重新构建整套配置，再一次性替换 BASE_CONFIG (不原地修改)；
+# 各报表在计算开始时读取一次 BASE_CONFIG 并向下传递，同一个结果只使用一个版本的配置，
+# 之后只使依赖了变化维度的报表缓存失效 (见 REPORT_CONFIG_DEPENDENCIES)。
+# watch=True 时后台线程每 interval 秒检查一次源文件；也可调用 POST /config/reload 立即重新加载。
+CONFIG_RELOAD_CONFIG = {
+    "watch": True,
+    "interval": 30
 }
 
-# 加载基础数据映射
-try:
-    with open('station_map.json', 'r', encoding='utf-8') as f:
-        STATION_MAP = json.load(f)
-except Exception as e:
-    print(f"Warning: station_map.json load failed: {e}")
-    STATION_MAP = {}
+# 代码中的设备类型名称 (优先于快照中的 device_type_map.json)
+_BUILTIN_DEVICE_TYPES = dict(DEVICE_TYPE_MAP)
+
+# 一个版本的基础配置；stamps 为读取前各源文件的 (修改时间, 大小)，监视线程据此判断是否需要重新加载
+BaseConfig = collections.namedtuple(
+    "BaseConfig", ("alarm_desc_map", "device_types", "stations", "classification", "source", "stamps")
+)
+
+def config_file_stamps(paths):
+    """各文件的 (修改时间, 大小)，不存在为 None"""
+    stamps = {}
+    for path in paths:
+        try:
+            st = os.stat(path)
+            stamps[path] = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            stamps[path] = None
+    return stamps
+
+def read_base_config(strict=False):
+    """
+    读取一个版本的基础配置 (优先使用快照)，不修改全局变量。
+    strict=True 时任一源文件解析失败即抛出异常，避免热加载时把配置替换为残缺的版本。
+    """
+    watch_paths = [SNAPSHOT_CONFIG["path"], STATION_CONFIG["json_path"], STATION_CONFIG["xml_path"], ALARM_TYPE_CONFIG["path"]]
+    if alarm_config_path():
+        watch_paths.append(alarm_config_path())
+    # 先记录再读取: 读取期间被修改的文件会在下一轮被发现
+    stamps = config_file_stamps(watch_paths)
+    try:
+        snapshot = config_snapshot.load(SNAPSHOT_CONFIG["path"])
+    except Exception as e:
+        print(f"Warning: config snapshot ignored: {e}")
+        snapshot = None
+    # station_map.json 等不一定是快照的源文件: 任一监视的源文件比快照新时不再使用快照，
+    # 否则热加载会因其修改而换版本、清缓存，实际仍返回快照中的旧内容
+    snapshot_stamp = stamps[SNAPSHOT_CONFIG["path"]]
+    if snapshot is not None and snapshot_stamp:
+        newer = [p for p in watch_paths[1:] if stamps[p] and stamps[p][0] > snapshot_stamp[0]]
+        if newer:
+            print(f"Warning: config snapshot ignored: older than {', '.join(newer)}")
+            snapshot = None
+
+    if snapshot is not None:
+        snapshot_dir = os.path.dirname(os.path.abspath(SNAPSHOT_CONFIG["path"]))
+        stamps.update(config_file_stamps(os.path.join(snapshot_dir, p) for p in snapshot["sources"]))
+        return BaseConfig(
+            snapshot["alarm_desc_map"],
+            # 代码中的设备类型名称优先，快照只补充未定义的类型
+            {**snapshot["device_types"], **_BUILTIN_DEVICE_TYPES},
+            station_dim.StationDimension(snapshot["stations"]),
+            # 快照编译时未找到 alarm_type_config.json 则为空字典，此时仍读文件
+            load_alarm_classification(strict, snapshot["alarm_types"] or None),
+            f"snapshot {SNAPSHOT_CONFIG['path']} (created {snapshot['created']})",
+            stamps
+        )
+
+    try:
+        stations = station_dim.load(STATION_CONFIG["json_path"], STATION_CONFIG["xml_path"])
+    except Exception as e:
+        if strict:
+            raise
+        print(f"Warning: station map load failed: {e}")
+        stations = station_dim.StationDimension([])
+    return BaseConfig(
+        load_alarm_config(strict), dict(_BUILTIN_DEVICE_TYPES), stations, load_alarm_classification(strict),
+        "source files", stamps
+    )
+
+def config_changes(old, new):
+    """两个版本之间发生变化的维度"""
+    changed = set()
+    if old.alarm_desc_map != new.alarm_desc_map:
+        changed.add("alarm_descriptions")
+    if old.device_types != new.device_types:
+        changed.add("device_types")
+    if old.classification != new.classification:
+        changed.add("alarm_classification")
+    old_st, new_st = old.stations.records(), new.stations.records()
+    if old_st != new_st:
+        codes = old_st.keys() | new_st.keys()
+        if any((old_st.get(c) or (None,))[0] != (new_st.get(c) or (None,))[0] for c in codes):
+            changed.add("station_names")
+        if any((old_st.get(c) or (None,))[1:] != (new_st.get(c) or (None,))[1:] for c in codes):
+            changed.add("station_hierarchy")
+    return changed
+
+BASE_CONFIG = None
+# 每次替换配置加 1；计算期间版本变化的报表结果不写入缓存
+CONFIG_VERSION = 0
+CONFIG_STATUS = {"version": 0, "source": None, "loaded_at": None, "last_changes": [], "last_error": None}
+_config_lock = threading.Lock()
+
+def apply_base_config(config):
+    """整体替换当前基础配置 (只重新绑定 BASE_CONFIG 一个全局变量)"""
+    global BASE_CONFIG, CONFIG_VERSION
+    BASE_CONFIG = config
+    CONFIG_VERSION += 1
+    CONFIG_STATUS.update(
+        version=CONFIG_VERSION,
+        source=config.source,
+        loaded_at=datetime.datetime.now().isoformat(timespec="seconds")
+    )
+
+def load_base_config():
+    """启动时加载报警描述映射、设备类型与车站维度"""
+    config = read_base_config()
+    apply_base_config(config)
+    if config.source != "source files":
+        print(f"Loaded config {config.source}")
+
+load_base_config()
 
 class ReportRequest(BaseModel):
     start_date: str
     end_date: str
 
+DB_POOL = None
+_pool_lock = threading.Lock()
+# 借用连接的等待时间统计 (毫秒)
+POOL_WAIT_STATS = {"acquires": 0, "total_wait_ms": 0.0, "max_wait_ms": 0.0}
+
+def create_db_pool():
+    global DB_POOL
+    with _pool_lock:
+        if DB_POOL is None:
+            init_oracle_client()
+            DB_POOL = oracledb.create_pool(
+                **DB_CONFIG,
+                getmode=oracledb.POOL_GETMODE_TIMEDWAIT,
+                **POOL_CONFIG
+            )
+            print(f"Oracle session pool created (min={POOL_CONFIG['min']}, max={POOL_CONFIG['max']})")
+    return DB_POOL
+
+def close_db_pool():
+    global DB_POOL
+    with _pool_lock:
+        pool, DB_POOL = DB_POOL, None
+    if pool is None:
+        return
+    try:
+        pool.close()
+    except Exception as e:
+        # 仍有会话未归还时强制关闭
+        print(f"Warning: Pool still busy on shutdown, forcing close: {e}")
+        pool.close(force=True)
+
 def get_db_connection():
-    return oracledb.connect(**DB_CONFIG)
+    """从连接池借用一个连接，调用方 close() 即归还到池中"""
+    pool = DB_POOL or create_db_pool()
+    t0 = time.perf_counter()
+    conn = pool.acquire()
+    waited_ms = (time.perf_counter() - t0) * 1000
+    POOL_ACQUIRE_WAIT.observe(waited_ms / 1000)
+    with _pool_lock:
+        POOL_WAIT_STATS["acquires"] += 1
+        POOL_WAIT_STATS["total_wait_ms"] += waited_ms
+        POOL_WAIT_STATS["max_wait_ms"] = max(POOL_WAIT_STATS["max_wait_ms"], waited_ms)
+    return conn
+
+DATA_SOURCE = None
+_source_lock = threading.Lock()
+
+def get_data_source():
+    global DATA_SOURCE
+    with _source_lock:
+        if DATA_SOURCE is None:
+            kind = DATA_SOURCE_CONFIG["type"]
+            if kind == "oracle":
+                DATA_SOURCE = alarm_source.OracleSource(get_db_connection)
+            elif kind == "sqlite":
+                DATA_SOURCE = alarm_source.SQLiteSource(DATA_SOURCE_CONFIG["sqlite_path"])
+                print(f"Using local alarm database {DATA_SOURCE_CONFIG['sqlite_path']}")
+            else:
+                raise ValueError(f"Unknown data source type: {kind}")
+    return DATA_SOURCE
+
+QUERY_EXECUTOR = None
+_executor_lock = threading.Lock()
+
+def get_query_executor():
+    global QUERY_EXECUTOR
+    with _executor_lock:
+        if QUERY_EXECUTOR is None:
+            QUERY_EXECUTOR = ThreadPoolExecutor(
+                max_workers=QUERY_CONFIG["max_workers"],
+                thread_name_prefix="oracle-query"
+            )
+    return QUERY_EXECUTOR
+
+def shutdown_query_executor():
+    global QUERY_EXECUTOR
+    with _executor_lock:
+        executor, QUERY_EXECUTOR = QUERY_EXECUTOR, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+def run_query(sql, binds, fetch="all", options=None, name="unnamed"):
+    """
+    在当前数据源上执行单条 SQL (Oracle 时借用一个池连接)。
+    fetch: "all" 返回全部行，"one" 返回首行，"columns" 返回按列排列的结果 (每列一个序列)，
+    或可调用对象 consume(rows): 在取数的同时消费行迭代器，返回 consume 的结果。
+    options 覆盖 FETCH_CONFIG 中的取数参数；name 为语句的固定名称，用于 alarm_sql_* 指标。
+    """
+    source = get_data_source()
+    timing = alarm_source.QueryTiming()
+    status = "error"
+    # ?profile=1 时在查询线程中同样启用 cProfile
+    profiler = request_timing.PROFILER.get()
+    try:
+        with request_timing.query_scope(timing), (profiler.profile() if profiler else contextlib.nullcontext()):
+            result = source.execute(sql, binds, fetch, {**FETCH_CONFIG, **(options or {})}, timing)
+        status = "ok"
+        return result
+    finally:
+        record_query_metrics(name, timing, status)
+        request_timing.record_query(timing)
+        slow_log = SLOW_QUERIES
+        if slow_log is not None and slow_log.observe(
+                name, sql, binds, timing, status, getattr(source, "explain", None), REQUEST_ID.get()):
+            SQL_SLOW.inc(query=name)
+
+async def run_queries(*queries, return_exceptions=False):
+    """
+    执行多条互不依赖的查询，每条为 (name, sql, binds)、(name, sql, binds, fetch) 或 (name, sql, binds, fetch, options)，
+    name 为语句的固定名称 (见 run_query)。
+    结果顺序与入参一致；return_exceptions=True 时失败的查询在对应位置返回异常对象。
+    """
+    loop = asyncio.get_running_loop()
+    executor = get_query_executor()
+    # 在线程池中执行时带上当前上下文 (请求 ID 等)，每条查询一份副本
+    calls = [functools.partial(contextvars.copy_context().run, run_query, *q[1:], name=q[0]) for q in queries]
+
+    if QUERY_CONFIG["concurrent"]:
+        tasks = [loop.run_in_executor(executor, call) for call in calls]
+        return await asyncio.gather(*tasks, return_exceptions=return_exceptions)
+
+    results = []
+    for call in calls:
+        try:
+            results.append(await loop.run_in_executor(executor, call))
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            results.append(e)
+    return results
 
-def get_table2_category(alarmtype):
+def get_table2_category(classification, alarmtype):
     """根据 alarmtype 判断是否属于表2 (监测自诊断) 及其分类"""
     # 1. Check mapped types
-    if alarmtype in ALARM_TYPE_MAP:
-        return ALARM_TYPE_MAP[alarmtype]
+    if alarmtype in classification.table2_types:
+        return classification.table2_types[alarmtype]
         
     # 2. Check general self-diag types
-    if alarmtype in SELF_DIAG_ALARM_TYPES:
+    if alarmtype in classification.table2_other_types:
         return "other"
         
     return None
 
-def get_table3_category(alarmtype):
+def get_table3_category(classification, alarmtype):
     """根据 alarmtype 判断是否属于表3 (外部接口) 及其分类"""
-    for cat, types in TABLE3_ALARM_MAP.items():
+    for cat, types in classification.table3_types.items():
         if alarmtype in types:
             return cat
     return None
 
-def save_debug_json(data: Dict[str, Any], filename_part: str):
+def _sql_in(column, values):
+    return f"{column} IN ({', '.join(str(int(v)) for v in sorted(values))})"
+
+def compile_category_case(classification, type_col="alarmtype", dtype_col="devicetype", des_col="alarmdes"):
+    """
+    把表2/表3 的分类规则编译为 SQL CASE 表达式，取值为 't2:<分类>' 或 't3:<分类>'。
+    分支顺序与 aggregate_alarm_rows 的判定顺序一致:
+    table2_types -> table2_other_types -> table3_types -> 设备类型 51 / "缺口" -> 设备类型 65
+    -> "监测" (表2 other) -> 表3 other
+    """
+    branches = []
+    t2_types = collections.defaultdict(set)
+    for atype, cat in classification.table2_types.items():
+        t2_types[cat if cat in ("elec_char", "switch_no_rep", "safety") else "other"].add(atype)
+    for cat, types in t2_types.items():
+        branches.append((_sql_in(type_col, types), f"t2:{cat}"))
+    if classification.table2_other_types:
+        branches.append((_sql_in(type_col, classification.table2_other_types), "t2:other"))
+    for cat, types in classification.table3_types.items():
+        if types:
+            branches.append((_sql_in(type_col, types), f"t3:{cat}"))
+    branches.append((f"{dtype_col} = 51 OR instr({des_col}, '缺口') > 0", "t3:gap"))
+    branches.append((f"{dtype_col} = 65", "t3:track_monitor"))
+    branches.append((f"instr({des_col}, '监测') > 0", "t2:other"))
+
+    whens = "\n".join(f"                WHEN {cond} THEN '{bucket}'" for cond, bucket in branches)
+    return f"""CASE
+{whens}
+                ELSE 't3:other'
+            END"""
+
+@app.get("/pool/stats")
+def pool_stats():
+    """连接池状态：已打开/借出的会话数及借用等待时间"""
+    pool = DB_POOL
+    if pool is None:
+        return {"status": "not_initialized"}
+    with _pool_lock:
+        wait = dict(POOL_WAIT_STATS)
+    acquires = wait["acquires"]
+    return {
+        "status": "open",
+        "open": pool.opened,
+        "busy": pool.busy,
+        "min": pool.min,
+        "max": pool.max,
+        "increment": pool.increment,
+        "stmtcachesize": pool.stmtcachesize,
+        "acquires": acquires,
+        "avg_wait_ms": round(wait["total_wait_ms"] / acquires, 3) if acquires else 0.0,
+        "max_wait_ms": round(wait["max_wait_ms"], 3)
+    }
+
+ROLLUP_STORE = None
+_rollup_stop = threading.Event()
+_rollup_thread = None
+
+def refresh_rollup(min_age=None):
+    """执行一次增量刷新，返回刷新的天数；由其他进程刷新 (见 AlarmRollupStore.refresh) 时返回 None"""
+    days = ROLLUP_STORE.refresh(run_query, min_age)
+    if days is not None:
+        print(f"Alarm rollup refreshed ({days} days)")
+    return days
+
+def start_rollup_refresher():
+    global ROLLUP_STORE, _rollup_thread
+    if not ROLLUP_CONFIG["enabled"]:
+        return
     try:
-        # 确保保存到脚本所在目录
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        output_filename = os.path.join(script_dir, f"api_output_{filename_part}.json")
-        
-        with open(output_filename, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
-        print(f"API output saved to {output_filename}")
-    except Exception as io_err:
-        print(f"Error saving API output to file: {io_err}")
+        ROLLUP_STORE = rollup_store.AlarmRollupStore(
+            ROLLUP_CONFIG["path"],
+            recheck_days=ROLLUP_CONFIG["recheck_days"],
+            initial_days=ROLLUP_CONFIG["initial_days"],
+            chunk_days=ROLLUP_CONFIG["chunk_days"],
+            lease_ttl=ROLLUP_CONFIG["lease_ttl"]
+        )
+    except Exception as e:
+        print(f"Warning: Failed to open alarm rollup store: {e}")
+        return
 
-@app.post("/get_alarm_stats")
-def get_stats(req: ReportRequest):
-    conn = None
+    def refresh_loop():
+        while not _rollup_stop.is_set():
+            try:
+                refresh_rollup(min_age=ROLLUP_CONFIG["refresh_interval"] / 2)
+            except Exception as e:
+                print(f"Warning: Alarm rollup refresh failed: {e}")
+            _rollup_stop.wait(ROLLUP_CONFIG["refresh_interval"])
+
+    _rollup_stop.clear()
+    _rollup_thread = threading.Thread(target=refresh_loop, name="rollup-refresher", daemon=True)
+    _rollup_thread.start()
+
+def stop_rollup_refresher():
+    _rollup_stop.set()
+    if _rollup_thread is not None:
+        _rollup_thread.join(timeout=5)
+
+async def rollup_plan(start_ts, end_ts):
+    """日汇总库对 [start_ts, end_ts) 的拆分方案，不可用时返回 None"""
+    store = ROLLUP_STORE
+    if store is None:
+        return None
+    return await run_in_threadpool(store.plan, start_ts, end_ts)
+
+async def rollup_read(plan, local_read, name, oracle_sql, project):
+    """
+    按拆分方案读取：已关账的天调用 local_read(start_day, end_day) 读本地库，
+    未关账的天在 Oracle 上执行 oracle_sql (语句名 name) 并用 project 转成同样的行格式，两部分并发执行后拼接。
+    """
+    (start_day, end_day), open_range = plan
+    tasks = [run_in_threadpool(local_read, start_day, end_day)]
+    if open_range:
+        tasks.append(run_queries((name, oracle_sql, list(open_range))))
+    results = await asyncio.gather(*tasks)
+    rows = list(results[0])
+    if open_range:
+        rows += project(results[1][0])
+    return rows
+
+async def rollup_facts(plan, dims, by_day=False):
+    """按 dims 汇总的事实行 (*dims, cnt)；by_day=True 时为 (day, *dims, cnt)"""
+    return await rollup_read(
+        plan,
+        functools.partial(ROLLUP_STORE.facts, dims=dims, by_day=by_day),
+        "rollup.facts",
+        rollup_store.FACT_SQL,
+        functools.partial(rollup_store.project_facts, dims=dims, by_day=by_day)
+    )
+
+def collation_key(value):
+    """
+    与库内 NLSSORT(col, 'NLS_SORT=BINARY') 一致的排序键: 字符串按数据库字符集 (GBK) 的字节比较，
+    其余类型原样；元组逐列处理，None 排在最前 (对应 NULLS FIRST)
+    """
+    if isinstance(value, tuple):
+        return tuple((v is not None, collation_key(v)) for v in value)
+    if isinstance(value, str):
+        return alarm_source.sort_bytes(value)
+    return value
+
+def count_rank(key, cnt):
+    """
+    排名的排序键: 计数倒序，计数相同时按 key 逐列升序 (见 collation_key)，
+    与库内 ORDER BY cnt DESC, NLSSORT(<key 各列>, 'NLS_SORT=BINARY') NULLS FIRST 的次序一致
+    """
+    return (-cnt, collation_key(tuple(key)))
+
+def rank_rows(rows):
+    """(*key, cnt) 行按 count_rank 排序"""
+    return sorted(rows, key=lambda r: count_rank(r[:-1], r[-1]))
+
+@request_timing.timed("aggregate")
+def top_counts(rows, n):
+    """合并 (*key, cnt) 行中相同 key 的计数，返回按 count_rank 排序的前 n 行"""
+    merged = collections.defaultdict(int)
+    for *key, cnt in rows:
+        merged[tuple(key)] += cnt
+    ranked = sorted(merged.items(), key=lambda x: count_rank(*x))
+    if n is not None:
+        ranked = ranked[:n]
+    return [(*key, cnt) for key, cnt in ranked]
+
+@app.get("/rollup/status")
+def rollup_status():
+    """日汇总库状态：覆盖的日期范围、水位线、最近一次刷新"""
+    if ROLLUP_STORE is None:
+        return {"status": "disabled"}
+    return ROLLUP_STORE.status()
+
+@app.post("/rollup/refresh")
+def rollup_refresh():
+    """立即执行一次增量刷新"""
+    if ROLLUP_STORE is None:
+        raise HTTPException(status_code=400, detail="Alarm rollup store is disabled")
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
+        days = refresh_rollup()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if days is None:
+        raise HTTPException(status_code=409, detail="Alarm rollup is being refreshed by another process")
+    return {"refreshed_days": days, **ROLLUP_STORE.status()}
+
+# 调试输出配置 (见 debug_writer)
+# 默认关闭 (ALARM_DEBUG_OUTPUT=1 开启)。开启后报表结果交给后台线程写入 directory，
+# 每次一个带时间戳和请求 ID 的文件 (compress=True 时 gzip 压缩)，文件数超过 max_files 或总大小超过 max_bytes 时删除最旧的文件。
+# 写入队列最多积压 queue_size 份结果，已满时丢弃，不阻塞响应。
+DEBUG_OUTPUT_CONFIG = {
+    "enabled": os.environ.get("ALARM_DEBUG_OUTPUT", "0") == "1",
+    "directory": os.path.join(os.path.dirname(os.path.abspath(__file__)), "api_output"),
+    "max_files": 200,
+    "max_bytes": 50 * 1024 * 1024,
+    "queue_size": 64,
+    "compress": True
+}
+
+DEBUG_WRITER = None
+
+# 当前请求的 ID (请求头 X-Request-ID，缺省时生成)，调试输出文件名中带上它以便与访问日志对应
+REQUEST_ID = contextvars.ContextVar("request_id", default=None)
+
+@app.middleware("http")
+async def assign_request_id(request, call_next):
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex[:16]
+    token = REQUEST_ID.set(request_id)
+    try:
+        response = await call_next(request)
+    finally:
+        REQUEST_ID.reset(token)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+@app.middleware("http")
+async def add_server_timing(request, call_next):
+    """响应头 Server-Timing: connect / execute / fetch / aggregate / serialize 各阶段及命名 span 的耗时"""
+    timings = request_timing.RequestTimings()
+    token = request_timing.CURRENT.set(timings)
+    try:
+        response = await call_next(request)
+    finally:
+        request_timing.CURRENT.reset(token)
+    response.headers["Server-Timing"] = timings.header()
+    return response
+
+def init_debug_writer():
+    global DEBUG_WRITER
+    if not DEBUG_OUTPUT_CONFIG["enabled"]:
+        return
+    try:
+        DEBUG_WRITER = debug_writer.DebugWriter(
+            DEBUG_OUTPUT_CONFIG["directory"],
+            max_files=DEBUG_OUTPUT_CONFIG["max_files"],
+            max_bytes=DEBUG_OUTPUT_CONFIG["max_bytes"],
+            queue_size=DEBUG_OUTPUT_CONFIG["queue_size"],
+            compress=DEBUG_OUTPUT_CONFIG["compress"]
+        )
+    except Exception as e:
+        print(f"Warning: Failed to start debug output writer: {e}")
+
+def close_debug_writer():
+    global DEBUG_WRITER
+    writer, DEBUG_WRITER = DEBUG_WRITER, None
+    if writer is not None:
+        writer.close()
+
+def save_debug_json(data: Dict[str, Any], filename_part: str):
+    """调试输出: 未开启时直接返回；开启时只放入后台写入队列，序列化和写文件不占用请求时间"""
+    writer = DEBUG_WRITER
+    if writer is not None:
+        writer.submit(data, f"api_output_{filename_part}", REQUEST_ID.get())
+
+DESCRIPTIONS = alarm_desc.DescriptionAnalyzer(DESCRIPTION_CONFIG["max_entries"])
+
+def alarm_des_flags(des):
+    """报警描述中的关键词标记 (外电网 / 缺口 / 监测)，与日汇总库 des_flags 的口径一致"""
+    return DESCRIPTIONS.flags(des)
+
+def columnar_enabled():
+    return COLUMNAR_CONFIG["enabled"] and alarm_columnar.available()
+
+def station_section(stations, telename):
+    """车站 (可带补齐空格) -> (电务段, 车间)；未知电务段返回 (None, None)"""
+    section, workshop = stations.section_workshop(telename)
+    if section is None or section == station_dim.UNKNOWN_SECTION:
+        return None, None
+    return section, workshop
+
+@request_timing.timed("part1.classify")
+def aggregate_alarm_columns(config, columns, des_is_text):
+    """列式统计 (见 alarm_columnar)，columns 为 (telename, alarmlevel, devicetype, alarmtype, des, cnt) 六列"""
+    return alarm_columnar.aggregate(
+        columns, config.stations,
+        functools.partial(get_table2_category, config.classification),
+        functools.partial(get_table3_category, config.classification), alarm_des_flags,
+        (rollup_store.DES_FLAG_EXT_POWER, rollup_store.DES_FLAG_GAP, rollup_store.DES_FLAG_MONITOR),
+        des_is_text
+    )
+
+def build_alarm_stats(req: ReportRequest, config, rows, top_rows):
+    """根据聚合结果生成第一部分 (报警总体情况) 的四张统计表"""
+    flag_rows = (
+        (telename, level, dtype, atype, alarm_des_flags(des), cnt)
+        for telename, level, dtype, des, atype, cnt in rows
+    )
+    return build_alarm_tables(req, config, flag_rows, top_rows)
+
+def aggregate_alarm_detail_rows(config, rows):
+    """逐行统计 sql_raw 明细 (telename, alarmlevel, devicetype, alarmdes, alarmtype, cnt)，可直接消费流式取数的行迭代器"""
+    flag_rows = (
+        (telename, level, dtype, atype, alarm_des_flags(des), cnt)
+        for telename, level, dtype, des, atype, cnt in rows
+    )
+    return aggregate_alarm_rows(config, flag_rows)
+
+@request_timing.timed("aggregate")
+def build_alarm_stats_from_columns(req: ReportRequest, config, columns, top_rows):
+    """同 build_alarm_stats，输入为按列取回的 sql_raw 结果 (telename, alarmlevel, devicetype, alarmdes, alarmtype, cnt)"""
+    if not columns:
+        columns = [()] * 6
+    telename, level, dtype, des, atype, cnt = columns
+    tables = aggregate_alarm_columns(config, (telename, level, dtype, atype, des, cnt), des_is_text=True)
+    return format_alarm_tables(req, tables, top_rows)
+
+@request_timing.timed("aggregate")
+def build_alarm_tables(req: ReportRequest, config, flag_rows, top_rows):
+    """
+    第一部分统计主体。flag_rows 每行为 (telename, alarmlevel, devicetype, alarmtype, des_flags, cnt)，
+    alarmdes 只以关键词标记参与分类，因此既可来自 Oracle 明细也可来自日汇总库。
+    """
+    if columnar_enabled():
+        columns = list(zip(*flag_rows)) or [()] * 6
+        tables = aggregate_alarm_columns(config, columns, des_is_text=False)
+    else:
+        tables = aggregate_alarm_rows(config, flag_rows)
+    return format_alarm_tables(req, tables, top_rows)
+
+@request_timing.timed("part1.classify")
+def aggregate_alarm_rows(config, flag_rows):
+    """逐行统计，返回 (total_alarms, table1_stats, table2_stats, table3_stats, workshop_stats)"""
+    # ================= 数据初始化 =================
+    # 表1：各站段报警统计表
+    table1_stats = collections.defaultdict(lambda: {
+        "total": 0, "level1": 0, "level2": 0, "level3": 0, "total_no_ext": 0
+    })
+
+    # 表2：监测系统自诊断报警
+    table2_stats = collections.defaultdict(lambda: collections.defaultdict(int))
+
+    # 表3：外部接口系统报警
+    table3_stats = collections.defaultdict(lambda: collections.defaultdict(int))
+
+    # 表4：重点车间排名 (按段分组)
+    workshop_stats = collections.defaultdict(lambda: collections.defaultdict(int))
+
+    # 全局统计
+    total_alarms = 0
+    stations, classification = config.stations, config.classification
+
+    # ================= 数据处理循环 =================
+    for telename, level, dtype, atype, des_flags, cnt in flag_rows:
+        total_alarms += cnt
+
+        # --- 获取基础信息 ---
+        section, workshop = station_section(stations, telename)
+
+        # 过滤未知数据，保证表格整洁
+        if section is None: continue
+
+        # --- 逻辑判定 ---
+        # 1. 外电网判定 (简单的关键词匹配)
+        is_external_power = des_flags & rollup_store.DES_FLAG_EXT_POWER
+
+        # 2. 设备类型归类
+        # dtype_name = DEVICE_TYPE_MAP.get(dtype, "其他")
+
+        # --- 填充表1 (站段统计) ---
+        s_stat = table1_stats[section]
+        s_stat["total"] += cnt
+        if level == 1: s_stat["level1"] += cnt
+        elif level == 2: s_stat["level2"] += cnt
+        elif level == 3: s_stat["level3"] += cnt
+        if not is_external_power:
+            s_stat["total_no_ext"] += cnt
+
+        # --- 填充表2 (监测自诊断) ---
+        t2_cat = get_table2_category(classification, atype)
+
+        if t2_cat:
+            t2_row = table2_stats[section]
+            t2_row["total"] += cnt
+            # 分类统计
+            if t2_cat == "elec_char": t2_row["elec_char"] += cnt
+            elif t2_cat == "switch_no_rep": t2_row["switch_no_rep"] += cnt
+            elif t2_cat == "safety": t2_row["safety"] += cnt
+            else: t2_row["other"] += cnt
+
+        # --- 余下逻辑 (表3 或 监测兜底) ---
+        else:
+            t3_cat = get_table3_category(classification, atype)
+
+            # Gap / Track Monitor special check
+            if not t3_cat:
+                if dtype == 51 or des_flags & rollup_store.DES_FLAG_GAP:
+                    t3_cat = "gap"
+                elif dtype == 65:
+                    t3_cat = "track_monitor"
+
+            if t3_cat:
+                t3_row = table3_stats[section]
+                t3_row["total"] += cnt
+                t3_row[t3_cat] += cnt
+
+            # 监测相关报警归为表2 other (兜底)
+            elif des_flags & rollup_store.DES_FLAG_MONITOR:
+                 t2_row = table2_stats[section]
+                 t2_row["total"] += cnt
+                 t2_row["other"] += cnt
+
+            # 其余归为表3 other
+            else:
+                t3_row = table3_stats[section]
+                t3_row["total"] += cnt
+                t3_row["other"] += cnt
+
+        # --- 填充表4 (车间统计) ---
+        workshop_stats[section][workshop] += cnt
+
+    return total_alarms, table1_stats, table2_stats, table3_stats, workshop_stats
+
+@request_timing.timed("part1.classify")
+def aggregate_category_rows(stations, rows):
+    """
+    库内分类后的统计。rows 每行为 (telename, alarmlevel, is_ext, bucket, cnt)，
+    bucket 为 compile_category_case 的取值，is_ext 为外电网标记 (0/1)。
+    返回值与 aggregate_alarm_rows 相同。
+    """
+    table1_stats = collections.defaultdict(lambda: {
+        "total": 0, "level1": 0, "level2": 0, "level3": 0, "total_no_ext": 0
+    })
+    table2_stats = collections.defaultdict(lambda: collections.defaultdict(int))
+    table3_stats = collections.defaultdict(lambda: collections.defaultdict(int))
+    workshop_stats = collections.defaultdict(lambda: collections.defaultdict(int))
+    total_alarms = 0
+
+    for telename, level, is_ext, bucket, cnt in rows:
+        total_alarms += cnt
+        section, workshop = station_section(stations, telename)
+        if section is None: continue
+
+        s_stat = table1_stats[section]
+        s_stat["total"] += cnt
+        if level == 1: s_stat["level1"] += cnt
+        elif level == 2: s_stat["level2"] += cnt
+        elif level == 3: s_stat["level3"] += cnt
+        if not is_ext:
+            s_stat["total_no_ext"] += cnt
+
+        table, cat = bucket.split(":", 1)
+        row = (table2_stats if table == "t2" else table3_stats)[section]
+        row["total"] += cnt
+        row[cat] += cnt
+
+        workshop_stats[section][workshop] += cnt
+
+    return total_alarms, table1_stats, table2_stats, table3_stats, workshop_stats
+
+@request_timing.timed("aggregate")
+def format_alarm_tables(req: ReportRequest, tables, top_rows):
+    """把统计结果格式化为第一部分的输出"""
+    total_alarms, table1_stats, table2_stats, table3_stats, workshop_stats = tables
+
+    # ================= 格式化输出 =================
+
+    # 站段基础数据配置 (车站数, 道岔换算组数)
+    SECTION_BASE_INFO = {
+        "南昌电务段": {"stations": 327, "turnouts": 114047},
+        "福州电务段": {"stations": 363, "turnouts": 127723},
+        "南昌高铁基础设施段": {"stations": 89, "turnouts": 28964}
+    }
+
+    # 各表按站段排列: 先按 SECTION_BASE_INFO 的顺序，其余按名称，不随取数的行序变化
+    def by_section(stats):
+        order = list(SECTION_BASE_INFO)
+        return sorted(stats.items(), key=lambda x: (order.index(x[0]) if x[0] in order else len(order), x[0]))
+
+    # 格式化表1
+    table1_output = []
+    for section, data in by_section(table1_stats):
+        # 获取该段的基础配置，没有则默认为 0
+        base_info = SECTION_BASE_INFO.get(section, {"stations": 0, "turnouts": 0})
+
+        table1_output.append({
+            "name": section,
+            "station_count": base_info["stations"], 
+            "turnout_count": base_info["turnouts"], 
+            **data
+        })
+
+    # 格式化表2
+    table2_output = []
+    for section, data in by_section(table2_stats):
+        table2_output.append({
+            "name": section,
+            "count": data["total"],
+            "breakdown": data
+        })
+
+    # 格式化表3
+    table3_output = []
+    for section, data in by_section(table3_stats):
+        table3_output.append({
+            "name": section,
+            "count": data["total"],
+            "breakdown": data
+        })
+
+    # 格式化表4 (每个站段取前3)
+    table4_output = []
+    for section, w_dict in by_section(workshop_stats):
+        # 对该段的车间按报警数倒序排列，数量相同按车间名
+        sorted_ws = sorted(w_dict.items(), key=lambda x: (-x[1], x[0]))
+        # 取前3名
+        top3 = sorted_ws[:3]
+        for w_name, w_count in top3:
+            table4_output.append({
+                "name": f"{section} - {w_name}",
+                "count": w_count
+            })
+
+    # 可选：最后再对 table4_output 整体排序，或者保持按段分组顺序
+    # 这里按总数排序一下以保证原来的风格，或者直接就这样
+    table4_output.sort(key=lambda x: (-x["count"], x["name"]))
+
+    top_faults = [{"issue": row[0], "count": row[1]} for row in rank_rows(top_rows)]
+
+    # 趋势数据 (简单实现)
+    trend = {"status": "未知", "growth": "0%"} # 待实现：需要查上周
+
+    result_data = {
+        "period": f"{req.start_date} 至 {req.end_date}",
+        "overview": {"total": total_alarms},
+        "table1_station_stats": table1_output,
+        "table2_self_diagnosis": table2_output,
+        "table3_external_interface": table3_output,
+        "table4_workshop_rank": table4_output,
+        "top_issues": top_faults,
+        "trend": trend
+    }
+
+    return result_data
+
+# 第一部分所需的日汇总维度，顺序与 build_alarm_tables 的行格式一致
+PART1_FACT_DIMS = ("telename", "alarmlevel", "devicetype", "alarmtype", "des_flags")
+
+async def alarm_stats_from_rollup(req: ReportRequest, config, plan):
+    flag_rows, des_rows = await asyncio.gather(
+        rollup_facts(plan, PART1_FACT_DIMS),
+        rollup_read(plan, ROLLUP_STORE.descriptions, "rollup.descriptions", rollup_store.DES_SQL, rollup_store.project_descriptions)
+    )
+    return await run_in_threadpool(build_alarm_tables, req, config, flag_rows, top_counts(des_rows, 10))
+
+async def compute_alarm_stats(req: ReportRequest):
+    try:
+        # 整个计算过程使用同一版本的基础配置 (热加载可能在计算期间替换 BASE_CONFIG)
+        config = BASE_CONFIG
+
         # 转换日期字符为 Unix 时间戳
         start_dt = datetime.datetime.strptime(req.start_date, "%Y-%m-%d")
         end_dt = datetime.datetime.strptime(req.end_date, "%Y-%m-%d") + datetime.timedelta(days=1)
         start_ts = int(start_dt.replace(tzinfo=datetime.timezone.utc).timestamp())
         end_ts = int(end_dt.replace(tzinfo=datetime.timezone.utc).timestamp())
 
-        # 1. 聚合查询：增加 alarmtype (对应 XML 中的 type)
+        # 已关账的天优先读日汇总库，只有未关账的天回查 Oracle
+        plan = await rollup_plan(start_ts, end_ts)
+        if plan is not None:
+            result_data = await alarm_stats_from_rollup(req, config, plan)
+            save_debug_json(result_data, "part1_overview")
+            return result_data
+
+        # 1. 聚合查询
+        # 分类规则编译为 CASE 在库内执行，结果只按 (车站, 等级, 外电网标记, 分类) 分组，
+        # 不再为了分类而按高基数的 alarmdes 分组。CLASSIFY_CONFIG["in_sql"]=False 时使用下方按描述分组的查询。
+        sql_category = f"""
+            SELECT telename, alarmlevel, is_ext, bucket, count(*) as cnt
+            FROM (
+                SELECT
+                    telename, alarmlevel,
+                    case when instr(alarmdes, '外电网') > 0 then 1 else 0 end as is_ext,
+                    {compile_category_case(config.classification)} as bucket
+                FROM ALARM
+                WHERE createtime >= :1
+                  AND createtime < :2
+            )
+            GROUP BY telename, alarmlevel, is_ext, bucket
+        """
+
+        # 增加 alarmtype (对应 XML 中的 type)
         sql_raw = """
             SELECT telename, alarmlevel, devicetype, alarmdes, alarmtype, count(*) as cnt 
             FROM ALARM 
@@ -298,156 +1355,6 @@ def get_stats(req: ReportRequest):
               AND createtime < :2
             GROUP BY telename, alarmlevel, devicetype, alarmdes, alarmtype
         """
-        cursor.execute(sql_raw, [start_ts, end_ts])
-        rows = cursor.fetchall()
-
-        # ================= 数据初始化 =================
-        # 表1：各站段报警统计表
-        table1_stats = collections.defaultdict(lambda: {
-            "total": 0, "level1": 0, "level2": 0, "level3": 0, "total_no_ext": 0
-        })
-        
-        # 表2：监测系统自诊断报警
-        table2_stats = collections.defaultdict(lambda: collections.defaultdict(int))
-
-        # 表3：外部接口系统报警
-        table3_stats = collections.defaultdict(lambda: collections.defaultdict(int))
-        
-        # 表4：重点车间排名 (按段分组)
-        workshop_stats = collections.defaultdict(lambda: collections.defaultdict(int))
-
-        # 全局统计
-        total_alarms = 0
-        
-        # ================= 数据处理循环 =================
-        for telename, level, dtype, des, atype, cnt in rows:
-            telename = telename.strip()
-            total_alarms += cnt
-            
-            # --- 获取基础信息 ---
-            info = STATION_MAP.get(telename, {})
-            section = info.get("ele_section", "未知电务段")
-            workshop = info.get("workshop", "未知车间")
-            
-            # 过滤未知数据，保证表格整洁
-            if section == "未知电务段": continue
-
-            # --- 逻辑判定 ---
-            # 1. 外电网判定 (简单的关键词匹配)
-            des_str = str(des) if des else ""
-            is_external_power = "外电网" in des_str
-            
-            # 2. 设备类型归类
-            # dtype_name = DEVICE_TYPE_MAP.get(dtype, "其他")
-            
-            # --- 填充表1 (站段统计) ---
-            s_stat = table1_stats[section]
-            s_stat["total"] += cnt
-            if level == 1: s_stat["level1"] += cnt
-            elif level == 2: s_stat["level2"] += cnt
-            elif level == 3: s_stat["level3"] += cnt
-            if not is_external_power:
-                s_stat["total_no_ext"] += cnt
-
-            # --- 填充表2 (监测自诊断) ---
-            t2_cat = get_table2_category(atype)
-            
-            if t2_cat:
-                t2_row = table2_stats[section]
-                t2_row["total"] += cnt
-                # 分类统计
-                if t2_cat == "elec_char": t2_row["elec_char"] += cnt
-                elif t2_cat == "switch_no_rep": t2_row["switch_no_rep"] += cnt
-                elif t2_cat == "safety": t2_row["safety"] += cnt
-                else: t2_row["other"] += cnt
-            
-            # --- 余下逻辑 (表3 或 监测兜底) ---
-            else:
-                t3_cat = get_table3_category(atype)
-                
-                # Gap / Track Monitor special check
-                if not t3_cat:
-                    if dtype == 51 or "缺口" in str(des):
-                        t3_cat = "gap"
-                    elif dtype == 65:
-                        t3_cat = "track_monitor"
-
-                if t3_cat:
-                    t3_row = table3_stats[section]
-                    t3_row["total"] += cnt
-                    t3_row[t3_cat] += cnt
-                
-                # 监测相关报警归为表2 other (兜底)
-                elif "监测" in des_str:
-                     t2_row = table2_stats[section]
-                     t2_row["total"] += cnt
-                     t2_row["other"] += cnt
-                     
-                # 其余归为表3 other
-                else:
-                    t3_row = table3_stats[section]
-                    t3_row["total"] += cnt
-                    t3_row["other"] += cnt
-
-            # --- 填充表4 (车间统计) ---
-            workshop_stats[section][workshop] += cnt
-
-        # ================= 格式化输出 =================
-        
-        # 站段基础数据配置 (车站数, 道岔换算组数)
-        SECTION_BASE_INFO = {
-            "南昌电务段": {"stations": 327, "turnouts": 114047},
-            "福州电务段": {"stations": 363, "turnouts": 127723},
-            "南昌高铁基础设施段": {"stations": 89, "turnouts": 28964}
-        }
-
-        # 格式化表1
-        table1_output = []
-        for section, data in table1_stats.items():
-            # 获取该段的基础配置，没有则默认为 0
-            base_info = SECTION_BASE_INFO.get(section, {"stations": 0, "turnouts": 0})
-            
-            table1_output.append({
-                "name": section,
-                "station_count": base_info["stations"], 
-                "turnout_count": base_info["turnouts"], 
-                **data
-            })
-
-        # 格式化表2
-        table2_output = []
-        for section, data in table2_stats.items():
-            table2_output.append({
-                "name": section,
-                "count": data["total"],
-                "breakdown": data
-            })
-            
-        # 格式化表3
-        table3_output = []
-        for section, data in table3_stats.items():
-            table3_output.append({
-                "name": section,
-                "count": data["total"],
-                "breakdown": data
-            })
-
-        # 格式化表4 (每个站段取前3)
-        table4_output = []
-        for section, w_dict in workshop_stats.items():
-            # 对该段的车间按报警数倒序排列
-            sorted_ws = sorted(w_dict.items(), key=lambda x: x[1], reverse=True)
-            # 取前3名
-            top3 = sorted_ws[:3]
-            for w_name, w_count in top3:
-                table4_output.append({
-                    "name": f"{section} - {w_name}",
-                    "count": w_count
-                })
-        
-        # 可选：最后再对 table4_output 整体排序，或者保持按段分组顺序
-        # 这里按总数排序一下以保证原来的风格，或者直接就这样
-        table4_output.sort(key=lambda x: x["count"], reverse=True)
 
         # Top 10 隐患 (用于文本分析)
         sql_top = """
@@ -456,7 +1363,7 @@ def get_stats(req: ReportRequest):
             WHERE createtime >= :1 
               AND createtime < :2
             GROUP BY alarmdes
-            ORDER BY cnt DESC
+            ORDER BY cnt DESC, NLSSORT(alarmdes, 'NLS_SORT=BINARY') NULLS FIRST
         """
         # Ensure older Oracle versions compatibility by not complicating (limit dealt with in python if needed, or rownum)
         # However, LIMIT/FETCH FIRST is nicer. Let's start with getting all and slicing in python to be safe for 11g,
@@ -470,25 +1377,33 @@ def get_stats(req: ReportRequest):
                 WHERE createtime >= :1 
                   AND createtime < :2
                 GROUP BY alarmdes
-                ORDER BY cnt DESC
+                ORDER BY cnt DESC, NLSSORT(alarmdes, 'NLS_SORT=BINARY') NULLS FIRST
             ) WHERE ROWNUM <= 10
         """
-        cursor.execute(sql_top, [start_ts, end_ts])
-        top_faults = [{"issue": row[0], "count": row[1]} for row in cursor.fetchall()]
-
-        # 趋势数据 (简单实现)
-        trend = {"status": "未知", "growth": "0%"} # 待实现：需要查上周
-
-        result_data = {
-            "period": f"{req.start_date} 至 {req.end_date}",
-            "overview": {"total": total_alarms},
-            "table1_station_stats": table1_output,
-            "table2_self_diagnosis": table2_output,
-            "table3_external_interface": table3_output,
-            "table4_workshop_rank": table4_output,
-            "top_issues": top_faults,
-            "trend": trend
-        }
+
+        # 两条查询互不依赖，分别借用连接并发执行；统计在查询线程中边取数边完成
+        if CLASSIFY_CONFIG["in_sql"]:
+            tables, top_rows = await run_queries(
+                ("part1.categories", sql_category, [start_ts, end_ts], functools.partial(aggregate_category_rows, config.stations)),
+                ("part1.top_descriptions", sql_top, [start_ts, end_ts], "all", SMALL_FETCH)
+            )
+            result_data = format_alarm_tables(req, tables, top_rows)
+            save_debug_json(result_data, "part1_overview")
+            return result_data
+
+        # 列式统计开启时 sql_raw 按列取回 (Oracle 支持时直接取为 Arrow 列)，否则逐行流式统计
+        columnar = columnar_enabled()
+        rows, top_rows = await run_queries(
+            ("part1.details", sql_raw, [start_ts, end_ts],
+             "columns" if columnar else functools.partial(aggregate_alarm_detail_rows, config)),
+            ("part1.top_descriptions", sql_top, [start_ts, end_ts], "all", SMALL_FETCH)
+        )
+
+        # 分类统计较耗 CPU，放到线程池中执行，避免阻塞事件循环
+        if columnar:
+            result_data = await run_in_threadpool(build_alarm_stats_from_columns, req, config, rows, top_rows)
+        else:
+            result_data = format_alarm_tables(req, rows, top_rows)
 
         # 将输出写入文件，以便调试查看
         save_debug_json(result_data, "part1_overview")
@@ -504,28 +1419,329 @@ def get_stats(req: ReportRequest):
             error_detail += " [HINT: You are currently using python-oracledb in THIN mode which does not support this old Oracle database version. Please install Oracle Instant Client on this Windows machine and add it to PATH to enable THICK mode.]"
             
         raise HTTPException(status_code=500, detail=error_detail)
-    finally:
-        if conn: conn.close()
 
 # --- New Report Endpoints (Option 1) ---
 
+@app.post("/get_alarm_stats")
+async def get_stats(req: ReportRequest, response: Response, profile: bool = False):
+    return await serve_report("part1_overview", req, response, profile)
+
 @app.post("/report/part1_overview")
-def report_part1_overview(req: ReportRequest):
+async def report_part1_overview(req: ReportRequest, response: Response, profile: bool = False):
     """
     Generate Part 1: Alarm Overview (Reuses existing get_stats logic)
     """
-    return get_stats(req)
+    return await serve_report("part1_overview", req, response, profile)
+
+# 第二部分的设备类型分类
+# Categorization Logic
+# Updated based on user provided constants
+HAZARD_CATEGORIES = {
+    "switch": {"ids": [1, 23, 51]},
+    "signal": {"ids": [4, 40, 3]},
+    "track": {"ids": [15, 16, 26, 9, 44, 65, 7, 22]},
+    "control": {"ids": [24, 25, 27, 32, 33, 34, 54, 61, 64, 68, 21, 19, 57, 58, 59, 71]},
+    "power": {"ids": [5, 6, 14, 18, 28, 66, 43]}
+}
 
-@app.post("/report/part2_hazards")
-def report_part2_hazards(req: ReportRequest):
+# 第二部分各分类保留的条数: 报警类型 / 每类报警的设备 / 车站
+HAZARD_TOP_TYPES = 10
+HAZARD_TOP_DEVICES = 5
+HAZARD_TOP_STATIONS = 6
+
+# 第二部分只统计非天窗报警: maintanceflag != 0 为天窗
+HAZARD_VALID_CONDITION = "AND (maintanceflag = 0 OR maintanceflag IS NULL)"
+
+def hazard_retention_rate(total_valid, unhandled_count):
+    retention_rate = 0.0
+    if total_valid > 0 and unhandled_count >= 0:
+        retention_rate = round((unhandled_count / total_valid) * 100, 2)
+    return retention_rate
+
+@request_timing.timed("aggregate")
+def hazard_result(req: ReportRequest, total_valid, unhandled_count, category_analysis):
+    return {
+        "period": f"{req.start_date} to {req.end_date}",
+        "overview": {
+            "total_valid_alarms": total_valid,
+            "unhandled_alarms": unhandled_count,
+            "retention_rate": f"{hazard_retention_rate(total_valid, unhandled_count)}%"
+        },
+        "categories": category_analysis
+    }
+
+def hazard_device_key(stations, station, devname, des):
+    """设备标识: 车站名 设备名 (报警描述)"""
+    # Create a specific identifier: Station DeviceName (AlarmDescription)
+    st_name = stations.name(station)
+
+    # Construct unique device identifier string
+    # If devname is present, use it. Otherwise rely on des.
+    identifier_parts = [st_name]
+    if devname:
+        identifier_parts.append(devname)
+
+    # Only add description if it's not redundant or if devname is missing
+    # (sometimes des contains the device name, sometimes not)
+    # To be safe, include des details.
+    identifier_parts.append(f"({des})")
+
+    return " ".join(identifier_parts)
+
+def _sql_str(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+# 库内去首尾空白时使用的字符集合: Python str.strip() 去掉的空白字符中 GBK 可以表示的部分。
+# 其余 (如 U+00A0) 在 GBK 库中不会出现，写入 SQL 文本时却会被替换为 '?'，因此不列入。
+SQL_WHITESPACE = " \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f\u3000"
+
+def _sql_strip(column):
+    """与 Python str.strip() 一致的去首尾空白 (Oracle 中结果为空串时为 NULL)"""
+    ws = _sql_str(SQL_WHITESPACE)
+    return f"ltrim(rtrim({column}, {ws}), {ws})"
+
+def _sql_sort(column):
+    """排名中计数相同时的排序列: 按字节比较，与 Python 侧的 collation_key 一致 (不受会话 NLS_SORT 影响)"""
+    return f"NLSSORT({column}, 'NLS_SORT=BINARY') NULLS FIRST"
+
+def compile_hazard_ranking_sql(desc_map, valid_condition):
+    """
+    第二部分的库内排名查询 (:1 / :2 为时间范围)。
+    分类 (HAZARD_CATEGORIES)、通用报警名 (desc_map 即 alarm_desc_map，否则取描述中 '#' 之后的部分) 均在库内计算，
+    再用 ROW_NUMBER 取各分类前 HAZARD_TOP_TYPES 个报警类型、每类前 HAZARD_TOP_DEVICES 个设备、
+    前 HAZARD_TOP_STATIONS 个车站。返回行 (kind, cat, gen_name, station, devname, des, cnt, rn)，
+    kind 为 'T' (报警类型) / 'D' (设备) / 'S' (车站)。
+    车站 / 设备名 / 描述按 collect_hazards 的口径规整: 去首尾空白，只有 NULL 或空串记为 'Unknown' (设备名记为空串)；
+    计数相同时按名称的 GBK 字节序排列 (NLSSORT BINARY)，与 collect_hazards 使用的 collation_key 一致
+    (Oracle 中去空白后为空的值是 NULL，由 NULLS FIRST 排在最前)。
+    """
+    cat_whens = "\n".join(
+        f"                        WHEN {_sql_in('devicetype', cfg['ids'])} THEN '{cat}'"
+        for cat, cfg in HAZARD_CATEGORIES.items()
+    )
+    name_whens = "\n".join(
+        f"                        WHEN coalesce(alarmtype, 0) = {int(at)} AND coalesce(alarmsubtype, 0) = {int(ast)} "
+        f"THEN {_sql_str(name)}"
+        for (at, ast), name in desc_map.items() if name
+    )
+    # 没有配置通用名时: 描述中有 '#' 取其后的部分，否则取描述本身
+    des_name = "case when instr(des, '#') > 0 then substr(des, instr(des, '#') + 1) else des end"
+    gen_name = f"""CASE
+{name_whens}
+                        ELSE {des_name}
+                    END""" if name_whens else des_name
+
+    return f"""
+        WITH base AS (
+            SELECT cat, gen_name, station, devname, des, count(*) as cnt
+            FROM (
+                SELECT
+                    cat, station, devname, des,
+                    {gen_name} as gen_name
+                FROM (
+                    SELECT
+                        CASE
+{cat_whens}
+                        END as cat,
+                        CASE WHEN telename IS NULL OR telename = '' THEN 'Unknown'
+                             ELSE coalesce({_sql_strip('telename')}, '') END as station,
+                        coalesce({_sql_strip('devicename')}, '') as devname,
+                        CASE WHEN alarmdes IS NULL OR alarmdes = '' THEN 'Unknown'
+                             ELSE coalesce({_sql_strip('alarmdes')}, '') END as des,
+                        alarmtype, alarmsubtype
+                    FROM ALARM
+                    WHERE createtime >= :1 AND createtime < :2
+                    {valid_condition}
+                )
+                WHERE cat IS NOT NULL
+            )
+            GROUP BY cat, gen_name, station, devname, des
+        ),
+        types AS (
+            SELECT cat, gen_name, cnt,
+                   ROW_NUMBER() OVER (PARTITION BY cat ORDER BY cnt DESC, {_sql_sort('gen_name')}) as rn
+            FROM (SELECT cat, gen_name, sum(cnt) as cnt FROM base GROUP BY cat, gen_name)
+        ),
+        devices AS (
+            SELECT cat, gen_name, station, devname, des, cnt,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY cat, gen_name
+                       ORDER BY cnt DESC, {_sql_sort('station')}, {_sql_sort('devname')}, {_sql_sort('des')}
+                   ) as rn
+            FROM base
+        ),
+        stations AS (
+            SELECT cat, station, cnt,
+                   ROW_NUMBER() OVER (PARTITION BY cat ORDER BY cnt DESC, {_sql_sort('station')}) as rn
+            FROM (SELECT cat, station, sum(cnt) as cnt FROM base GROUP BY cat, station)
+        )
+        SELECT 'T' as kind, cat, gen_name, NULL as station, NULL as devname, NULL as des, cnt, rn
+        FROM types WHERE rn <= {HAZARD_TOP_TYPES}
+        UNION ALL
+        SELECT 'D' as kind, d.cat, d.gen_name, d.station, d.devname, d.des, d.cnt, d.rn
+        FROM devices d
+        JOIN types t
+          ON t.cat = d.cat
+         AND (t.gen_name = d.gen_name OR (t.gen_name IS NULL AND d.gen_name IS NULL))
+        WHERE t.rn <= {HAZARD_TOP_TYPES} AND d.rn <= {HAZARD_TOP_DEVICES}
+        UNION ALL
+        SELECT 'S' as kind, cat, NULL, station, NULL, NULL, cnt, rn
+        FROM stations WHERE rn <= {HAZARD_TOP_STATIONS}
+    """
+
+def hazard_ranking_query(config, binds):
+    """
+    第二部分的库内排名查询项 (供 run_queries)。/report/part2_hazards 与 /report/full 共用同一条查询与同一个
+    collect 函数，两者的排名 (包括计数相同时的取舍与次序) 一致。binds 为 [开始, 结束) 时间戳。
+    """
+    sql = compile_hazard_ranking_sql(config.alarm_desc_map, HAZARD_VALID_CONDITION)
+    return ("part2.ranking", sql, binds, functools.partial(collect_hazards_from_ranking, config.stations))
+
+@request_timing.timed("part2.classify")
+def collect_hazards_from_ranking(stations, rows):
+    """根据库内排名结果 (compile_hazard_ranking_sql) 生成各分类的分析，输出与 collect_hazards 相同"""
+    types = {cat: [] for cat in HAZARD_CATEGORIES}
+    devices = collections.defaultdict(list)
+    top_stations = {cat: [] for cat in HAZARD_CATEGORIES}
+    for kind, cat, gen_name, station, devname, des, cnt, rn in rows:
+        # Oracle 把空串当作 NULL 返回，还原为 collect_hazards 中的空串
+        gen_name = "" if gen_name is None else gen_name
+        station = "" if station is None else station
+        des = "" if des is None else des
+        if kind == "T":
+            types[cat].append((rn, gen_name, cnt))
+        elif kind == "D":
+            devices[(cat, gen_name)].append((rn, hazard_device_key(stations, station, devname or "", des), cnt))
+        else:
+            top_stations[cat].append((rn, station, cnt))
+
+    category_analysis = {}
+    for cat_key in HAZARD_CATEGORIES:
+        top_al = []
+        for _, aname, count in sorted(types[cat_key], key=lambda x: x[0]):
+            top_specs = sorted(devices[(cat_key, aname)], key=lambda x: x[0])
+            top_al.append({
+                "name": aname,
+                "count": count,
+                "top_devices": [{"dev_desc": k, "count": v} for _, k, v in top_specs]
+            })
+        top_st = [
+            {"name": stations.name(k), "count": v}
+            for _, k, v in sorted(top_stations[cat_key], key=lambda x: x[0])
+        ]
+        category_analysis[cat_key] = {
+            "top_alarm_types": top_al,
+            "top_faulty_stations": top_st
+        }
+
+    return category_analysis
+
+def build_hazards(req: ReportRequest, config, total_valid, unhandled_count, rows):
+    """根据非天窗报警明细生成第二部分 (重点隐患分析)"""
+    return hazard_result(req, total_valid, unhandled_count, collect_hazards(config, rows))
+
+@request_timing.timed("part2.classify")
+def collect_hazards(config, rows):
+    """
+    按分类统计非天窗报警明细 (devicetype, alarmdes, telename, alarmtype, alarmsubtype, devicename, cnt)，
+    rows 只遍历一次，可直接消费流式取数的行迭代器
+    """
+    categories = HAZARD_CATEGORIES
+    desc_map = config.alarm_desc_map
+    stations = config.stations
+
+    # Structure: category -> { "alarms": { generic_name: { count: int, specifics: { des: int } } }, "stations": { name: int } }
+    category_data = {k: {"alarms": {}, "stations": collections.defaultdict(int)} for k in categories}
+
+    for dtype, des, station, atype, asubtype, devname, cnt in rows:
+        station = station.strip() if station else "Unknown"
+        des_info = DESCRIPTIONS.analyze(des)
+        devname = devname.strip() if devname else ""
+
+        target_cat = "other"
+        for cat_key, cat_cfg in categories.items():
+            if dtype in cat_cfg["ids"]:
+                target_cat = cat_key
+                break
+
+        if target_cat != "other":
+            # Track Station
+            category_data[target_cat]["stations"][station] += cnt
+
+            # Determine Generic Alarm Name
+            # Type safe conversion
+            try: at = int(atype) if atype is not None else 0
+            except: at = 0
+            try: ast = int(asubtype) if asubtype is not None else 0
+            except: ast = 0
+
+            gen_name = None
+            # Try exact match (type, subtype)
+            if (at, ast) in desc_map:
+                 gen_name = desc_map[(at, ast)]
+
+            if not gen_name:
+                # If we can't map it, force using a cleaned version of des or just des
+                # Attempt to strip device prefix "Device#Msg"
+                gen_name = des_info.generic
+
+            # Update stats
+            c_alarms = category_data[target_cat]["alarms"]
+            if gen_name not in c_alarms:
+                c_alarms[gen_name] = {"count": 0, "specifics": collections.defaultdict(int)}
+
+            c_alarms[gen_name]["count"] += cnt
+
+            # 先按 (车站, 设备, 描述) 累加，输出前再拼接为设备标识
+            c_alarms[gen_name]["specifics"][(station, devname, des_info.text)] += cnt
+
+    # Format Output
+    category_analysis = {}
+    for cat_key, stat_obj in category_data.items():
+
+        # Top Stations (计数相同时按车站升序，与库内排名一致)
+        top_st = []
+        for k, v in sorted(stat_obj["stations"].items(), key=lambda x: count_rank((x[0],), x[1]))[:HAZARD_TOP_STATIONS]:
+             # Map Code to Name
+             st_name = stations.name(k)
+             top_st.append({"name": st_name, "count": v})
+
+        # Top Alarm Types
+        sorted_alarms = sorted(stat_obj["alarms"].items(), key=lambda x: count_rank((x[0],), x[1]["count"]))[:HAZARD_TOP_TYPES]
+
+        top_al = []
+        for aname, adata in sorted_alarms:
+            # Top devices (specific alarmdes)
+            # 计数相同时按 (车站, 设备, 描述) 升序，与库内排名一致
+            specifics = {}
+            for spec, v in adata["specifics"].items():
+                key = hazard_device_key(stations, *spec)
+                count, first = specifics.get(key, (0, spec))
+                specifics[key] = (count + v, min(first, spec, key=collation_key))
+            top_specs = sorted(specifics.items(), key=lambda x: count_rank(x[1][1], x[1][0]))[:HAZARD_TOP_DEVICES]
+            fmt_specs = [{"dev_desc": k, "count": v} for k, (v, _) in top_specs]
+
+            top_al.append({
+                "name": aname,
+                "count": adata["count"],
+                "top_devices": fmt_specs
+            })
+
+        category_analysis[cat_key] = {
+            "top_alarm_types": top_al,
+            "top_faulty_stations": top_st
+        }
+
+    return category_analysis
+
+async def compute_hazards(req: ReportRequest):
     """
     Generate Part 2: Key Hazards Analysis (Excluding Skylight)
     """
-    conn = None
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
+        # 整个计算过程使用同一版本的基础配置
+        config = BASE_CONFIG
+
         # Time calc
         start_dt = datetime.datetime.strptime(req.start_date, "%Y-%m-%d")
         end_dt = datetime.datetime.strptime(req.end_date, "%Y-%m-%d") + datetime.timedelta(days=1)
@@ -534,7 +1750,7 @@ def report_part2_hazards(req: ReportRequest):
 
         # Define Skylight Filter: maintanceflag != 0 means skylight. 
         # So Valid/Hazard = (maintanceflag = 0 OR maintanceflag IS NULL)
-        valid_condition = "AND (maintanceflag = 0 OR maintanceflag IS NULL)"
+        valid_condition = HAZARD_VALID_CONDITION
 
         # 1. Overview: Total and Unhandled
         # User specified logic: 
@@ -543,33 +1759,14 @@ def report_part2_hazards(req: ReportRequest):
         total_valid = 0
         unhandled_count = -1
         
-        try:
-            sql_overview = f"""
-                SELECT 
-                    count(*) as total,
-                    sum(case when processstatus = 0 or processstatus is null then 1 else 0 end) as unhandled
-                FROM ALARM
-                WHERE createtime >= :1 AND createtime < :2
-                {valid_condition}
-            """
-            cursor.execute(sql_overview, [start_ts, end_ts])
-            row = cursor.fetchone()
-            if row:
-                total_valid = row[0]
-                unhandled_count = row[1] if row[1] is not None else 0
-        except Exception as e:
-            # Fallback if processstatus column missing
-            print(f"Warning: 'processstatus' query failed: {e}")
-            sql_fallback = f"""
-                SELECT count(*) FROM ALARM 
-                WHERE createtime >= :1 AND createtime < :2 {valid_condition}
-            """
-            cursor.execute(sql_fallback, [start_ts, end_ts])
-            total_valid = cursor.fetchone()[0]
-
-        retention_rate = 0.0
-        if total_valid > 0 and unhandled_count >= 0:
-            retention_rate = round((unhandled_count / total_valid) * 100, 2)
+        sql_overview = f"""
+            SELECT 
+                count(*) as total,
+                sum(case when processstatus = 0 or processstatus is null then 1 else 0 end) as unhandled
+            FROM ALARM
+            WHERE createtime >= :1 AND createtime < :2
+            {valid_condition}
+        """
 
         # 2. Detailed Analysis by Category
         # We fetch aggregated data and categorize in Python to ensure flexibility
@@ -581,421 +1778,378 @@ def report_part2_hazards(req: ReportRequest):
             {valid_condition}
             GROUP BY devicetype, alarmdes, telename, alarmtype, alarmsubtype, devicename
         """
-        cursor.execute(sql_details, [start_ts, end_ts])
-        rows = cursor.fetchall()
-        
-        # Categorization Logic
-        # Updated based on user provided constants
-        categories = {
-            "switch": {"ids": [1, 23, 51]},
-            "signal": {"ids": [4, 40, 3]},
-            "track": {"ids": [15, 16, 26, 9, 44, 65, 7, 22]},
-            "control": {"ids": [24, 25, 27, 32, 33, 34, 54, 61, 64, 68, 21, 19, 57, 58, 59, 71]}, 
-            "power": {"ids": [5, 6, 14, 18, 28, 66, 43]}
-        }
-        
-        # Structure: category -> { "alarms": { generic_name: { count: int, specifics: { des: int } } }, "stations": { name: int } }
-        category_data = {k: {"alarms": {}, "stations": collections.defaultdict(int)} for k in categories}
 
-        for dtype, des, station, atype, asubtype, devname, cnt in rows:
-            station = station.strip() if station else "Unknown"
-            des = des.strip() if des else "Unknown"
-            devname = devname.strip() if devname else ""
-            
-            target_cat = "other"
-            for cat_key, cat_cfg in categories.items():
-                if dtype in cat_cfg["ids"]:
-                    target_cat = cat_key
-                    break
-            
-            if target_cat != "other":
-                # Track Station
-                category_data[target_cat]["stations"][station] += cnt
-                
-                # Determine Generic Alarm Name
-                # Type safe conversion
-                try: at = int(atype) if atype is not None else 0
-                except: at = 0
-                try: ast = int(asubtype) if asubtype is not None else 0
-                except: ast = 0
-                
-                gen_name = None
-                # Try exact match (type, subtype)
-                if (at, ast) in ALARM_DESC_MAP:
-                     gen_name = ALARM_DESC_MAP[(at, ast)]
-                
-                if not gen_name:
-                    # If we can't map it, force using a cleaned version of des or just des
-                    # Attempt to strip device prefix "Device#Msg"
-                    if "#" in des:
-                        try:
-                            gen_name = des.split("#", 1)[1]
-                        except:
-                            gen_name = des
-                    else:
-                        gen_name = des
-                
-                # Update stats
-                c_alarms = category_data[target_cat]["alarms"]
-                if gen_name not in c_alarms:
-                    c_alarms[gen_name] = {"count": 0, "specifics": collections.defaultdict(int)}
-                
-                c_alarms[gen_name]["count"] += cnt
-                
-                # Create a specific identifier: Station DeviceName (AlarmDescription)
-                st_name = STATION_MAP.get(station, {}).get("name", station)
-                
-                # Construct unique device identifier string
-                # If devname is present, use it. Otherwise rely on des.
-                identifier_parts = [st_name]
-                if devname:
-                    identifier_parts.append(devname)
-                
-                # Only add description if it's not redundant or if devname is missing 
-                # (sometimes des contains the device name, sometimes not)
-                # To be safe, include des details.
-                identifier_parts.append(f"({des})")
-                
-                specific_key = " ".join(identifier_parts)
-                
-                c_alarms[gen_name]["specifics"][specific_key] += cnt
-        
-        # Format Output
-        category_analysis = {}
-        for cat_key, stat_obj in category_data.items():
-            
-            # Top Stations
-            top_st = []
-            for k, v in sorted(stat_obj["stations"].items(), key=lambda x: x[1], reverse=True)[:6]:
-                 # Map Code to Name
-                 st_name = STATION_MAP.get(k, {}).get("name", k)
-                 top_st.append({"name": st_name, "count": v})
-
-            # Top Alarm Types
-            sorted_alarms = sorted(stat_obj["alarms"].items(), key=lambda x: x[1]["count"], reverse=True)[:10]
-            
-            top_al = []
-            for aname, adata in sorted_alarms:
-                # Top devices (specific alarmdes)
-                top_specs = sorted(adata["specifics"].items(), key=lambda x: x[1], reverse=True)[:5]
-                fmt_specs = [{"dev_desc": k, "count": v} for k, v in top_specs]
-                
-                top_al.append({
-                    "name": aname,
-                    "count": adata["count"],
-                    "top_devices": fmt_specs
-                })
-
-            category_analysis[cat_key] = {
-                "top_alarm_types": top_al,
-                "top_faulty_stations": top_st
-            }
+        # 排名在库内完成时只取回各分类前 N 名
+        if CLASSIFY_CONFIG["hazards_top_n_in_sql"]:
+            details = hazard_ranking_query(config, [start_ts, end_ts])
+        else:
+            details = ("part2.details", sql_details, [start_ts, end_ts], functools.partial(collect_hazards, config))
+
+        # 概览与明细两条查询并发执行，明细在取数的同时完成分类统计
+        row, category_analysis = await run_queries(
+            ("part2.overview", sql_overview, [start_ts, end_ts], "one", SMALL_FETCH),
+            details,
+            return_exceptions=True
+        )
+        if isinstance(category_analysis, Exception):
+            raise category_analysis
+
+        if isinstance(row, Exception):
+            # Fallback if processstatus column missing
+            print(f"Warning: 'processstatus' query failed: {row}")
+            sql_fallback = f"""
+                SELECT count(*) FROM ALARM 
+                WHERE createtime >= :1 AND createtime < :2 {valid_condition}
+            """
+            (row,) = await run_queries(("part2.overview_fallback", sql_fallback, [start_ts, end_ts], "one", SMALL_FETCH))
+            total_valid = row[0]
+        elif row:
+            total_valid = row[0]
+            unhandled_count = row[1] if row[1] is not None else 0
 
-        result = {
-            "period": f"{req.start_date} to {req.end_date}",
-            "overview": {
-                "total_valid_alarms": total_valid,
-                "unhandled_alarms": unhandled_count,
-                "retention_rate": f"{retention_rate}%"
-            },
-            "categories": category_analysis
-        }
+        result = hazard_result(req, total_valid, unhandled_count, category_analysis)
         save_debug_json(result, "part2_hazards")
         return result
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if conn: conn.close()
 
-@app.post("/report/part3_trends")
-def report_part3_trends(req: ReportRequest):
+@app.post("/report/part2_hazards")
+async def report_part2_hazards(req: ReportRequest, response: Response, profile: bool = False):
+    return await serve_report("part2_hazards", req, response, profile)
+
+def trend_periods(req: ReportRequest):
+    """计算本期与上一对比周期的时间范围 (Unix 时间戳, 左闭右开) 以及本期天数"""
+    curr_s = datetime.datetime.strptime(req.start_date, "%Y-%m-%d")
+    curr_e_incl = datetime.datetime.strptime(req.end_date, "%Y-%m-%d")
+    curr_e_excl = curr_e_incl + datetime.timedelta(days=1)
+
+    curr_s_ts = int(curr_s.replace(tzinfo=datetime.timezone.utc).timestamp())
+    curr_e_ts = int(curr_e_excl.replace(tzinfo=datetime.timezone.utc).timestamp())
+
+    days_count = (curr_e_incl - curr_s).days + 1
+
+    # Previous Period
+    duration = curr_e_excl - curr_s
+
+    # 智能识别自然月逻辑：如果开始日期是1号，且结束日期（excl）也是1号，则认为是整月比较
+    # 这种情况下，上一周期应取自然月的前几个月，而不是简单的减去天数
+    prev_s = None
+    prev_e_excl = curr_s
+
+    if curr_s.day == 1 and curr_e_excl.day == 1:
+        try:
+            # 计算跨越的月数
+            num_months = (curr_e_excl.year - curr_s.year) * 12 + (curr_e_excl.month - curr_s.month)
+            if num_months > 0:
+                # 计算前一周期的起始时间： curr_s 减去 num_months
+                # 公式：Month = month - 1 - delta, Year = year + month // 12, Month = month % 12 + 1
+                m_new = curr_s.month - 1 - num_months
+                y_new = curr_s.year + m_new // 12
+                m_new = m_new % 12 + 1
+                prev_s = datetime.datetime(y_new, m_new, 1)
+        except Exception as e:
+            print(f"Error in month calculation: {str(e)}, falling back to day diff")
+
+    # 如果不是整月或计算失败，使用按天平移
+    if prev_s is None:
+        prev_s = curr_s - duration
+
+    prev_s_ts = int(prev_s.replace(tzinfo=datetime.timezone.utc).timestamp())
+    prev_e_ts = int(prev_e_excl.replace(tzinfo=datetime.timezone.utc).timestamp())
+
+    return {
+        "curr": (curr_s_ts, curr_e_ts),
+        "prev": (prev_s_ts, prev_e_ts),
+        "days": days_count
+    }
+
+@request_timing.timed("aggregate")
+def split_trend_rows(rows):
     """
-    Generate Part 3: Trend Analysis (Detailed for Report Section 3)
-    Includes: Cycle Comparison, Workshop Rankings (Red/Black/Green), Device Trends
+    将 GROUPING SETS 查询结果拆分为本期/上期的统计数据。
+    每行: (is_curr, telename, devicetype, g_station, g_device, total, skylight, non_skylight, processed)
+    g_station / g_device 为 GROUPING() 标记: 两者皆为 1 表示全局汇总行。
     """
-    conn = None
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # 1. Date Calculations
-        curr_s = datetime.datetime.strptime(req.start_date, "%Y-%m-%d")
-        curr_e_incl = datetime.datetime.strptime(req.end_date, "%Y-%m-%d")
-        curr_e_excl = curr_e_incl + datetime.timedelta(days=1)
-        
-        curr_s_ts = int(curr_s.replace(tzinfo=datetime.timezone.utc).timestamp())
-        curr_e_ts = int(curr_e_excl.replace(tzinfo=datetime.timezone.utc).timestamp())
-        
-        days_count = (curr_e_incl - curr_s).days + 1
-        
-        # Previous Period
-        duration = curr_e_excl - curr_s
-        
-        # 智能识别自然月逻辑：如果开始日期是1号，且结束日期（excl）也是1号，则认为是整月比较
-        # 这种情况下，上一周期应取自然月的前几个月，而不是简单的减去天数
-        prev_s = None
-        prev_e_excl = curr_s
+    periods = {
+        flag: {
+            "global": {"total": 0, "skylight": 0, "non_skylight": 0, "processed": 0},
+            "stations": [],  # list of (name, total, processed)
+            "devices": []    # list of (devicetype, total)
+        }
+        for flag in (1, 0)
+    }
+    for is_curr, telename, dtype, g_station, g_device, total, skylight, non_skylight, processed in rows:
+        data = periods[is_curr]
+        if g_station == 0:
+            data["stations"].append((telename, total, processed))
+        elif g_device == 0:
+            data["devices"].append((dtype, total))
+        else:
+            data["global"] = {
+                "total": total,
+                "skylight": skylight or 0,
+                "non_skylight": non_skylight or 0,
+                "processed": processed or 0
+            }
+    return periods[1], periods[0]
+
+@request_timing.timed("aggregate")
+def build_trends(req: ReportRequest, config, days_count, curr_data, prev_data):
+    """根据本期与上期的统计数据生成第三部分 (趋势分析)"""
+    # 3. Processing Section 1: Cycle Indicators
+    def calc_kpi(c_data, p_data, days):
+         # Access inner "global" dict
+        c = c_data["global"]
+        p = p_data["global"]
+
+        def safe_rate(num, denom): return round((num / denom * 100), 1) if denom > 0 else 0.0
+        def daily_avg(total, d): return round(total / d, 1) if d > 0 else 0
+
+        # Growth format
+        def growth(curr, prev):
+            if prev == 0: return "100.0%" if curr > 0 else "0.0%"
+            diff = ((curr - prev) / prev) * 100
+            return f"{diff:+.1f}%"
+
+        return {
+            "daily_avg_total": {
+                "curr": daily_avg(c["total"], days),
+                "prev": daily_avg(p["total"], days),
+                "growth": growth(daily_avg(c["total"], days), daily_avg(p["total"], days))
+            },
+            "skylight_count": {
+                "curr": c["skylight"], 
+                "prev": p["skylight"],
+                "growth": growth(c["skylight"], p["skylight"])
+            },
+            "non_skylight_count": {
+                "curr": c["non_skylight"],
+                "prev": p["non_skylight"],
+                "growth": growth(c["non_skylight"], p["non_skylight"])
+            },
+            "process_rate": {
+                "curr": f"{safe_rate(c['processed'], c['total'])}%",
+                "prev": f"{safe_rate(p['processed'], p['total'])}%",
+                "diff_pp": f"{safe_rate(c['processed'], c['total']) - safe_rate(p['processed'], p['total']):+.1f} pp"
+            }
+        }
 
-        if curr_s.day == 1 and curr_e_excl.day == 1:
-            try:
-                # 计算跨越的月数
-                num_months = (curr_e_excl.year - curr_s.year) * 12 + (curr_e_excl.month - curr_s.month)
-                if num_months > 0:
-                    # 计算前一周期的起始时间： curr_s 减去 num_months
-                    # 公式：Month = month - 1 - delta, Year = year + month // 12, Month = month % 12 + 1
-                    m_new = curr_s.month - 1 - num_months
-                    y_new = curr_s.year + m_new // 12
-                    m_new = m_new % 12 + 1
-                    prev_s = datetime.datetime(y_new, m_new, 1)
-            except Exception as e:
-                print(f"Error in month calculation: {str(e)}, falling back to day diff")
-        
-        # 如果不是整月或计算失败，使用按天平移
-        if prev_s is None:
-            prev_s = curr_s - duration
-        
-        prev_s_ts = int(prev_s.replace(tzinfo=datetime.timezone.utc).timestamp())
-        prev_e_ts = int(prev_e_excl.replace(tzinfo=datetime.timezone.utc).timestamp())
+    kpi_stats = calc_kpi(curr_data, prev_data, days_count)
 
-        # 2. Data Fetching Helper
-        def fetch_period_data(t_start, t_end):
-            data = {}
-            
-            # A. Global Stats (Total, Skylight, Non-Skylight, Processed)
-            # maintanceflag != 0 -> Skylight
-            # processstatus != 0 -> Processed (Fixed typo: processtatus -> processstatus)
-            try:
-                sql_global = """
-                    SELECT 
-                        count(*) as total,
-                        sum(case when maintanceflag != 0 then 1 else 0 end) as skylight,
-                        sum(case when maintanceflag = 0 or maintanceflag is null then 1 else 0 end) as non_skylight,
-                        sum(case when processstatus != 0 then 1 else 0 end) as processed
-                    FROM ALARM
-                    WHERE createtime >= :1 AND createtime < :2
-                """
-                cursor.execute(sql_global, [t_start, t_end])
-                row = cursor.fetchone()
-                data["global"] = {
-                    "total": row[0],
-                    "skylight": row[1] or 0,
-                    "non_skylight": row[2] or 0,
-                    "processed": row[3] or 0
-                }
-            except Exception as e:
-                print(f"Global stats query failed: {e}")
-                data["global"] = {"total": 0, "skylight": 0, "non_skylight": 0, "processed": 0}
+    # 4. Processing Section 2: Workshop Analysis
+    def aggregate_workshops(station_rows):
+        ws_stats = collections.defaultdict(lambda: {"total": 0, "processed": 0})
+        for row in station_rows:
+            cnt = row[1]
+            proc = row[2] or 0
 
-            # B. Workshop Stats (Group by Station -> Map to Workshop later)
-            try:
-                sql_station = """
-                    SELECT telename, count(*), sum(case when processstatus != 0 then 1 else 0 end)
-                    FROM ALARM
-                    WHERE createtime >= :1 AND createtime < :2
-                    GROUP BY telename
-                """
-                cursor.execute(sql_station, [t_start, t_end])
-                data["stations"] = cursor.fetchall() # list of (name, total, processed)
-            except Exception:
-                data["stations"] = []
+            ws_name = config.stations.workshop(row[0], "Unknown Workshop") if row[0] else "Unknown Workshop"
 
-            # C. Device Type Stats
-            try:
-                sql_device = """
-                    SELECT devicetype, count(*)
-                    FROM ALARM
-                    WHERE createtime >= :1 AND createtime < :2
-                    GROUP BY devicetype
-                """
-                cursor.execute(sql_device, [t_start, t_end])
-                data["devices"] = cursor.fetchall()
-            except Exception:
-                data["devices"] = []
-                
-            return data
-
-        curr_data = fetch_period_data(curr_s_ts, curr_e_ts)
-        prev_data = fetch_period_data(prev_s_ts, prev_e_ts)
-
-        # 3. Processing Section 1: Cycle Indicators
-        def calc_kpi(c_data, p_data, days):
-             # Access inner "global" dict
-            c = c_data["global"]
-            p = p_data["global"]
-            
-            def safe_rate(num, denom): return round((num / denom * 100), 1) if denom > 0 else 0.0
-            def daily_avg(total, d): return round(total / d, 1) if d > 0 else 0
-            
-            # Growth format
-            def growth(curr, prev):
-                if prev == 0: return "100.0%" if curr > 0 else "0.0%"
-                diff = ((curr - prev) / prev) * 100
-                return f"{diff:+.1f}%"
-
-            return {
-                "daily_avg_total": {
-                    "curr": daily_avg(c["total"], days),
-                    "prev": daily_avg(p["total"], days),
-                    "growth": growth(daily_avg(c["total"], days), daily_avg(p["total"], days))
-                },
-                "skylight_count": {
-                    "curr": c["skylight"], 
-                    "prev": p["skylight"],
-                    "growth": growth(c["skylight"], p["skylight"])
-                },
-                "non_skylight_count": {
-                    "curr": c["non_skylight"],
-                    "prev": p["non_skylight"],
-                    "growth": growth(c["non_skylight"], p["non_skylight"])
-                },
-                "process_rate": {
-                    "curr": f"{safe_rate(c['processed'], c['total'])}%",
-                    "prev": f"{safe_rate(p['processed'], p['total'])}%",
-                    "diff_pp": f"{safe_rate(c['processed'], c['total']) - safe_rate(p['processed'], p['total']):+.1f} pp"
-                }
-            }
+            ws_stats[ws_name]["total"] += cnt
+            ws_stats[ws_name]["processed"] += proc
+        return ws_stats
 
-        kpi_stats = calc_kpi(curr_data, prev_data, days_count)
-
-        # 4. Processing Section 2: Workshop Analysis
-        def aggregate_workshops(station_rows):
-            ws_stats = collections.defaultdict(lambda: {"total": 0, "processed": 0})
-            for row in station_rows:
-                st_name = row[0].strip() if row[0] else "Unknown"
-                cnt = row[1]
-                proc = row[2] or 0
-                
-                info = STATION_MAP.get(st_name, {})
-                ws_name = info.get("workshop", "Unknown Workshop")
-                
-                ws_stats[ws_name]["total"] += cnt
-                ws_stats[ws_name]["processed"] += proc
-            return ws_stats
-
-        curr_ws = aggregate_workshops(curr_data["stations"])
-        prev_ws = aggregate_workshops(prev_data["stations"])
-
-        # Compare and List
-        ws_comparison = []
-        all_workshops = set(list(curr_ws.keys()) + list(prev_ws.keys()))
-        
-        for ws in all_workshops:
-            if ws == "Unknown Workshop": continue
-            
-            c = curr_ws.get(ws, {"total": 0, "processed": 0})
-            p = prev_ws.get(ws, {"total": 0, "processed": 0})
-            
-            if c["total"] == 0 and p["total"] == 0: continue
-            
-            c_rate = (c["processed"] / c["total"] * 100) if c["total"] > 0 else 0.0
-            p_rate = (p["processed"] / p["total"] * 100) if p["total"] > 0 else 0.0
-            
-            ws_comparison.append({
-                "workshop": ws,
-                "total_alarms": c["total"],
-                "curr_rate": round(c_rate, 1),
-                "prev_rate": round(p_rate, 1),
-                "diff_pp": round(c_rate - p_rate, 1)
-            })
+    curr_ws = aggregate_workshops(curr_data["stations"])
+    prev_ws = aggregate_workshops(prev_data["stations"])
 
-        # Sort lists for Red/Black/Green boards
-        # Red: Lowest processing rate (with some volume > 0)
-        valid_ws = [w for w in ws_comparison if w["total_alarms"] > 0]
-        
-        # Sort by rate ascending (Lowest first)
-        lowest_rate_list = sorted(valid_ws, key=lambda x: x["curr_rate"])[:5]
-        
-        # Sort by rate drop (Biggest drop first -> most negative diff)
-        biggest_drop_list = sorted(valid_ws, key=lambda x: x["diff_pp"])[:5]
-        
-        # Sort by rate descending (Best first)
-        best_rate_list = sorted(valid_ws, key=lambda x: x["curr_rate"], reverse=True)[:5]
-        
-        # Sort by growth in rate (Best improvement)
-        best_improvement_list = sorted(valid_ws, key=lambda x: x["diff_pp"], reverse=True)[:5]
+    # Compare and List
+    ws_comparison = []
+    all_workshops = set(list(curr_ws.keys()) + list(prev_ws.keys()))
 
+    # 按车间名遍历，各排行榜中比率相同的车间按名称先后 (sorted 为稳定排序)
+    for ws in sorted(all_workshops):
+        if ws == "Unknown Workshop": continue
 
-        # 5. Processing Section 3: Device Trends
-        def aggregate_devices(device_rows):
-             # Cats: switch, signal, track, control, power
-            cats = {"switch": 0, "signal": 0, "track": 0, "control": 0, "power": 0, "other": 0}
-            
-            # Helper set for fast lookup
-            # Using the same Mapping as Part 2 roughly
-            mapping_sets = {
-                "switch": {1, 23, 51},
-                "signal": {4, 40, 3},
-                "track": {15, 16, 26, 9, 44, 65, 7, 22},
-                "control": {24, 25, 27, 32, 33, 34, 54, 61, 64, 68, 21, 19, 57, 58, 59, 71}, 
-                "power": {5, 6, 14, 18, 28, 66, 43}
-            }
+        c = curr_ws.get(ws, {"total": 0, "processed": 0})
+        p = prev_ws.get(ws, {"total": 0, "processed": 0})
 
-            for row in device_rows:
-                dtype = row[0]
-                cnt = row[1]
-                
-                found = False
-                for cat_name, id_set in mapping_sets.items():
-                    if dtype in id_set:
-                        cats[cat_name] += cnt
-                        found = True
-                        break
-                
-                if not found:
-                    cats["other"] += cnt
-                    
-            return cats
-
-        curr_dev = aggregate_devices(curr_data["devices"])
-        prev_dev = aggregate_devices(prev_data["devices"])
-        
-        device_trends = []
-        # Chinese Name Mapping
-        cat_cn_map = {
-            "switch": "道岔设备",
-            "signal": "信号设备",
-            "track": "轨道电路",
-            "control": "控制系统",
-            "power": "电源设备"
-        }
+        if c["total"] == 0 and p["total"] == 0: continue
 
-        for cat in ["switch", "signal", "track", "control", "power"]:
-            c_cnt = curr_dev[cat]
-            p_cnt = prev_dev[cat]
-            
-            trend_pct = "0%"
-            if p_cnt > 0:
-                trend_pct = f"{((c_cnt - p_cnt)/p_cnt * 100):+.1f}%"
-            elif c_cnt > 0:
-                trend_pct = "+100%"
-                
-            device_trends.append({
-                "device_type": cat_cn_map.get(cat, cat),
-                "curr_count": c_cnt,
-                "prev_count": p_cnt,
-                "trend": trend_pct
-            })
+        c_rate = (c["processed"] / c["total"] * 100) if c["total"] > 0 else 0.0
+        p_rate = (p["processed"] / p["total"] * 100) if p["total"] > 0 else 0.0
+
+        ws_comparison.append({
+            "workshop": ws,
+            "total_alarms": c["total"],
+            "curr_rate": round(c_rate, 1),
+            "prev_rate": round(p_rate, 1),
+            "diff_pp": round(c_rate - p_rate, 1)
+        })
+
+    # Sort lists for Red/Black/Green boards
+    # Red: Lowest processing rate (with some volume > 0)
+    valid_ws = [w for w in ws_comparison if w["total_alarms"] > 0]
+
+    # Sort by rate ascending (Lowest first)
+    lowest_rate_list = sorted(valid_ws, key=lambda x: x["curr_rate"])[:5]
+
+    # Sort by rate drop (Biggest drop first -> most negative diff)
+    biggest_drop_list = sorted(valid_ws, key=lambda x: x["diff_pp"])[:5]
+
+    # Sort by rate descending (Best first)
+    best_rate_list = sorted(valid_ws, key=lambda x: x["curr_rate"], reverse=True)[:5]
+
+    # Sort by growth in rate (Best improvement)
+    best_improvement_list = sorted(valid_ws, key=lambda x: x["diff_pp"], reverse=True)[:5]
+
+
+    # 5. Processing Section 3: Device Trends
+    def aggregate_devices(device_rows):
+        cats = {cat: 0 for cat in DEVICE_CATEGORY_NAMES}
+        for row in device_rows:
+            cats[DEVICE_CATEGORY.get(row[0], "other")] += row[1]
+        return cats
+
+    curr_dev = aggregate_devices(curr_data["devices"])
+    prev_dev = aggregate_devices(prev_data["devices"])
+
+    device_trends = []
+    for cat in ["switch", "signal", "track", "control", "power"]:
+        c_cnt = curr_dev[cat]
+        p_cnt = prev_dev[cat]
+
+        trend_pct = "0%"
+        if p_cnt > 0:
+            trend_pct = f"{((c_cnt - p_cnt)/p_cnt * 100):+.1f}%"
+        elif c_cnt > 0:
+            trend_pct = "+100%"
+
+        device_trends.append({
+            "device_type": DEVICE_CATEGORY_NAMES[cat],
+            "curr_count": c_cnt,
+            "prev_count": p_cnt,
+            "trend": trend_pct
+        })
 
 
-        result = {
-            "period": f"{req.start_date} to {req.end_date}",
-            "kpi_comparison": kpi_stats,
-            "workshop_analysis": {
-                "red_board_candidates": {
-                    "lowest_process_rate": lowest_rate_list,
-                    "biggest_quality_drop": biggest_drop_list
-                },
-                "green_board_candidates": {
-                    "highest_process_rate": best_rate_list,
-                    "best_improvement": best_improvement_list
-                },
-                "full_ranking": sorted(ws_comparison, key=lambda x: x["curr_rate"]) 
+    result = {
+        "period": f"{req.start_date} to {req.end_date}",
+        "kpi_comparison": kpi_stats,
+        "workshop_analysis": {
+            "red_board_candidates": {
+                "lowest_process_rate": lowest_rate_list,
+                "biggest_quality_drop": biggest_drop_list
             },
-            "device_trends": device_trends
-        }
-        
+            "green_board_candidates": {
+                "highest_process_rate": best_rate_list,
+                "best_improvement": best_improvement_list
+            },
+            "full_ranking": sorted(ws_comparison, key=lambda x: x["curr_rate"]) 
+        },
+        "device_trends": device_trends
+    }
+
+    return result
+
+# 设备大类 (第三部分设备趋势与多周期趋势共用)，未列出的 devicetype 归为 other
+DEVICE_CATEGORY_SETS = {
+    "switch": {1, 23, 51},
+    "signal": {4, 40, 3},
+    "track": {15, 16, 26, 9, 44, 65, 7, 22},
+    "control": {24, 25, 27, 32, 33, 34, 54, 61, 64, 68, 21, 19, 57, 58, 59, 71},
+    "power": {5, 6, 14, 18, 28, 66, 43}
+}
+DEVICE_CATEGORY_NAMES = {
+    "switch": "道岔设备",
+    "signal": "信号设备",
+    "track": "轨道电路",
+    "control": "控制系统",
+    "power": "电源设备",
+    "other": "其他设备"
+}
+# devicetype -> 大类
+DEVICE_CATEGORY = {dtype: cat for cat, ids in DEVICE_CATEGORY_SETS.items() for dtype in ids}
+
+# 第三部分所需的日汇总维度
+TREND_FACT_DIMS = ("telename", "devicetype", "skylight", "processed")
+
+@request_timing.timed("aggregate")
+def trend_data_from_facts(rows):
+    """把 (telename, devicetype, skylight, processed, cnt) 事实行整理为单个周期的统计数据"""
+    g = {"total": 0, "skylight": 0, "non_skylight": 0, "processed": 0}
+    stations = collections.defaultdict(lambda: [0, 0])
+    devices = collections.defaultdict(int)
+    for telename, dtype, skylight, processed, cnt in rows:
+        g["total"] += cnt
+        if skylight:
+            g["skylight"] += cnt
+        else:
+            g["non_skylight"] += cnt
+        st = stations[telename]
+        st[0] += cnt
+        if processed:
+            g["processed"] += cnt
+            st[1] += cnt
+        devices[dtype] += cnt
+    return {
+        "global": g,
+        "stations": [(name, v[0], v[1]) for name, v in stations.items()],
+        "devices": list(devices.items())
+    }
+
+async def compute_trends(req: ReportRequest):
+    """
+    Generate Part 3: Trend Analysis (Detailed for Report Section 3)
+    Includes: Cycle Comparison, Workshop Rankings (Red/Black/Green), Device Trends
+    """
+    try:
+        # 整个计算过程使用同一版本的基础配置
+        config = BASE_CONFIG
+
+        # 1. Date Calculations
+        periods = trend_periods(req)
+        curr_s_ts, curr_e_ts = periods["curr"]
+        prev_s_ts = periods["prev"][0]
+
+        # 两个周期都能由日汇总库覆盖时不再扫描 ALARM
+        curr_plan = await rollup_plan(curr_s_ts, curr_e_ts)
+        prev_plan = await rollup_plan(prev_s_ts, curr_s_ts)
+        if curr_plan is not None and prev_plan is not None:
+            curr_rows, prev_rows = await asyncio.gather(
+                rollup_facts(curr_plan, TREND_FACT_DIMS),
+                rollup_facts(prev_plan, TREND_FACT_DIMS)
+            )
+            result = build_trends(
+                req, config, periods["days"], trend_data_from_facts(curr_rows), trend_data_from_facts(prev_rows)
+            )
+            save_debug_json(result, "part3_trends")
+            return result
+
+        # 2. Data Fetching
+        # 上期与本期首尾相接，一次范围扫描读取两个周期，用 CASE 标记所属周期，
+        # 再用 GROUPING SETS 同时得到全局 / 按车站 / 按设备类型三个层级的汇总。
+        # maintanceflag != 0 -> Skylight
+        # processstatus != 0 -> Processed (Fixed typo: processtatus -> processstatus)
+        sql_trend = """
+            SELECT
+                is_curr, telename, devicetype,
+                GROUPING(telename) as g_station,
+                GROUPING(devicetype) as g_device,
+                count(*) as total,
+                sum(case when maintanceflag != 0 then 1 else 0 end) as skylight,
+                sum(case when maintanceflag = 0 or maintanceflag is null then 1 else 0 end) as non_skylight,
+                sum(case when processstatus != 0 then 1 else 0 end) as processed
+            FROM (
+                SELECT
+                    case when createtime >= :curr_s then 1 else 0 end as is_curr,
+                    telename, devicetype, maintanceflag, processstatus
+                FROM ALARM
+                WHERE createtime >= :prev_s AND createtime < :curr_e
+            )
+            GROUP BY GROUPING SETS ((is_curr), (is_curr, telename), (is_curr, devicetype))
+        """
+        binds = {"curr_s": curr_s_ts, "prev_s": prev_s_ts, "curr_e": curr_e_ts}
+
+        try:
+            (rows,) = await run_queries(("part3.trends", sql_trend, binds))
+        except Exception as e:
+            print(f"Trend stats query failed: {e}")
+            rows = []
+        curr_data, prev_data = split_trend_rows(rows)
+
+        result = build_trends(req, config, periods["days"], curr_data, prev_data)
         save_debug_json(result, "part3_trends")
         return result
 
@@ -1003,121 +2157,371 @@ def report_part3_trends(req: ReportRequest):
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if conn: conn.close()
 
-@app.post("/report/part4_skylight")
-def report_part4_skylight(req: ReportRequest):
+@app.post("/report/part3_trends")
+async def report_part3_trends(req: ReportRequest, response: Response, profile: bool = False):
+    return await serve_report("part3_trends", req, response, profile)
+
+# --- 多周期趋势 (时间序列) ---
+
+TREND_SERIES_BUCKETS = ("day", "week", "month")
+# 单次请求的最大范围 (天)，一年的周序列约 53 个桶
+TREND_SERIES_MAX_DAYS = 366
+
+class TrendSeriesRequest(ReportRequest):
+    bucket: str = "week"
+
+def series_buckets(start_date, end_date, bucket):
+    """
+    把 [start_date, end_date] 按天 / ISO 周 / 自然月切分，返回 [(标签, 起始日序号, 结束日序号)] (日序号自 1970-01-01 起，左闭右开)。
+    首尾两个桶截取到范围内，可能不满一周 / 一月。
+    """
+    epoch = datetime.date(1970, 1, 1)
+    day = datetime.datetime.strptime(start_date, "%Y-%m-%d").date()
+    end = datetime.datetime.strptime(end_date, "%Y-%m-%d").date() + datetime.timedelta(days=1)
+    buckets = []
+    while day < end:
+        if bucket == "day":
+            nxt = day + datetime.timedelta(days=1)
+            label = day.isoformat()
+        elif bucket == "week":
+            nxt = day + datetime.timedelta(days=7 - day.weekday())
+            iso_year, iso_week, _ = day.isocalendar()
+            label = f"{iso_year}-W{iso_week:02d}"
+        else:
+            nxt = (day.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+            label = day.strftime("%Y-%m")
+        nxt = min(nxt, end)
+        buckets.append((label, (day - epoch).days, (nxt - epoch).days))
+        day = nxt
+    return buckets
+
+def series_sql(buckets, bucket):
+    """
+    一次范围扫描按桶分组: 天 / 周按固定宽度由 createtime 直接算出桶号 (起点对齐到首个桶的周一)，
+    自然月按各桶边界用 CASE 判断；再用 GROUPING SETS 同时得到按车站与按设备类型的汇总。
+    """
+    day_seconds = rollup_store.DAY_SECONDS
+    binds = {"range_s": buckets[0][1] * day_seconds, "range_e": buckets[-1][2] * day_seconds}
+    if bucket == "month":
+        whens = []
+        for i, (_, _, end_day) in enumerate(buckets[:-1]):
+            binds[f"b{i}"] = end_day * day_seconds
+            whens.append(f"WHEN createtime < :b{i} THEN {i}")
+        bucket_expr = f"CASE {' '.join(whens)} ELSE {len(buckets) - 1} END" if whens else "0"
+    else:
+        width = 7 if bucket == "week" else 1
+        # 首个桶可能从周中开始，按所在周的周一对齐，保证后续桶号与 buckets 一一对应
+        origin_day = buckets[1][1] - width if len(buckets) > 1 else buckets[0][1]
+        binds["origin"] = origin_day * day_seconds
+        binds["width"] = width * day_seconds
+        bucket_expr = "FLOOR((createtime - :origin) / :width)"
+    sql = f"""
+        SELECT
+            bucket, telename, devicetype,
+            GROUPING(telename) as g_station,
+            GROUPING(devicetype) as g_device,
+            count(*) as total,
+            sum(case when maintanceflag != 0 then 1 else 0 end) as skylight,
+            sum(case when processstatus != 0 then 1 else 0 end) as processed
+        FROM (
+            SELECT {bucket_expr} as bucket, telename, devicetype, maintanceflag, processstatus
+            FROM ALARM
+            WHERE createtime >= :range_s AND createtime < :range_e
+        )
+        GROUP BY GROUPING SETS ((bucket, telename), (bucket, devicetype))
+    """
+    return sql, binds
+
+def new_series_buckets(n):
+    """每个桶的累加器: 全局 / 按车间 / 按设备大类的 [total, skylight, processed]"""
+    return [
+        {"global": [0, 0, 0], "workshops": collections.defaultdict(lambda: [0, 0, 0]),
+         "devices": collections.defaultdict(lambda: [0, 0, 0])}
+        for _ in range(n)
+    ]
+
+def _add_counts(target, total, skylight, processed):
+    target[0] += total
+    target[1] += skylight
+    target[2] += processed
+
+@request_timing.timed("aggregate")
+def series_from_rows(stations, acc, rows):
+    """
+    累加 series_sql 的结果行: (bucket, telename, devicetype, g_station, g_device, total, skylight, processed)。
+    按车站的行计入全局与车间，按设备类型的行计入设备大类。
+    """
+    workshops = {}
+    for bucket, telename, dtype, g_station, g_device, total, skylight, processed in rows:
+        data = acc[int(bucket)]
+        skylight = skylight or 0
+        processed = processed or 0
+        if g_station == 0:
+            ws = workshops.get(telename)
+            if ws is None:
+                ws = workshops[telename] = stations.workshop(telename, "Unknown Workshop") if telename else "Unknown Workshop"
+            _add_counts(data["global"], total, skylight, processed)
+            _add_counts(data["workshops"][ws], total, skylight, processed)
+        elif g_device == 0:
+            _add_counts(data["devices"][DEVICE_CATEGORY.get(dtype, "other")], total, skylight, processed)
+
+@request_timing.timed("aggregate")
+def series_from_facts(stations, acc, buckets, rows):
+    """累加日汇总事实行: (day, telename, devicetype, skylight, processed, cnt)"""
+    starts = [start_day for _, start_day, _ in buckets]
+    workshops = {}
+    for day, telename, dtype, skylight, processed, cnt in rows:
+        data = acc[bisect.bisect_right(starts, day) - 1]
+        ws = workshops.get(telename)
+        if ws is None:
+            ws = workshops[telename] = stations.workshop(telename, "Unknown Workshop") if telename else "Unknown Workshop"
+        sky = cnt if skylight else 0
+        proc = cnt if processed else 0
+        _add_counts(data["global"], cnt, sky, proc)
+        _add_counts(data["workshops"][ws], cnt, sky, proc)
+        _add_counts(data["devices"][DEVICE_CATEGORY.get(dtype, "other")], cnt, sky, proc)
+
+def series_kpi(counts):
+    total, skylight, processed = counts
+    return {
+        "total": total,
+        "skylight": skylight,
+        "non_skylight": total - skylight,
+        "processed": processed,
+        "process_rate": round(processed / total * 100, 1) if total > 0 else 0.0
+    }
+
+@request_timing.timed("aggregate")
+def build_trend_series(req: ReportRequest, bucket, buckets, acc):
+    """生成多周期趋势: 每个桶的 KPI 及按车间 / 设备大类的拆分 (两种拆分各自之和等于桶的总数)"""
+    epoch = datetime.date(1970, 1, 1)
+    series = []
+    overall = [0, 0, 0]
+    for (label, start_day, end_day), data in zip(buckets, acc):
+        _add_counts(overall, *data["global"])
+        days = end_day - start_day
+        kpi = series_kpi(data["global"])
+        kpi["daily_avg_total"] = round(kpi["total"] / days, 1)
+        series.append({
+            "bucket": label,
+            "start_date": (epoch + datetime.timedelta(days=start_day)).isoformat(),
+            "end_date": (epoch + datetime.timedelta(days=end_day - 1)).isoformat(),
+            "days": days,
+            "kpi": kpi,
+            "workshops": {ws: series_kpi(counts) for ws, counts in sorted(data["workshops"].items())},
+            "device_categories": {
+                name: series_kpi(data["devices"].get(cat, [0, 0, 0])) for cat, name in DEVICE_CATEGORY_NAMES.items()
+            }
+        })
+    return {
+        "period": f"{req.start_date} to {req.end_date}",
+        "bucket": bucket,
+        "summary": series_kpi(overall),
+        "series": series
+    }
+
+async def compute_trend_series(req: ReportRequest, bucket="week"):
+    """
+    多周期趋势: 范围内按天 / ISO 周 / 自然月分桶的 KPI 时间序列。
+    日汇总库覆盖时按天读取本地汇总后分桶，否则由一条 SQL 在库内分桶汇总。
+    """
+    try:
+        # 整个计算过程使用同一版本的基础配置
+        config = BASE_CONFIG
+        buckets = series_buckets(req.start_date, req.end_date, bucket)
+        acc = new_series_buckets(len(buckets))
+        day_seconds = rollup_store.DAY_SECONDS
+        plan = await rollup_plan(buckets[0][1] * day_seconds, buckets[-1][2] * day_seconds)
+        # 分桶累加与结果构建都不在事件循环中执行: 库内分桶的结果在查询线程中边取数边累加，其余交给线程池
+        if plan is not None:
+            rows = await rollup_facts(plan, TREND_FACT_DIMS, by_day=True)
+            await run_in_threadpool(series_from_facts, config.stations, acc, buckets, rows)
+        else:
+            sql, binds = series_sql(buckets, bucket)
+            await run_queries(("series.buckets", sql, binds, functools.partial(series_from_rows, config.stations, acc)))
+
+        result = await run_in_threadpool(build_trend_series, req, bucket, buckets, acc)
+        save_debug_json(result, f"trend_series_{bucket}")
+        return result
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/report/trend_series")
+async def report_trend_series(req: TrendSeriesRequest, response: Response, profile: bool = False):
+    """多周期趋势 (bucket: day / week / month)，每种分桶方式分别缓存"""
+    if req.bucket not in TREND_SERIES_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of {', '.join(TREND_SERIES_BUCKETS)}")
+    try:
+        start = datetime.datetime.strptime(req.start_date, "%Y-%m-%d")
+        end = datetime.datetime.strptime(req.end_date, "%Y-%m-%d")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    days = (end - start).days + 1
+    if days < 1 or days > TREND_SERIES_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Range must cover 1 to {TREND_SERIES_MAX_DAYS} days")
+    return await serve_report(f"trend_series_{req.bucket}", req, response, profile)
+
+@request_timing.timed("aggregate")
+def build_skylight(req: ReportRequest, config, total_row, sky_row, dev_rows, deep_rows):
+    """根据天窗修相关查询结果生成第四部分；查询失败 (异常对象) 时对应部分留空"""
+    # 1. Statistics Calculation
+    total_period_alarms = 0
+    total_skylight_alarms = 0
+    processed_skylight_alarms = 0
+
+    for r in (total_row, sky_row):
+        if isinstance(r, Exception):
+            print(f"Part 4 Stats Query Error: {r}")
+    if not isinstance(total_row, Exception):
+        total_period_alarms = total_row[0]
+    if sky_row and not isinstance(sky_row, Exception):
+        total_skylight_alarms = sky_row[0]
+        processed_skylight_alarms = sky_row[1] or 0
+
+    # Ratios
+    skylight_ratio = 0.0
+    if total_period_alarms > 0:
+        skylight_ratio = round((total_skylight_alarms / total_period_alarms) * 100, 2)
+
+    process_rate = 0.0
+    if total_skylight_alarms > 0:
+        process_rate = round((processed_skylight_alarms / total_skylight_alarms) * 100, 2)
+
+    # 2. Top Involved Devices (Top 3)
+    top_devices_list = []
+    if not isinstance(dev_rows, Exception):
+        for r in rank_rows(dev_rows):
+            d_name = config.device_types.get(r[0], f"Unknown({r[0]})")
+            top_devices_list.append(d_name)
+
+    # 3. Deep Analysis Data (Top Issues with Station info)
+    detailed_issues = []
+    if not isinstance(deep_rows, Exception):
+        for r in rank_rows(deep_rows):
+            d_name = config.device_types.get(r[2], "Unknown")
+            st_code = r[1].strip() if r[1] else ""
+            st_name = config.stations.name(st_code)
+            detailed_issues.append({
+                "description": r[0],
+                "station": st_name,
+                "device": d_name,
+                "count": r[3]
+            })
+
+    result = {
+        "period": f"{req.start_date} to {req.end_date}",
+        "stats": {
+            "total_period_alarms": total_period_alarms,
+            "total_skylight_alarms": total_skylight_alarms,
+            "skylight_ratio_percent": f"{skylight_ratio}%",
+            "processed_skylight_alarms": processed_skylight_alarms,
+            "process_rate_percent": f"{process_rate}%"
+        },
+        "main_involved_devices": top_devices_list,
+        "detailed_issues_for_analysis": detailed_issues
+    }
+
+    return result
+
+# 第四部分所需的日汇总维度
+SKYLIGHT_FACT_DIMS = ("devicetype", "skylight", "processed")
+
+async def skylight_from_rollup(req: ReportRequest, config, plan):
+    fact_rows, issue_rows = await asyncio.gather(
+        rollup_facts(plan, SKYLIGHT_FACT_DIMS),
+        rollup_read(plan, ROLLUP_STORE.skylight_issues, "rollup.skylight", rollup_store.SKYLIGHT_SQL, rollup_store.project_skylight_issues)
+    )
+    total = 0
+    sky_total = 0
+    sky_processed = 0
+    sky_devices = []
+    for dtype, skylight, processed, cnt in fact_rows:
+        total += cnt
+        if skylight:
+            sky_total += cnt
+            if processed:
+                sky_processed += cnt
+            sky_devices.append((dtype, cnt))
+    return build_skylight(
+        req,
+        config,
+        (total,),
+        (sky_total, sky_processed),
+        top_counts(sky_devices, 3),
+        top_counts(issue_rows, 15)
+    )
+
+async def compute_skylight(req: ReportRequest):
     """
     Generate Part 4: Skylight (Maintenance) Alarm Analysis
     """
-    conn = None
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
+        # 整个计算过程使用同一版本的基础配置
+        config = BASE_CONFIG
+
         start_dt = datetime.datetime.strptime(req.start_date, "%Y-%m-%d")
         end_dt = datetime.datetime.strptime(req.end_date, "%Y-%m-%d") + datetime.timedelta(days=1)
         start_ts = int(start_dt.replace(tzinfo=datetime.timezone.utc).timestamp())
         end_ts = int(end_dt.replace(tzinfo=datetime.timezone.utc).timestamp())
+        binds = [start_ts, end_ts]
+
+        # 已关账的天优先读日汇总库，只有未关账的天回查 Oracle
+        plan = await rollup_plan(start_ts, end_ts)
+        if plan is not None:
+            result = await skylight_from_rollup(req, config, plan)
+            save_debug_json(result, "part4_skylight")
+            return result
+
+        # A. Total Alarms in Period (for Ratio)
+        sql_total = "SELECT count(*) FROM ALARM WHERE createtime >= :1 AND createtime < :2"
+
+        # B. Skylight Stats (maintanceflag != 0)
+        # Count Total & Processed (processstatus != 0)
+        sql_skylight = """
+            SELECT 
+                count(*) as total,
+                sum(case when processstatus != 0 then 1 else 0 end) as processed
+            FROM ALARM
+            WHERE createtime >= :1 AND createtime < :2 AND maintanceflag != 0
+        """
 
-        # 1. Statistics Calculation
-        total_period_alarms = 0
-        total_skylight_alarms = 0
-        processed_skylight_alarms = 0
-        
-        try:
-            # A. Total Alarms in Period (for Ratio)
-            cursor.execute("SELECT count(*) FROM ALARM WHERE createtime >= :1 AND createtime < :2", [start_ts, end_ts])
-            total_period_alarms = cursor.fetchone()[0]
-
-            # B. Skylight Stats (maintanceflag != 0)
-            # Count Total & Processed (processstatus != 0)
-            sql_skylight = """
-                SELECT 
-                    count(*) as total,
-                    sum(case when processstatus != 0 then 1 else 0 end) as processed
-                FROM ALARM
-                WHERE createtime >= :1 AND createtime < :2 AND maintanceflag != 0
-            """
-            cursor.execute(sql_skylight, [start_ts, end_ts])
-            row = cursor.fetchone()
-            if row:
-                total_skylight_alarms = row[0]
-                processed_skylight_alarms = row[1] or 0
-        except Exception as e:
-            print(f"Part 4 Stats Query Error: {e}")
-
-        # Ratios
-        skylight_ratio = 0.0
-        if total_period_alarms > 0:
-            skylight_ratio = round((total_skylight_alarms / total_period_alarms) * 100, 2)
-            
-        process_rate = 0.0
-        if total_skylight_alarms > 0:
-            process_rate = round((processed_skylight_alarms / total_skylight_alarms) * 100, 2)
-
-        # 2. Top Involved Devices (Top 3)
-        top_devices_list = []
-        try:
-            sql_dev = """
-                SELECT devicetype, count(*) as cnt
-                FROM ALARM
-                WHERE createtime >= :1 AND createtime < :2 AND maintanceflag != 0
-                GROUP BY devicetype
-                ORDER BY cnt DESC
-            """
-            # Limit 3
-            sql_dev_lim = f"SELECT * FROM ({sql_dev}) WHERE ROWNUM <= 3"
-            cursor.execute(sql_dev_lim, [start_ts, end_ts])
-            
-            for r in cursor.fetchall():
-                d_name = DEVICE_TYPE_MAP.get(r[0], f"Unknown({r[0]})")
-                top_devices_list.append(d_name)
-        except Exception:
-            pass
+        # C. Top Involved Devices (Limit 3)
+        sql_dev = """
+            SELECT devicetype, count(*) as cnt
+            FROM ALARM
+            WHERE createtime >= :1 AND createtime < :2 AND maintanceflag != 0
+            GROUP BY devicetype
+            ORDER BY cnt DESC, devicetype NULLS FIRST
+        """
+        sql_dev_lim = f"SELECT * FROM ({sql_dev}) WHERE ROWNUM <= 3"
 
-        # 3. Deep Analysis Data (Top Issues with Station info)
+        # D. Deep Analysis Data (Top Issues with Station info)
         # Grouping by (alarmdes, telename) helps identify issues like "Zhaoan Station 2X2 Switch"
-        detailed_issues = []
-        try:
-            sql_deep = """
-                SELECT alarmdes, telename, devicetype, count(*) as cnt
-                FROM ALARM
-                WHERE createtime >= :1 AND createtime < :2 AND maintanceflag != 0
-                GROUP BY alarmdes, telename, devicetype
-                ORDER BY cnt DESC
-            """
-            # Fetch Top 15 for analysis context
-            sql_deep_lim = f"SELECT * FROM ({sql_deep}) WHERE ROWNUM <= 15"
-            cursor.execute(sql_deep_lim, [start_ts, end_ts])
-            
-            for r in cursor.fetchall():
-                d_name = DEVICE_TYPE_MAP.get(r[2], "Unknown")
-                st_code = r[1].strip() if r[1] else ""
-                st_name = STATION_MAP.get(st_code, {}).get("name", st_code)
-                detailed_issues.append({
-                    "description": r[0],
-                    "station": st_name,
-                    "device": d_name,
-                    "count": r[3]
-                })
-        except Exception:
-            pass
-
-        result = {
-            "period": f"{req.start_date} to {req.end_date}",
-            "stats": {
-                "total_period_alarms": total_period_alarms,
-                "total_skylight_alarms": total_skylight_alarms,
-                "skylight_ratio_percent": f"{skylight_ratio}%",
-                "processed_skylight_alarms": processed_skylight_alarms,
-                "process_rate_percent": f"{process_rate}%"
-            },
-            "main_involved_devices": top_devices_list,
-            "detailed_issues_for_analysis": detailed_issues
-        }
-        
+        sql_deep = """
+            SELECT alarmdes, telename, devicetype, count(*) as cnt
+            FROM ALARM
+            WHERE createtime >= :1 AND createtime < :2 AND maintanceflag != 0
+            GROUP BY alarmdes, telename, devicetype
+            ORDER BY cnt DESC, NLSSORT(alarmdes, 'NLS_SORT=BINARY') NULLS FIRST,
+                     NLSSORT(telename, 'NLS_SORT=BINARY') NULLS FIRST, devicetype NULLS FIRST
+        """
+        # Fetch Top 15 for analysis context
+        sql_deep_lim = f"SELECT * FROM ({sql_deep}) WHERE ROWNUM <= 15"
+
+        # 四条查询互不依赖，并发执行；单条失败时对应部分留空
+        total_row, sky_row, dev_rows, deep_rows = await run_queries(
+            ("part4.total", sql_total, binds, "one"),
+            ("part4.skylight", sql_skylight, binds, "one"),
+            ("part4.devices", sql_dev_lim, binds),
+            ("part4.deep_issues", sql_deep_lim, binds),
+            return_exceptions=True
+        )
+
+        result = build_skylight(req, config, total_row, sky_row, dev_rows, deep_rows)
         save_debug_json(result, "part4_skylight")
         return result
 
@@ -1128,8 +2532,542 @@ def report_part4_skylight(req: ReportRequest):
         err_res = {"error": str(e)}
         save_debug_json(err_res, "part4_skylight_error")
         raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/report/part4_skylight")
+async def report_part4_skylight(req: ReportRequest, response: Response, profile: bool = False):
+    return await serve_report("part4_skylight", req, response, profile)
+
+def build_full_report(req: ReportRequest, config, days_count, scan_rows, hazards_in_sql=False):
+    """
+    由共享扫描的细粒度聚合结果在内存中派生四个部分。
+    各部分按单独接口的 SQL 口径重新汇总后交给同一套 build_* 函数，输出与单独调用完全一致。
+    hazards_in_sql=True 时第二部分的分类排名由调用方以 hazard_ranking_query 另行取得 (与单独接口同一路径)，
+    这里只统计概览，categories 留空。
+    """
+    # 第一部分: (telename, alarmlevel, devicetype, alarmdes, alarmtype) 及按 alarmdes 的 Top 10
+    p1_rows = collections.defaultdict(int)
+    p1_top = collections.defaultdict(int)
+
+    # 第二部分: 非天窗报警 (maintanceflag = 0 或为空)
+    p2_rows = collections.defaultdict(int)
+    total_valid = 0
+    unhandled_count = 0
+
+    # 第三部分: 本期 (1) 与上期 (0)
+    trend_acc = {
+        flag: {
+            "global": {"total": 0, "skylight": 0, "non_skylight": 0, "processed": 0},
+            "stations": collections.defaultdict(lambda: [0, 0]),
+            "devices": collections.defaultdict(int)
+        }
+        for flag in (1, 0)
+    }
+
+    # 第四部分: 天窗报警 (maintanceflag != 0)
+    sky_total = 0
+    sky_processed = 0
+    sky_devices = collections.defaultdict(int)
+    sky_issues = collections.defaultdict(int)
+
+    for is_curr, telename, level, dtype, atype, asubtype, des, devname, skylight, processed, cnt in scan_rows:
+        acc = trend_acc[is_curr]
+        g = acc["global"]
+        g["total"] += cnt
+        if skylight:
+            g["skylight"] += cnt
+        else:
+            g["non_skylight"] += cnt
+        if processed:
+            g["processed"] += cnt
+        st = acc["stations"][telename]
+        st[0] += cnt
+        if processed:
+            st[1] += cnt
+        acc["devices"][dtype] += cnt
+
+        if not is_curr:
+            continue
+
+        p1_rows[(telename, level, dtype, des, atype)] += cnt
+        p1_top[des] += cnt
+
+        if skylight:
+            sky_total += cnt
+            if processed:
+                sky_processed += cnt
+            sky_devices[dtype] += cnt
+            sky_issues[(des, telename, dtype)] += cnt
+        else:
+            total_valid += cnt
+            if not processed:
+                unhandled_count += cnt
+            if not hazards_in_sql:
+                p2_rows[(dtype, des, telename, atype, asubtype, devname)] += cnt
+
+    part1 = build_alarm_stats(
+        req,
+        config,
+        [(*k, v) for k, v in p1_rows.items()],
+        top_counts(p1_top.items(), 10)
+    )
+
+    if hazards_in_sql:
+        part2 = hazard_result(req, total_valid, unhandled_count, None)
+    else:
+        part2 = build_hazards(req, config, total_valid, unhandled_count, [(*k, v) for k, v in p2_rows.items()])
+
+    def period_data(flag):
+        acc = trend_acc[flag]
+        return {
+            "global": acc["global"],
+            "stations": [(name, v[0], v[1]) for name, v in acc["stations"].items()],
+            "devices": list(acc["devices"].items())
+        }
+
+    part3 = build_trends(req, config, days_count, period_data(1), period_data(0))
+
+    part4 = build_skylight(
+        req,
+        config,
+        (trend_acc[1]["global"]["total"],),
+        (sky_total, sky_processed),
+        top_counts(sky_devices.items(), 3),
+        top_counts(((*k, v) for k, v in sky_issues.items()), 15)
+    )
+
+    return {
+        "period": f"{req.start_date} to {req.end_date}",
+        "part1_overview": part1,
+        "part2_hazards": part2,
+        "part3_trends": part3,
+        "part4_skylight": part4
+    }
+
+async def compute_full_report(req: ReportRequest):
+    """
+    Generate all four parts from a single shared scan of ALARM
+    """
+    try:
+        # 四个部分使用同一版本的基础配置
+        config = BASE_CONFIG
+        periods = trend_periods(req)
+        curr_s_ts, curr_e_ts = periods["curr"]
+        prev_s_ts, prev_e_ts = periods["prev"]
+
+        # 上期与本期首尾相接 (prev_e == curr_s)，一次范围扫描覆盖 [上期开始, 本期结束)。
+        # 上期只参与趋势对比，细粒度字段置空，使其只按 (车站, 设备类型, 天窗, 处理状态) 聚合。
+        # 天窗/处理状态在库内折算为 0/1，避免原始取值放大分组数。
+        sql_scan = """
+            SELECT is_curr, telename, alarmlevel, devicetype, alarmtype, alarmsubtype,
+                   alarmdes, devicename, skylight, processed, count(*) as cnt
+            FROM (
+                SELECT
+                    case when createtime >= :curr_s then 1 else 0 end as is_curr,
+                    telename,
+                    devicetype,
+                    case when createtime >= :curr_s then alarmlevel end as alarmlevel,
+                    case when createtime >= :curr_s then alarmtype end as alarmtype,
+                    case when createtime >= :curr_s then alarmsubtype end as alarmsubtype,
+                    case when createtime >= :curr_s then alarmdes end as alarmdes,
+                    case when createtime >= :curr_s then devicename end as devicename,
+                    case when maintanceflag != 0 then 1 else 0 end as skylight,
+                    case when processstatus != 0 then 1 else 0 end as processed
+                FROM ALARM
+                WHERE createtime >= :scan_s AND createtime < :scan_e
+            )
+            GROUP BY is_curr, telename, alarmlevel, devicetype, alarmtype, alarmsubtype,
+                     alarmdes, devicename, skylight, processed
+        """
+        binds = {"curr_s": curr_s_ts, "scan_s": prev_s_ts, "scan_e": curr_e_ts}
+
+        # 扫描结果在取数的同时汇总，不整体驻留内存。
+        # 第二部分排名在库内完成时，与 /report/part2_hazards 使用同一条排名查询 (与扫描并发执行)，两者输出一致。
+        hazards_in_sql = CLASSIFY_CONFIG["hazards_top_n_in_sql"]
+        scan = ("full.scan", sql_scan, binds,
+                functools.partial(build_full_report, req, config, periods["days"], hazards_in_sql=hazards_in_sql))
+        if hazards_in_sql:
+            result, categories = await run_queries(scan, hazard_ranking_query(config, [curr_s_ts, curr_e_ts]))
+            result["part2_hazards"]["categories"] = categories
+        else:
+            (result,) = await run_queries(scan)
+        save_debug_json(result, "full")
+        return result
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/report/full")
+async def report_full(req: ReportRequest, response: Response, profile: bool = False):
+    if profile:
+        return await profiled_report("full", req)
+    return report_response("full", await cached_full_report(req, response), response)
+
+async def cached_full_report(req: ReportRequest, response: Response):
+    """经缓存计算完整报表；各部分与单独接口的结果一致，首次计算时顺带写入各自的缓存"""
+    result = await cached_report("full", req, response)
+    if REPORT_CACHE is not None and response.headers.get("X-Cache") == "MISS":
+        for endpoint in FULL_REPORT_PARTS:
+            await run_in_threadpool(REPORT_CACHE.put, endpoint, req.start_date, req.end_date, result[endpoint])
+    return result
+
+# --- 报表结果缓存 ---
+
+# 缓存键中的接口名 -> 计算函数 (/get_alarm_stats 与 /report/part1_overview 结果相同，共用一个键)
+REPORT_BUILDERS = {
+    "part1_overview": compute_alarm_stats,
+    "part2_hazards": compute_hazards,
+    "part3_trends": compute_trends,
+    "part4_skylight": compute_skylight,
+    "full": compute_full_report,
+    **{
+        f"trend_series_{bucket}": functools.partial(compute_trend_series, bucket=bucket)
+        for bucket in TREND_SERIES_BUCKETS
+    }
+}
+FULL_REPORT_PARTS = ("part1_overview", "part2_hazards", "part3_trends", "part4_skylight")
+
+REPORT_CACHE = None
+
+def init_report_cache():
+    global REPORT_CACHE
+    if not CACHE_CONFIG["enabled"]:
+        return
+    try:
+        REPORT_CACHE = report_cache.ReportCache(
+            max_entries=CACHE_CONFIG["max_entries"],
+            closed_ttl=CACHE_CONFIG["closed_ttl"],
+            open_ttl=CACHE_CONFIG["open_ttl"],
+            disk_path=CACHE_CONFIG["disk_path"]
+        )
+    except Exception as e:
+        print(f"Warning: Failed to open report cache: {e}")
+
+def report_response(endpoint, result, response: Response):
+    """fast_json 时直接返回序列化好的响应 (带上 X-Cache 等已设置的响应头)，否则交给 FastAPI 默认编码"""
+    if not RESPONSE_CONFIG["fast_json"]:
+        return result
+    with request_timing.span("serialize"):
+        encoded = http_encoding.ReportJSONResponse(result, headers=response.headers)
+    REPORT_SERIALIZED_BYTES.observe(len(encoded.body), endpoint=endpoint)
+    return encoded
+
+async def serve_report(endpoint, req: ReportRequest, response: Response, profile=False):
+    """报表接口的公共流程: ?profile=1 时剖析一次计算，否则经缓存计算后编码为响应"""
+    if profile:
+        return await profiled_report(endpoint, req)
+    return report_response(endpoint, await cached_report(endpoint, req, response), response)
+
+# 性能剖析配置
+# enabled=True (ALARM_PROFILE=1 启动) 时报表接口接受 ?profile=1: 不经缓存重新计算一次，在 cProfile + tracemalloc 下执行，
+# 返回 {"profile": 自身耗时最多的 top 个函数与分配内存最多的 top 个代码行, "result": 报表结果}。
+# 剖析会明显拖慢计算，同一时间只允许一个剖析请求；计算在独立线程的事件循环中执行，
+# 使 cProfile (Python 3.12 之前按线程剖析) 不记录主事件循环上其他请求的执行，3.12+ 的限制见 request_timing。
+PROFILE_CONFIG = {
+    "enabled": os.environ.get("ALARM_PROFILE", "0") == "1",
+    "top": 30
+}
+
+_profile_lock = threading.Lock()
+
+def run_profiled(profiler, compute):
+    """在当前 (线程池) 线程新建事件循环执行 compute()，期间启用剖析"""
+    token = request_timing.PROFILER.set(profiler)
+    try:
+        with profiler.trace_memory(), profiler.profile():
+            return asyncio.run(compute())
+    finally:
+        request_timing.PROFILER.reset(token)
+
+async def profiled_report(endpoint, req: ReportRequest):
+    if not PROFILE_CONFIG["enabled"]:
+        raise HTTPException(status_code=403, detail="Profiling is disabled (start the server with ALARM_PROFILE=1)")
+    if not _profile_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="Another profiled request is running")
+    try:
+        profiler = request_timing.Profiler()
+        result = await run_in_threadpool(run_profiled, profiler, functools.partial(REPORT_BUILDERS[endpoint], req))
+        return {"profile": profiler.report(PROFILE_CONFIG["top"]), "result": result}
     finally:
-        if conn: conn.close()
+        _profile_lock.release()
+
+# 相同的报表请求 (接口 + 参数 + 基础配置版本) 并发到达时只计算一次，其余请求等待并共享结果
+REPORT_FLIGHTS = singleflight.SingleFlight()
+
+async def cached_report(endpoint, req: ReportRequest, response: Response):
+    """
+    先查缓存 (内存 -> 磁盘)，未命中时计算并写入；响应头 X-Cache 标明 HIT / MISS / BYPASS，
+    共享了其他并发请求计算结果的为 COALESCED (未启用缓存时同样合并)
+    """
+    compute = REPORT_BUILDERS[endpoint]
+    cache = REPORT_CACHE
+    if cache is not None:
+        hit = await run_in_threadpool(cache.get, endpoint, req.start_date, req.end_date)
+        if hit is not None:
+            value, tier = hit
+            REPORT_CACHE_LOOKUPS.inc(endpoint=endpoint, result="hit")
+            response.headers["X-Cache"] = "HIT"
+            response.headers["X-Cache-Tier"] = tier
+            return value
+
+    version = CONFIG_VERSION
+
+    async def compute_and_store():
+        result = await compute(req)
+        if cache is None:
+            return result, None
+        if CONFIG_VERSION != version:
+            # 计算期间基础配置被替换，结果可能混用了新旧两版映射，不写入缓存
+            return result, "BYPASS"
+        try:
+            await run_in_threadpool(cache.put, endpoint, req.start_date, req.end_date, result)
+        except Exception as e:
+            print(f"Warning: Failed to store {endpoint} in report cache: {e}")
+        return result, "MISS"
+
+    key = (endpoint, tuple(req), version)
+    (result, status), shared = await REPORT_FLIGHTS.do(key, compute_and_store)
+    if shared:
+        REPORT_COALESCED.inc(endpoint=endpoint)
+        status = "COALESCED"
+    if status is not None:
+        if cache is not None:
+            REPORT_CACHE_LOOKUPS.inc(endpoint=endpoint, result=status.lower())
+        response.headers["X-Cache"] = status
+    return result
+
+class CacheInvalidateRequest(BaseModel):
+    endpoint: Optional[str] = None
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+
+@app.post("/cache/invalidate")
+def cache_invalidate(req: CacheInvalidateRequest):
+    """删除匹配的缓存条目 (未填写的字段视为全部匹配，全部不填则清空缓存)"""
+    if REPORT_CACHE is None:
+        raise HTTPException(status_code=400, detail="Report cache is disabled")
+    if req.endpoint is not None and req.endpoint not in REPORT_BUILDERS:
+        raise HTTPException(status_code=400, detail=f"Unknown endpoint: {req.endpoint}")
+    try:
+        removed = REPORT_CACHE.invalidate(req.endpoint, req.start_date, req.end_date)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"removed": removed}
+
+@app.get("/cache/stats")
+def cache_stats():
+    """缓存命中统计 (报表结果缓存与报警描述分析缓存)"""
+    stats = {"status": "disabled"} if REPORT_CACHE is None else REPORT_CACHE.snapshot()
+    stats["descriptions"] = DESCRIPTIONS.snapshot()
+    stats["coalescing"] = REPORT_FLIGHTS.snapshot()
+    return stats
+
+def update_scrape_metrics():
+    """抓取时才读取的指标: 连接池会话数与缓存命中率"""
+    pool = DB_POOL
+    if pool is not None:
+        POOL_SESSIONS.set(pool.opened, state="open")
+        POOL_SESSIONS.set(pool.busy, state="busy")
+    cache = REPORT_CACHE
+    if cache is not None:
+        stats = cache.snapshot()
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        lookups = hits + stats["misses"]
+        CACHE_HIT_RATIO.set(round(hits / lookups, 4) if lookups else 0.0, cache="report")
+    CACHE_HIT_RATIO.set(DESCRIPTIONS.snapshot()["hit_rate"], cache="descriptions")
+
+SLOW_QUERIES = None
+
+def init_slow_query_log():
+    global SLOW_QUERIES
+    if not SLOW_QUERY_CONFIG["enabled"]:
+        return
+    try:
+        SLOW_QUERIES = slow_query.SlowQueryLog(
+            SLOW_QUERY_CONFIG["path"],
+            threshold=SLOW_QUERY_CONFIG["threshold"],
+            plan_interval=SLOW_QUERY_CONFIG["plan_interval"],
+            max_bytes=SLOW_QUERY_CONFIG["max_bytes"],
+            backup_count=SLOW_QUERY_CONFIG["backup_count"]
+        )
+    except Exception as e:
+        print(f"Warning: Failed to open slow query log: {e}")
+
+def close_slow_query_log():
+    global SLOW_QUERIES
+    log, SLOW_QUERIES = SLOW_QUERIES, None
+    if log is not None:
+        log.close()
+
+@app.get("/slow_queries")
+def slow_queries(limit: int = 50, name: Optional[str] = None):
+    """最近的慢查询记录 (新的在前)，可按语句名过滤"""
+    log = SLOW_QUERIES
+    if log is None:
+        return {"status": "disabled"}
+    try:
+        entries = log.recent(limit, name)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"threshold_ms": round(log.threshold * 1000), "path": log.path, "entries": entries}
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus 指标 (文本格式)"""
+    update_scrape_metrics()
+    return Response(content=METRICS.render(), media_type=metrics.CONTENT_TYPE)
+
+# --- 报表预计算 ---
+
+REPORT_SCHEDULER = None
+
+async def precompute_report(endpoint, start_date, end_date):
+    """计算并缓存一个报表 (与在线请求走同一缓存与合并路径)，返回缓存状态"""
+    req = ReportRequest(start_date=start_date, end_date=end_date)
+    response = Response()
+    try:
+        if endpoint == "full":
+            await cached_full_report(req, response)
+        else:
+            await cached_report(endpoint, req, response)
+    except Exception:
+        PRECOMPUTE_RUNS.inc(endpoint=endpoint, result="error")
+        raise
+    status = response.headers.get("X-Cache", "MISS")
+    PRECOMPUTE_RUNS.inc(endpoint=endpoint, result=status.lower())
+    return status
+
+def start_report_scheduler():
+    global REPORT_SCHEDULER
+    if not PRECOMPUTE_CONFIG["enabled"]:
+        return
+    if REPORT_CACHE is None:
+        print("Warning: Report precompute needs the report cache, scheduler not started")
+        return
+    try:
+        for job in PRECOMPUTE_CONFIG["jobs"]:
+            unknown = [ep for ep in job["endpoints"] if ep not in REPORT_BUILDERS]
+            if unknown:
+                raise ValueError(f"Unknown endpoints {unknown} in job {job['name']!r}")
+        disk_path = CACHE_CONFIG["disk_path"]
+        scheduler = report_scheduler.ReportScheduler(
+            PRECOMPUTE_CONFIG["jobs"],
+            precompute_report,
+            concurrency=PRECOMPUTE_CONFIG["concurrency"],
+            max_attempts=PRECOMPUTE_CONFIG["max_attempts"],
+            backoff=PRECOMPUTE_CONFIG["backoff"],
+            backoff_max=PRECOMPUTE_CONFIG["backoff_max"],
+            utc=PRECOMPUTE_CONFIG["utc"],
+            lease=process_lease.LeaseStore(disk_path) if disk_path else None,
+            lease_ttl=PRECOMPUTE_CONFIG["lease_ttl"]
+        )
+    except Exception as e:
+        print(f"Warning: Invalid precompute config, scheduler not started: {e}")
+        return
+    scheduler.start(catch_up=PRECOMPUTE_CONFIG["catch_up"])
+    REPORT_SCHEDULER = scheduler
+
+async def stop_report_scheduler():
+    global REPORT_SCHEDULER
+    scheduler, REPORT_SCHEDULER = REPORT_SCHEDULER, None
+    if scheduler is not None:
+        await scheduler.stop()
+
+@app.get("/precompute/status")
+def precompute_status():
+    """各预计算任务的规则、下次触发时间与最近一次执行结果"""
+    if REPORT_SCHEDULER is None:
+        return {"status": "disabled"}
+    return {"utc": REPORT_SCHEDULER.utc, "jobs": REPORT_SCHEDULER.status()}
+
+@app.post("/precompute/run")
+async def precompute_run(job: str):
+    """立即执行一个预计算任务 (后台执行，进度见 /precompute/status)"""
+    if REPORT_SCHEDULER is None:
+        raise HTTPException(status_code=400, detail="Report precompute is disabled")
+    if job not in REPORT_SCHEDULER.jobs:
+        raise HTTPException(status_code=400, detail=f"Unknown job: {job}")
+    start_date, end_date = REPORT_SCHEDULER.trigger(job)
+    return {"job": job, "start_date": start_date, "end_date": end_date}
+
+# --- 基础配置热加载 ---
+
+# 各报表依赖的基础配置维度，配置变化时只使相关报表的缓存失效
+REPORT_CONFIG_DEPENDENCIES = {
+    "part1_overview": {"station_hierarchy", "alarm_classification"},
+    "part2_hazards": {"station_names", "alarm_descriptions"},
+    "part3_trends": {"station_hierarchy"},
+    "part4_skylight": {"station_names", "device_types"}
+}
+REPORT_CONFIG_DEPENDENCIES["full"] = set().union(*REPORT_CONFIG_DEPENDENCIES.values())
+REPORT_CONFIG_DEPENDENCIES.update({f"trend_series_{bucket}": {"station_hierarchy"} for bucket in TREND_SERIES_BUCKETS})
+
+def reload_base_config():
+    """重新读取基础配置，有变化时整体替换并使相关报表的缓存失效"""
+    global BASE_CONFIG
+    with _config_lock:
+        try:
+            config = read_base_config(strict=True)
+        except Exception as e:
+            CONFIG_STATUS["last_error"] = str(e)
+            raise
+        CONFIG_STATUS["last_error"] = None
+        changed = config_changes(BASE_CONFIG, config)
+        # 内容没有变化 (如只是 touch 了文件) 时也记下新的文件状态，避免反复重新加载
+        if not changed:
+            BASE_CONFIG = BASE_CONFIG._replace(stamps=config.stamps)
+            return {"version": CONFIG_VERSION, "changed": [], "invalidated": {}}
+        apply_base_config(config)
+        CONFIG_STATUS["last_changes"] = sorted(changed)
+
+    invalidated = {}
+    if REPORT_CACHE is not None:
+        for endpoint, dims in REPORT_CONFIG_DEPENDENCIES.items():
+            if dims & changed:
+                invalidated[endpoint] = REPORT_CACHE.invalidate(endpoint)
+    print(f"Config reloaded from {config.source}: changed {sorted(changed)}, invalidated {invalidated}")
+    return {"version": CONFIG_VERSION, "changed": sorted(changed), "invalidated": invalidated}
+
+_config_stop = threading.Event()
+_config_thread = None
+
+def start_config_watcher():
+    global _config_thread
+    if not CONFIG_RELOAD_CONFIG["watch"]:
+        return
+
+    def watch_loop():
+        while not _config_stop.wait(CONFIG_RELOAD_CONFIG["interval"]):
+            stamps = BASE_CONFIG.stamps
+            if config_file_stamps(stamps) == stamps:
+                continue
+            try:
+                reload_base_config()
+            except Exception as e:
+                # 文件可能正在写入，下一轮再试
+                print(f"Warning: Config reload failed, keeping current config: {e}")
+
+    _config_stop.clear()
+    _config_thread = threading.Thread(target=watch_loop, name="config-watcher", daemon=True)
+    _config_thread.start()
+
+def stop_config_watcher():
+    _config_stop.set()
+    if _config_thread is not None:
+        _config_thread.join(timeout=5)
+
+@app.post("/config/reload")
+async def config_reload():
+    """立即重新加载车站表 / 报警配置 / 设备类型，返回变化的维度与失效的缓存条目数"""
+    try:
+        return await run_in_threadpool(reload_base_config)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Config reload failed, keeping current config: {e}")
+
+@app.get("/config/status")
+def config_status():
+    return {**CONFIG_STATUS, "watch": CONFIG_RELOAD_CONFIG["watch"], "watch_paths": list(BASE_CONFIG.stamps)}
 
 if __name__ == "__main__":
     import uvicorn
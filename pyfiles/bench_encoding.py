@@ -0,0 +1,104 @@
+import os
+import glob
+import json
+import gzip
+import time
+import argparse
+import statistics
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+import http_encoding
+
+# 报表响应编码基准测试
+# 以保存的 api_output_part*.json (报表接口的实际输出) 为样本，对比:
+#   fastapi  FastAPI 默认路径: jsonable_encoder 遍历 + JSONResponse (标准库 json)
+#   json     直接用标准库 json 序列化 (http_encoding 未安装 orjson 时的路径)
+#   orjson   http_encoding.dumps (安装了 orjson 时)
+# 以及 gzip / br (需安装 brotli) 压缩后的字节数和压缩耗时。
+#
+#   python bench_encoding.py
+#   python bench_encoding.py api_output\*.json --repeat 200 --out encoding_results.json
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def fastapi_default(data):
+    return JSONResponse(jsonable_encoder(data)).body
+
+def stdlib_json(data):
+    return json.dumps(data, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+def serializers():
+    result = {"fastapi": fastapi_default, "json": stdlib_json}
+    if http_encoding.orjson is not None:
+        result["orjson"] = http_encoding.dumps
+    return result
+
+def compressors(gzip_level, brotli_quality):
+    result = {"gzip": lambda body: gzip.compress(body, compresslevel=gzip_level)}
+    if http_encoding.brotli is not None:
+        result["br"] = lambda body: http_encoding.brotli.compress(body, quality=brotli_quality)
+    return result
+
+def time_ms(func, arg, repeat):
+    """执行 repeat 次，返回每次耗时的中位数 (毫秒)"""
+    func(arg)
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func(arg)
+        timings.append((time.perf_counter() - t0) * 1000)
+    return round(statistics.median(timings), 3)
+
+def load_fixture(path):
+    if path.endswith(".gz"):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return json.load(f)
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def bench_fixture(data, repeat, gzip_level, brotli_quality):
+    stats = {"serialize_ms": {}, "bytes": {}, "compress_ms": {}}
+    body = None
+    for name, func in serializers().items():
+        stats["serialize_ms"][name] = time_ms(func, data, repeat)
+        body = func(data)
+    stats["bytes"]["identity"] = len(body)
+    for name, func in compressors(gzip_level, brotli_quality).items():
+        stats["bytes"][name] = len(func(body))
+        stats["compress_ms"][name] = time_ms(func, body, repeat)
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="报表响应序列化与压缩基准测试")
+    parser.add_argument("fixtures", nargs="*", help="样本 JSON (可为 .json.gz)，默认为脚本目录下的 api_output_part*.json")
+    parser.add_argument("--repeat", type=int, default=100, help="每项计时的次数 (取中位数)")
+    parser.add_argument("--gzip-level", type=int, default=6)
+    parser.add_argument("--brotli-quality", type=int, default=4)
+    parser.add_argument("--out", help="结果输出文件 (JSON)")
+    args = parser.parse_args()
+
+    paths = args.fixtures or sorted(glob.glob(os.path.join(SCRIPT_DIR, "api_output_part*.json")))
+    if not paths:
+        raise SystemExit("No fixtures found")
+    if http_encoding.orjson is None:
+        print("orjson not installed, skipped")
+    if http_encoding.brotli is None:
+        print("brotli not installed, skipped")
+
+    results = {}
+    for path in paths:
+        stats = bench_fixture(load_fixture(path), args.repeat, args.gzip_level, args.brotli_quality)
+        results[os.path.basename(path)] = stats
+        timings = "  ".join(f"{name} {ms:>7.3f} ms" for name, ms in stats["serialize_ms"].items())
+        sizes = "  ".join(f"{name} {n:>7d} B" for name, n in stats["bytes"].items())
+        print(f"{os.path.basename(path):36s} {timings}  |  {sizes}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\nResults saved to {args.out}")
+
+if __name__ == "__main__":
+    main()
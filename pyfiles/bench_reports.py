@@ -0,0 +1,212 @@
+import os
+import sys
+import json
+import sqlite3
+import time
+import asyncio
+import platform
+import argparse
+import datetime
+import threading
+import statistics
+import tracemalloc
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+LAUNCH_DIR = os.getcwd()
+# api_server 按当前目录加载 alarmconfig.xml / station_map.json
+os.chdir(SCRIPT_DIR)
+
+import api_server
+import rollup_store
+
+# 报表接口基准测试 (离线数据源)
+# 在本地 SQLite 报警库 (gen_alarms.py 生成或 alarm_source.py 装载) 上直接调用各报表的计算函数，
+# 对 1 / 7 / 30 / 365 天范围分别记录耗时、Python 堆内存峰值、从数据源取回的行数与查询条数。
+# 结果写入 JSON，可保存为基线并与之对比。
+# 默认不经过报表缓存和日汇总库 (--rollup 可测日汇总路径)。
+
+DEFAULT_RANGES = (1, 7, 30, 365)
+# 耗时增加超过该毫秒数才判定为退化，避免短查询的抖动误报
+NOISE_FLOOR_MS = 5.0
+
+class CountingSource:
+    """包装数据源，统计查询条数与返回行数"""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.name = inner.name
+        self.queries = 0
+        self.rows = 0
+        self._lock = threading.Lock()
+
+    def execute(self, sql, binds, fetch="all", options=None, timing=None):
+        if callable(fetch):
+            # 流式消费: 在行迭代器上计数
+            consume, counted = fetch, [0]
+            def fetch(rows):
+                def counting():
+                    for row in rows:
+                        counted[0] += 1
+                        yield row
+                return consume(counting())
+            result = self.inner.execute(sql, binds, fetch, options, timing)
+            n = counted[0]
+        elif fetch == "one":
+            result = self.inner.execute(sql, binds, fetch, options, timing)
+            n = 0 if result is None else 1
+        else:
+            result = self.inner.execute(sql, binds, fetch, options, timing)
+            n = len(result[0]) if fetch == "columns" and len(result) else len(result)
+        with self._lock:
+            self.queries += 1
+            self.rows += n
+        return result
+
+    def reset(self):
+        with self._lock:
+            counts = (self.queries, self.rows)
+            self.queries = self.rows = 0
+        return counts
+
+def last_alarm_day(db_path):
+    """库中最后一条报警所在的日期"""
+    conn = sqlite3.connect(db_path)
+    try:
+        max_ts = conn.execute("SELECT max(createtime) FROM ALARM").fetchone()[0]
+    finally:
+        conn.close()
+    if max_ts is None:
+        raise SystemExit(f"No alarms in {db_path}")
+    return datetime.datetime.fromtimestamp(max_ts, datetime.timezone.utc).date()
+
+async def bench_case(compute, req, source, repeat):
+    # 预热一次 (SQL 改写缓存、页缓存)，不计入结果
+    await compute(req)
+    source.reset()
+
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        await compute(req)
+        timings.append((time.perf_counter() - t0) * 1000)
+    queries, rows = source.reset()
+
+    # 内存峰值单独测一次，tracemalloc 本身会拖慢执行
+    tracemalloc.start()
+    try:
+        await compute(req)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    source.reset()
+
+    return {
+        "median_ms": round(statistics.median(timings), 2),
+        "min_ms": round(min(timings), 2),
+        "max_ms": round(max(timings), 2),
+        "peak_kb": round(peak / 1024, 1),
+        "queries": queries // repeat,
+        "rows": rows // repeat
+    }
+
+async def run_benchmarks(endpoints, ranges, end_day, repeat, source):
+    results = {}
+    try:
+        for endpoint in endpoints:
+            compute = api_server.REPORT_BUILDERS[endpoint]
+            for days in ranges:
+                start_day = end_day - datetime.timedelta(days=days - 1)
+                req = api_server.ReportRequest(start_date=str(start_day), end_date=str(end_day))
+                stats = await bench_case(compute, req, source, repeat)
+                results.setdefault(endpoint, {})[f"{days}d"] = stats
+                print(f"{endpoint:16s} {days:>4d}d  {stats['median_ms']:>10.1f} ms  "
+                      f"{stats['peak_kb']:>10.1f} KB  {stats['rows']:>9d} rows  {stats['queries']:>3d} queries")
+    finally:
+        api_server.shutdown_query_executor()
+    return results
+
+def compare(results, baseline, threshold):
+    """与基线对比，打印变化并返回退化项列表"""
+    regressions = []
+    print(f"\n{'case':24s} {'base ms':>10s} {'now ms':>10s} {'change':>8s} {'base KB':>10s} {'now KB':>10s} {'rows':>12s}")
+    for endpoint, by_range in results.items():
+        for rng, now in by_range.items():
+            base = baseline.get(endpoint, {}).get(rng)
+            if base is None:
+                continue
+            change = (now["median_ms"] - base["median_ms"]) / base["median_ms"] if base["median_ms"] else 0.0
+            regressed = (change > threshold
+                         and now["median_ms"] - base["median_ms"] > NOISE_FLOOR_MS)
+            rows = f"{base['rows']}->{now['rows']}" if base["rows"] != now["rows"] else str(now["rows"])
+            case = f"{endpoint}/{rng}"
+            print(f"{case:24s} {base['median_ms']:>10.1f} {now['median_ms']:>10.1f} {change:>+8.1%} "
+                  f"{base['peak_kb']:>10.1f} {now['peak_kb']:>10.1f} {rows:>12s}{'  REGRESSION' if regressed else ''}")
+            if regressed:
+                regressions.append(case)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="报表接口基准测试 (本地 SQLite 报警库)")
+    parser.add_argument("--db", default=os.path.join(SCRIPT_DIR, "alarm_local.db"), help="本地报警库")
+    parser.add_argument("--end", help="各范围的最后一天 (YYYY-MM-DD)，默认库中最后一条报警的日期")
+    parser.add_argument("--ranges", default=",".join(map(str, DEFAULT_RANGES)), help="范围天数，逗号分隔")
+    parser.add_argument("--endpoints", default=",".join(api_server.REPORT_BUILDERS), help="报表，逗号分隔")
+    parser.add_argument("--repeat", type=int, default=5, help="每个范围计时的次数 (取中位数)")
+    parser.add_argument("--out", default="bench_results.json", help="结果输出文件")
+    parser.add_argument("--baseline", help="基线文件；存在时与之对比")
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果另存为基线")
+    parser.add_argument("--threshold", type=float, default=0.1, help="耗时增加超过该比例视为退化")
+    parser.add_argument("--rollup", help="日汇总库路径；指定时先刷新再测日汇总路径")
+    args = parser.parse_args()
+    for name in ("db", "out", "baseline", "rollup"):
+        if getattr(args, name):
+            setattr(args, name, os.path.join(LAUNCH_DIR, getattr(args, name)))
+
+    api_server.DATA_SOURCE_CONFIG.update(type="sqlite", sqlite_path=args.db)
+    # 只测计算本身，不写调试 JSON 文件
+    api_server.save_debug_json = lambda data, filename_part: None
+    source = CountingSource(api_server.get_data_source())
+    api_server.DATA_SOURCE = source
+
+    if args.rollup:
+        api_server.ROLLUP_STORE = rollup_store.AlarmRollupStore(args.rollup)
+        api_server.refresh_rollup()
+        source.reset()
+
+    end_day = (datetime.datetime.strptime(args.end, "%Y-%m-%d").date()
+               if args.end else last_alarm_day(args.db))
+    endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    ranges = [int(r) for r in args.ranges.split(",") if r.strip()]
+
+    results = asyncio.run(run_benchmarks(endpoints, ranges, end_day, args.repeat, source))
+    output = {
+        "meta": {
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "db": os.path.abspath(args.db),
+            "end": str(end_day),
+            "repeat": args.repeat,
+            "rollup": bool(args.rollup),
+            "python": platform.python_version(),
+            "platform": platform.platform()
+        },
+        "results": results
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(output, f, ensure_ascii=False, indent=2)
+    print(f"\nResults saved to {args.out}")
+
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(output, f, ensure_ascii=False, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    elif args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline["results"], args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print("\nNo regressions")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+import os
+import re
+import sys
+import json
+import time
+import pickle
+import argparse
+import xml.etree.ElementTree as ET
+
+# 基础配置快照编译器
+# 把车站表 (Stations_full.xml / Stations.xml)、报警配置 (alarmconfig.xml)、设备类型 (device_type_map.json)、
+# 自诊断报警类型 (alarm_type_config.json) 解析合并为一个带版本号的二进制快照 (pickle)。
+# api_server 启动时直接加载快照 (毫秒级)，不再逐个解析 XML / JSON；快照缺失、版本不符或源文件已修改时回退为解析源文件。
+#
+#   python config_snapshot.py                      # 生成 config_snapshot.pkl
+#   python config_snapshot.py --check              # 只检查现有快照是否与源文件一致
+#
+# XML 文件声明为 gb2312，但实际可能已被转存为 UTF-8: 先按 UTF-8 严格解码，失败时按声明的编码解码
+# (gb2312 用其超集 gb18030 解码，避免生僻字报错)。
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MAGIC = "alarm-config-snapshot"
+SNAPSHOT_VERSION = 1
+
+DEFAULT_SOURCES = {
+    # 车站表按顺序合并，后面的文件覆盖前面的同名电报码
+    "stations": [os.path.join(SCRIPT_DIR, "Stations_full.xml"), os.path.join(SCRIPT_DIR, "Stations.xml")],
+    "alarm_config": os.path.join(SCRIPT_DIR, "alarmconfig.xml"),
+    "device_types": os.path.join(SCRIPT_DIR, "device_type_map.json"),
+    "alarm_types": os.path.join(SCRIPT_DIR, "alarm_type_config.json")
+}
+
+_DECL_RE = re.compile(r"^\s*<\?xml[^>]*\?>")
+_ENCODING_RE = re.compile(rb"""^\s*<\?xml[^>]*encoding\s*=\s*["']([\w-]+)["']""")
+# 声明的编码 -> 实际用于解码的编码
+_ENCODING_ALIASES = {"gb2312": "gb18030", "gbk": "gb18030"}
+
+def read_xml(path):
+    """按实际编码解码 XML 文件并解析，返回根元素"""
+    with open(path, "rb") as f:
+        data = f.read()
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        m = _ENCODING_RE.match(data)
+        declared = m.group(1).decode("ascii").lower() if m else "gb2312"
+        text = data.decode(_ENCODING_ALIASES.get(declared, declared))
+    # 已解码为 str，去掉编码声明后再交给 ElementTree
+    return ET.fromstring(_DECL_RE.sub("", text, count=1))
+
+def parse_stations(path):
+    """Stations.xml -> [(电报码, 车站名, 车间, 电务段)]，属性值去掉补齐空格，无电报码的记录忽略"""
+    records = []
+    for sta in read_xml(path).iter("Sta"):
+        code = sta.get("telename", "").strip()
+        if code:
+            records.append((
+                code,
+                sta.get("name", "").strip(),
+                sta.get("Workshop", "").strip(),
+                sta.get("EleSection", "").strip()
+            ))
+    return records
+
+def parse_alarm_config(path):
+    """alarmconfig.xml -> {(报警类型, 子类型): 描述}；子报警取文件名 (去扩展名)，主报警取 name"""
+    desc_map = {}
+    for alarm in read_xml(path).findall("Alarm"):
+        type_hex = alarm.get("type")
+        if not type_hex:
+            continue
+        try:
+            alarm_type = int(type_hex, 16)
+        except ValueError:
+            continue
+
+        for sub in alarm.findall("SubAlarm"):
+            subtype_str = sub.get("subtype")
+            filename = sub.get("filename", "")
+            if subtype_str and filename:
+                try:
+                    desc_map[(alarm_type, int(subtype_str))] = os.path.splitext(filename)[0]
+                except ValueError:
+                    pass
+
+        main_subtype_str = alarm.get("subtype")
+        main_name = alarm.get("name")
+        if main_subtype_str and main_name:
+            try:
+                desc_map[(alarm_type, int(main_subtype_str))] = main_name
+            except ValueError:
+                pass
+    return desc_map
+
+def parse_device_types(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return {int(k): v for k, v in json.load(f).items()}
+
+def parse_alarm_types(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _source_stamp(path):
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+def compile_snapshot(sources, base_dir=SCRIPT_DIR, snapshot_dir=SCRIPT_DIR):
+    """
+    解析各源文件，返回快照字典。sources 中的相对路径相对于 base_dir；
+    快照中记录的源文件路径相对于快照所在目录 snapshot_dir，供加载时检查是否过期。
+    """
+    def resolve(p):
+        return os.path.join(base_dir, p)
+
+    stamps = {}
+
+    def stamp(p):
+        stamps[os.path.relpath(resolve(p), snapshot_dir)] = _source_stamp(resolve(p))
+
+    stations = {}
+    for path in sources["stations"]:
+        if not os.path.exists(resolve(path)):
+            print(f"Warning: station file {path} not found, skipped")
+            continue
+        for record in parse_stations(resolve(path)):
+            stations[record[0]] = record
+        stamp(path)
+
+    snapshot = {
+        "magic": MAGIC,
+        "version": SNAPSHOT_VERSION,
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "stations": list(stations.values())
+    }
+    parsers = {
+        "alarm_config": ("alarm_desc_map", parse_alarm_config),
+        "device_types": ("device_types", parse_device_types),
+        "alarm_types": ("alarm_types", parse_alarm_types)
+    }
+    for source, (key, parse) in parsers.items():
+        path = sources.get(source)
+        if path and os.path.exists(resolve(path)):
+            snapshot[key] = parse(resolve(path))
+            stamp(path)
+        else:
+            print(f"Warning: {source} source {path} not found, skipped")
+            snapshot[key] = {}
+    snapshot["sources"] = stamps
+    return snapshot
+
+def write_snapshot(snapshot, path):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+def stale_sources(snapshot, base_dir):
+    """修改时间或大小与快照记录不一致的源文件 (源文件不存在时不算，部署时可只带快照)"""
+    stale = []
+    for path, stamp in snapshot.get("sources", {}).items():
+        full = os.path.join(base_dir, path)
+        if os.path.exists(full) and _source_stamp(full) != stamp:
+            stale.append(path)
+    return stale
+
+def load(path, base_dir=None):
+    """
+    加载快照；文件不存在时返回 None。
+    格式 / 版本不符或源文件已修改时抛出 ValueError，由调用方回退为解析源文件。
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        snapshot = pickle.load(f)
+    if not isinstance(snapshot, dict) or snapshot.get("magic") != MAGIC:
+        raise ValueError(f"{path} is not a config snapshot")
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"{path} has version {snapshot.get('version')}, expected {SNAPSHOT_VERSION}; rebuild it with config_snapshot.py")
+    stale = stale_sources(snapshot, base_dir or os.path.dirname(os.path.abspath(path)))
+    if stale:
+        raise ValueError(f"{path} is older than {', '.join(stale)}; rebuild it with config_snapshot.py")
+    return snapshot
+
+def main():
+    parser = argparse.ArgumentParser(description="编译基础配置快照 (车站表 / 报警配置 / 设备类型)")
+    parser.add_argument("--out", default=os.path.join(SCRIPT_DIR, "config_snapshot.pkl"), help="快照输出路径")
+    parser.add_argument("--stations", nargs="+", default=DEFAULT_SOURCES["stations"], help="车站表 XML，后者覆盖前者")
+    parser.add_argument("--alarm-config", default=DEFAULT_SOURCES["alarm_config"])
+    parser.add_argument("--device-types", default=DEFAULT_SOURCES["device_types"])
+    parser.add_argument("--alarm-types", default=DEFAULT_SOURCES["alarm_types"])
+    parser.add_argument("--check", action="store_true", help="只检查现有快照是否可用")
+    args = parser.parse_args()
+
+    if args.check:
+        try:
+            snapshot = load(args.out)
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+        if snapshot is None:
+            print(f"{args.out} not found")
+            sys.exit(1)
+        print(f"{args.out} is up to date (created {snapshot['created']})")
+        return
+
+    # 相对路径相对于当前目录 (与命令行习惯一致)
+    sources = {
+        "stations": args.stations,
+        "alarm_config": args.alarm_config,
+        "device_types": args.device_types,
+        "alarm_types": args.alarm_types
+    }
+    t0 = time.perf_counter()
+    snapshot = compile_snapshot(sources, base_dir=os.getcwd(),
+                                snapshot_dir=os.path.dirname(os.path.abspath(args.out)))
+    write_snapshot(snapshot, args.out)
+    print(f"Snapshot v{SNAPSHOT_VERSION} written to {args.out} in {(time.perf_counter() - t0) * 1000:.0f} ms: "
+          f"{len(snapshot['stations'])} stations, {len(snapshot['alarm_desc_map'])} alarm descriptions, "
+          f"{len(snapshot['device_types'])} device types")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+import os
+import asyncio
+
+import pytest
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# api_server 按当前目录加载 alarmconfig.xml / station_map.json
+os.chdir(SCRIPT_DIR)
+
+import alarm_source
+import api_server
+
+# 测试共用的本地 SQLite 数据源与造数函数
+# 各测试把 api_server 的数据源切换为临时 SQLite 库，经与线上相同的查询 / 统计路径计算报表。
+
+START_DATE, END_DATE = "2024-01-01", "2024-01-07"
+START_TS = alarm_source.date_to_ts(START_DATE)
+START_DAY = START_TS // 86400
+
+def alarm_row(rng, telename, devicetype, devicename, alarmtype, alarmsubtype, alarmdes,
+              maintanceflag=0, processstatus=0, week=0, alarmlevel=1):
+    """week=-1 时落在上一周 (第三部分的对比期)"""
+    createtime = START_TS + week * 7 * 86400 + rng.randrange(7 * 86400)
+    return (telename, devicetype, devicename, alarmtype, alarmsubtype, alarmlevel, alarmdes,
+            maintanceflag, processstatus, createtime)
+
+@pytest.fixture
+def sqlite_source(tmp_path, monkeypatch):
+    """把 api_server 的数据源切换为临时 SQLite 库，返回写入数据的函数"""
+    db_path = str(tmp_path / "alarm.db")
+    monkeypatch.setitem(api_server.DATA_SOURCE_CONFIG, "type", "sqlite")
+    monkeypatch.setitem(api_server.DATA_SOURCE_CONFIG, "sqlite_path", db_path)
+    monkeypatch.setattr(api_server, "DATA_SOURCE", None)
+    monkeypatch.setattr(api_server, "ROLLUP_STORE", None)
+
+    def load(rows):
+        alarm_source.load_rows(db_path, [("test", iter(rows))], replace=True)
+    return load
+
+def run_report(compute, start_date=START_DATE, end_date=END_DATE, **kwargs):
+    return asyncio.run(compute(api_server.ReportRequest(start_date=start_date, end_date=end_date), **kwargs))
@@ -0,0 +1,92 @@
+import os
+import re
+import gzip
+import json
+import time
+import queue
+import threading
+import collections
+
+# 调试输出的后台写入器
+# 报表结果放入有界队列后立即返回，由单独的线程序列化并写入 directory:
+# - 每次一个文件: <名称>_<时间戳>_<请求ID>.json(.gz)，并发请求不再互相覆盖
+# - 文件数超过 max_files 或总大小超过 max_bytes 时从最旧的文件开始删除
+# - 队列已满时丢弃本次输出 (调试输出不能拖慢响应)
+
+_UNSAFE_CHARS = re.compile(r"[^0-9A-Za-z_.-]")
+
+class DebugWriter:
+    def __init__(self, directory, max_files=200, max_bytes=50 * 1024 * 1024, queue_size=64, compress=True):
+        self.directory = directory
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.written = 0
+        self.dropped = 0
+        os.makedirs(directory, exist_ok=True)
+        # 已有文件按修改时间排序，参与轮转
+        existing = []
+        for entry in os.scandir(directory):
+            if entry.is_file() and entry.name.endswith((".json", ".json.gz")):
+                st = entry.stat()
+                existing.append((st.st_mtime, entry.path, st.st_size))
+        self._files = collections.deque((path, size) for _, path, size in sorted(existing))
+        self._total_bytes = sum(size for _, size in self._files)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name="debug-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, data, name, request_id=None):
+        """放入写入队列，队列已满时丢弃并返回 False"""
+        try:
+            self._queue.put_nowait((data, name, request_id, time.time()))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            print(f"Warning: Debug output queue full, dropped {name} output")
+            return False
+
+    def close(self, timeout=5):
+        """写完队列中剩余的输出后停止"""
+        self._queue.put(None)
+        self._thread.join(timeout=timeout)
+
+    def _filename(self, name, request_id, created):
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(created)) + f".{int(created * 1000) % 1000:03d}"
+        parts = [_UNSAFE_CHARS.sub("_", name), stamp]
+        if request_id:
+            parts.append(_UNSAFE_CHARS.sub("_", str(request_id))[:64])
+        return os.path.join(self.directory, "_".join(parts) + (".json.gz" if self.compress else ".json"))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            data, name, request_id, created = item
+            try:
+                self._write(data, self._filename(name, request_id, created))
+            except Exception as e:
+                print(f"Error saving API output to file: {e}")
+
+    def _write(self, data, path):
+        payload = json.dumps(data, ensure_ascii=False, indent=4).encode("utf-8")
+        if self.compress:
+            payload = gzip.compress(payload, compresslevel=6)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(payload)
+        os.replace(tmp, path)
+        self.written += 1
+        self._files.append((path, len(payload)))
+        self._total_bytes += len(payload)
+        self._rotate()
+
+    def _rotate(self):
+        while self._files and (len(self._files) > self.max_files or self._total_bytes > self.max_bytes):
+            path, size = self._files.popleft()
+            self._total_bytes -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,171 @@
+import os
+import ast
+import csv
+import json
+import time
+import random
+import argparse
+import datetime
+import itertools
+import collections
+
+import alarm_source
+
+# 合成 ALARM 数据生成器 (写入本地 SQLite 报警库，供离线数据源 / 基准测试使用)
+# 分布取自现场数据:
+# - 车站报警量: csv_data/q3_workshop.csv
+# - 各车站的 (报警类型, 设备类型) 构成: csv_data/q2_source.csv (未出现的车站使用全局构成)
+# - 报警等级: csv_data/q1_overview.csv，按 (车站, 设备类型) 条件抽样
+# - 高频报警描述、外电网报警占比: gen_report.py 中粘贴的统计结果
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+CSV_DIR = os.path.join(SCRIPT_DIR, "csv_data")
+SKYLIGHT_SUFFIX = "(检修状态:天窗修)"
+SWITCH_DEVICE_TYPES = {1, 23, 90}
+
+def read_extract(name):
+    with open(os.path.join(CSV_DIR, name), encoding="utf-8-sig", newline="") as f:
+        return list(csv.DictReader(f))
+
+def read_gen_report_stats():
+    """从 gen_report.py 中读取 top_alarm_des / alarm_level_counts / external_cnt 字面量 (不执行该脚本)"""
+    with open(os.path.join(SCRIPT_DIR, "gen_report.py"), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    wanted = {"top_alarm_des", "alarm_level_counts", "external_cnt"}
+    stats = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1:
+            name = getattr(node.targets[0], "id", None)
+            if name in wanted:
+                stats[name] = ast.literal_eval(node.value)
+    return stats
+
+def cumulative(weights):
+    return list(itertools.accumulate(weights))
+
+class AlarmGenerator:
+    def __init__(self, seed=42, skylight_ratio=0.3, processed_ratio=0.5):
+        self.rng = random.Random(seed)
+        self.processed_ratio = processed_ratio
+
+        # 车站 -> (报警类型, 设备类型) 构成；按 q3 的车站总量缩放
+        by_station = collections.defaultdict(list)
+        overall = collections.Counter()
+        for r in read_extract("q2_source.csv"):
+            key = (int(r["ALARMTYPE"]), int(r["DEVICETYPE"]))
+            by_station[r["TELENAME"]].append((key, int(r["CNT"])))
+            overall[key] += int(r["CNT"])
+        overall_total = sum(overall.values())
+
+        cells, weights = [], []
+        for r in read_extract("q3_workshop.csv"):
+            station, station_cnt = r["TELENAME"], int(r["CNT"])
+            mix = by_station.get(station) or list(overall.items())
+            mix_total = sum(c for _, c in mix) if station in by_station else overall_total
+            for (atype, dtype), c in mix:
+                cells.append((station, dtype, atype))
+                weights.append(station_cnt * c / mix_total)
+        self.cells = cells
+        self.cell_cum = cumulative(weights)
+
+        # 报警等级: (车站, 设备类型) -> 等级分布，缺失时退化到按设备类型 / 全局
+        levels = collections.defaultdict(collections.Counter)
+        for r in read_extract("q1_overview.csv"):
+            level, dtype, cnt = int(r["ALARMLEVEL"]), int(r["DEVICETYPE"]), int(r["CNT"])
+            levels[(r["TELENAME"], dtype)][level] += cnt
+            levels[dtype][level] += cnt
+            levels[None][level] += cnt
+        self.levels = {k: (list(v), cumulative(v.values())) for k, v in levels.items()}
+
+        # 报警描述: 高频描述按 gen_report.py 的计数抽样，其余为长尾描述
+        stats = read_gen_report_stats()
+        total = sum(stats["alarm_level_counts"].values())
+        heavy = stats["top_alarm_des"]
+        heavy_total = sum(c for _, c in heavy)
+        self.heavy_des = [d for d, _ in heavy]
+        self.heavy_cum = cumulative(c for _, c in heavy)
+        self.heavy_ratio = heavy_total / total
+        self.ext_ratio = stats["external_cnt"] / (total - heavy_total)
+        heavy_sky = sum(c for d, c in heavy if d.endswith(SKYLIGHT_SUFFIX)) / total
+        # 长尾描述中天窗修的比例，使总体天窗占比接近 skylight_ratio
+        self.tail_sky_ratio = min(1.0, max(0.0, (skylight_ratio - heavy_sky) / (1 - self.heavy_ratio)))
+
+        try:
+            with open(os.path.join(SCRIPT_DIR, "device_type_map.json"), encoding="utf-8") as f:
+                self.device_names = {int(k): v for k, v in json.load(f).items()}
+        except Exception:
+            self.device_names = {}
+
+    def level(self, station, dtype):
+        values, cum = self.levels.get((station, dtype)) or self.levels.get(dtype) or self.levels[None]
+        return self.rng.choices(values, cum_weights=cum)[0]
+
+    def description(self, dtype):
+        rng = self.rng
+        if rng.random() < self.heavy_ratio:
+            return rng.choices(self.heavy_des, cum_weights=self.heavy_cum)[0]
+        n = int(200 ** rng.random())  # 对数均匀: 编号越小越常见
+        roll = rng.random()
+        if roll < self.ext_ratio:
+            des = f"外电网{rng.choice('ABC')}相断电"
+        elif dtype in SWITCH_DEVICE_TYPES and roll < 0.3:
+            des = f"道岔缺口超标{n}"
+        elif roll > 0.98:
+            des = f"监测采集机通信中断{n}"
+        else:
+            des = f"{self.device_names.get(dtype, '设备')}报警{n}"
+        if rng.random() < self.tail_sky_ratio:
+            des += SKYLIGHT_SUFFIX
+        return des
+
+    def rows(self, count, start_ts, end_ts, batch_size=10000):
+        """产出 count 行，列顺序与 alarm_source.ALARM_COLUMNS 一致，createtime 在 [start_ts, end_ts) 内均匀分布"""
+        rng = self.rng
+        span = end_ts - start_ts
+        remaining = count
+        while remaining > 0:
+            k = min(batch_size, remaining)
+            remaining -= k
+            for station, dtype, atype in rng.choices(self.cells, cum_weights=self.cell_cum, k=k):
+                des = self.description(dtype)
+                yield (
+                    station,
+                    dtype,
+                    f"{rng.randint(1, 40)}DG" if rng.random() < 0.7 else None,
+                    atype,
+                    rng.randint(0, 5),
+                    self.level(station, dtype),
+                    des,
+                    1 if des.endswith(SKYLIGHT_SUFFIX) else 0,
+                    1 if rng.random() < self.processed_ratio else 0,
+                    start_ts + int(rng.random() * span)
+                )
+
+def main():
+    yesterday = datetime.datetime.now(datetime.timezone.utc).date() - datetime.timedelta(days=1)
+    parser = argparse.ArgumentParser(description="生成合成 ALARM 数据到本地 SQLite 报警库")
+    parser.add_argument("--db", default=os.path.join(SCRIPT_DIR, "alarm_local.db"), help="输出库文件")
+    parser.add_argument("--rows", type=int, default=1000000, help="生成的行数")
+    parser.add_argument("--end", default=str(yesterday), help="最后一天 (YYYY-MM-DD，含)，默认昨天")
+    parser.add_argument("--days", type=int, default=400, help="覆盖的天数")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skylight-ratio", type=float, default=0.3, help="天窗修报警占比")
+    parser.add_argument("--processed-ratio", type=float, default=0.5, help="已处理报警占比")
+    parser.add_argument("--append", action="store_true", help="追加到已有数据 (默认先清空)")
+    args = parser.parse_args()
+
+    end_ts = alarm_source.date_to_ts(args.end) + 86400
+    start_ts = end_ts - args.days * 86400
+    gen = AlarmGenerator(args.seed, args.skylight_ratio, args.processed_ratio)
+
+    t0 = time.perf_counter()
+    alarm_source.load_rows(
+        args.db,
+        [(f"generator (seed={args.seed})", gen.rows(args.rows, start_ts, end_ts))],
+        replace=not args.append
+    )
+    first_day = datetime.datetime.fromtimestamp(start_ts, datetime.timezone.utc).date()
+    print(f"Generated {args.rows} rows ({first_day} ~ {args.end}) into {args.db} in {time.perf_counter() - t0:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import gzip
+import json
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 报表响应的编码
+# - dumps / ReportJSONResponse: 报表结果是几十 KB 的嵌套 dict/list，直接序列化为 UTF-8 JSON，
+#   不经过 FastAPI 对返回值的 jsonable_encoder 遍历；安装了 orjson 时用 orjson，否则用标准库 json (输出等价)。
+# - CompressionMiddleware: 响应体不小于 minimum_size 时按请求头 Accept-Encoding 协商压缩，
+#   br (需安装 brotli) 优先于 gzip；q 值高者优先，q=0 表示拒绝。流式响应 (分多段发送) 不压缩。
+#   可压缩的响应无论客户端是否接受压缩都带 Vary: Accept-Encoding，避免中间缓存把一种编码返回给另一类客户端；
+#   不小于 threadpool_min_size 的响应体在线程池中压缩，不阻塞事件循环。
+
+ORJSON_OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY) if orjson is not None else 0
+
+# 可压缩的内容类型
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+def dumps(data):
+    """对象 -> UTF-8 JSON bytes (紧凑格式，不转义中文)"""
+    if orjson is not None:
+        return orjson.dumps(data, option=ORJSON_OPTIONS)
+    return json.dumps(data, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+class ReportJSONResponse(JSONResponse):
+    def render(self, content):
+        return dumps(content)
+
+def available_encodings():
+    """服务端支持的压缩方式，按优先顺序"""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+def negotiate(accept_encoding, encodings):
+    """
+    按 Accept-Encoding 从 encodings (服务端优先顺序) 中选出压缩方式，都不接受时返回 None。
+    例: "gzip, deflate, br" -> br；"br;q=0.5, gzip" -> gzip；"*;q=0" -> None
+    """
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name] = q
+    best, best_q = None, 0.0
+    for encoding in encodings:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+class CompressionMiddleware:
+    """gzip / br 响应压缩 (ASGI 中间件)"""
+
+    def __init__(self, app, minimum_size=1024, gzip_level=6, brotli_quality=4, threadpool_min_size=65536):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.threadpool_min_size = threadpool_min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.encodings = available_encodings()
+
+    def compress(self, body, encoding):
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""), self.encodings)
+        start = None
+
+        async def send_compressed(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                # 等到第一段响应体才能决定是否压缩
+                start = message
+                return
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+            body = message.get("body", b"")
+            headers = MutableHeaders(scope=start)
+            content_type = headers.get("content-type", "")
+            if (message.get("more_body", False)
+                    or len(body) < self.minimum_size
+                    or "content-encoding" in headers
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)):
+                await send(start)
+                start = None
+                await send(message)
+                return
+            headers.add_vary_header("Accept-Encoding")
+            if encoding is not None:
+                if len(body) >= self.threadpool_min_size:
+                    body = await run_in_threadpool(self.compress, body, encoding)
+                else:
+                    body = self.compress(body, encoding)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+            await send(start)
+            start = None
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
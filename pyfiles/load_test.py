@@ -0,0 +1,250 @@
+import json
+import time
+import random
+import asyncio
+import argparse
+import datetime
+import collections
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+# 报表接口压测客户端 (取代逐个调用接口的 trigger_reports.py)
+# 以 asyncio + httpx 并发调用报表接口，每个请求随机选择接口与日期范围:
+#   范围天数从 --range-days 中随机取，结束日期在 [--start, --end] 内随机 (--fixed 时固定用 --start ~ --end，接口按顺序轮流)。
+# 并发数 --concurrency 限制同时在途的请求数；--rate 限制总发送速率 (次/秒，0 为不限)；
+# 压测持续 --duration 秒，或发送 --requests 个请求后结束。
+# 汇总: 每个接口与整体的 p50/p95/p99 延迟、吞吐、错误分类 (HTTP 状态码或异常类型)、X-Cache 分布，
+# 以及服务端 Server-Timing 头中各阶段的耗时。--out 写入 JSON，--append 追加一行到 JSONL 文件以便长期跟踪。
+#
+#   python load_test.py                                   # 单并发、四个接口、30 秒
+#   python load_test.py --concurrency 8 --rate 20 --duration 60 --range-days 7,30 --out load.json
+#   python load_test.py --fixed --start 2023-11-01 --end 2023-11-07 --requests 4    # 原 trigger_reports.py 的冒烟测试
+
+DEFAULT_ENDPOINTS = (
+    "/report/part1_overview",
+    "/report/part2_hazards",
+    "/report/part3_trends",
+    "/report/part4_skylight"
+)
+
+def percentile(values, p):
+    """线性插值的百分位数 (values 已排序)"""
+    if not values:
+        return None
+    k = (len(values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+def parse_server_timing(header):
+    """'connect;dur=1.2, execute;dur=30.5, total;dur=40' -> {"connect": 1.2, ...} (毫秒)"""
+    stages = {}
+    for part in header.split(","):
+        fields = part.strip().split(";")
+        for field in fields[1:]:
+            key, _, value = field.strip().partition("=")
+            if key == "dur":
+                try:
+                    stages[fields[0].strip()] = float(value)
+                except ValueError:
+                    pass
+    return stages
+
+class DateRanges:
+    def __init__(self, start, end, range_days, fixed=False, seed=None):
+        self.start = datetime.date.fromisoformat(start)
+        self.end = datetime.date.fromisoformat(end)
+        if self.end < self.start:
+            raise ValueError("--end must not be earlier than --start")
+        self.range_days = range_days
+        self.fixed = fixed
+        self.random = random.Random(seed)
+
+    def pick(self):
+        if self.fixed:
+            return self.start.isoformat(), self.end.isoformat()
+        window = (self.end - self.start).days + 1
+        days = min(self.random.choice(self.range_days), window)
+        end = self.start + datetime.timedelta(days=self.random.randrange(days - 1, window))
+        return (end - datetime.timedelta(days=days - 1)).isoformat(), end.isoformat()
+
+class Stats:
+    def __init__(self):
+        self.latencies = []
+        self.errors = collections.Counter()
+        self.cache = collections.Counter()
+        self.server_timing = collections.defaultdict(list)
+        self.bytes = 0
+
+    def record(self, latency_ms, error=None, cache=None, timing=None, size=0):
+        if error is not None:
+            self.errors[error] += 1
+            return
+        self.latencies.append(latency_ms)
+        self.bytes += size
+        if cache:
+            self.cache[cache] += 1
+        for stage, ms in (timing or {}).items():
+            self.server_timing[stage].append(ms)
+
+    def summary(self, elapsed):
+        lat = sorted(self.latencies)
+        ok = len(lat)
+        total = ok + sum(self.errors.values())
+
+        def ms(value):
+            return round(value, 1) if value is not None else None
+
+        return {
+            "requests": total,
+            "ok": ok,
+            "errors": dict(self.errors),
+            "error_rate": round((total - ok) / total, 4) if total else 0.0,
+            "throughput_rps": round(ok / elapsed, 2) if elapsed > 0 else 0.0,
+            "latency_ms": {
+                "p50": ms(percentile(lat, 50)),
+                "p95": ms(percentile(lat, 95)),
+                "p99": ms(percentile(lat, 99)),
+                "max": ms(lat[-1] if lat else None),
+                "mean": ms(sum(lat) / ok if ok else None)
+            },
+            "bytes": self.bytes,
+            "cache": dict(self.cache),
+            "server_timing_ms": {
+                stage: {"mean": ms(sum(v) / len(v)), "p95": ms(percentile(sorted(v), 95))}
+                for stage, v in sorted(self.server_timing.items())
+            }
+        }
+
+async def send(client, endpoint, body, request_id, stats):
+    t0 = time.perf_counter()
+    try:
+        resp = await client.post(endpoint, json=body, headers={"X-Request-ID": request_id})
+        await resp.aread()
+    except httpx.HTTPError as e:
+        error = type(e).__name__
+        for s in stats:
+            s.record(None, error=error)
+        return
+    latency_ms = (time.perf_counter() - t0) * 1000
+    if resp.status_code != 200:
+        for s in stats:
+            s.record(latency_ms, error=f"HTTP {resp.status_code}")
+        return
+    timing = parse_server_timing(resp.headers.get("Server-Timing", ""))
+    for s in stats:
+        s.record(latency_ms, cache=resp.headers.get("X-Cache"), timing=timing,
+                 size=int(resp.headers.get("Content-Length", len(resp.content))))
+
+async def run_load(args, ranges):
+    overall = Stats()
+    per_endpoint = {ep: Stats() for ep in args.endpoints}
+    pick = random.Random(args.seed)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    tasks = set()
+    sent = 0
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        started = time.perf_counter()
+        deadline = started + args.duration
+        while (sent < args.requests) if args.requests else (time.perf_counter() < deadline):
+            if args.rate > 0:
+                # 按固定节拍发送；前面的请求积压时不追赶，避免瞬时突发
+                delay = started + sent / args.rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await semaphore.acquire()
+            # --fixed 时按顺序轮流调用各接口 (--requests 4 即每个接口一次)，否则随机选择
+            endpoint = args.endpoints[sent % len(args.endpoints)] if args.fixed else pick.choice(args.endpoints)
+            start_date, end_date = ranges.pick()
+            body = {"start_date": start_date, "end_date": end_date}
+            request_id = f"load-{args.run_id}-{sent}"
+            task = asyncio.ensure_future(send(client, endpoint, body, request_id, (overall, per_endpoint[endpoint])))
+            task.add_done_callback(lambda _: semaphore.release())
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            sent += 1
+        if tasks:
+            await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+    return elapsed, overall, per_endpoint
+
+def print_summary(name, summary):
+    lat = summary["latency_ms"]
+
+    def fmt(value):
+        return f"{value:>8.1f}" if value is not None else f"{'-':>8}"
+
+    errors = ", ".join(f"{k} x{v}" for k, v in summary["errors"].items()) or "-"
+    cache = ", ".join(f"{k} {v}" for k, v in sorted(summary["cache"].items())) or "-"
+    print(f"{name:26s} {summary['ok']:>6d}/{summary['requests']:<6d} {summary['throughput_rps']:>8.2f}/s"
+          f" p50 {fmt(lat['p50'])}  p95 {fmt(lat['p95'])}  p99 {fmt(lat['p99'])} ms  errors: {errors}  cache: {cache}")
+
+def main():
+    parser = argparse.ArgumentParser(description="报表接口并发压测")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--endpoints", default=",".join(DEFAULT_ENDPOINTS), help="接口路径，逗号分隔")
+    parser.add_argument("--concurrency", type=int, default=1, help="同时在途的最大请求数")
+    parser.add_argument("--rate", type=float, default=0, help="总发送速率 (次/秒)，0 为不限")
+    parser.add_argument("--duration", type=float, default=30, help="压测时长 (秒)")
+    parser.add_argument("--requests", type=int, default=0, help="发送的请求总数；指定时忽略 --duration")
+    parser.add_argument("--start", default="2023-11-01", help="日期范围可选区间的第一天")
+    parser.add_argument("--end", default="2023-12-31", help="日期范围可选区间的最后一天")
+    parser.add_argument("--range-days", default="1,7,30", help="随机选择的范围天数，逗号分隔")
+    parser.add_argument("--fixed", action="store_true", help="每个请求都使用 --start ~ --end，接口按顺序轮流调用")
+    parser.add_argument("--seed", type=int, help="随机种子 (复现同一组请求)")
+    parser.add_argument("--timeout", type=float, default=300, help="单个请求超时 (秒)")
+    parser.add_argument("--out", help="结果输出文件 (JSON)")
+    parser.add_argument("--append", help="把结果追加为一行到 JSONL 文件，便于长期跟踪")
+    args = parser.parse_args()
+
+    if httpx is None:
+        raise SystemExit("httpx not installed (pip install httpx)")
+    if args.concurrency < 1:
+        raise SystemExit("--concurrency must be at least 1")
+    args.endpoints = [ep.strip() for ep in args.endpoints.split(",") if ep.strip()]
+    args.run_id = time.strftime("%Y%m%d%H%M%S")
+    try:
+        ranges = DateRanges(args.start, args.end, [int(d) for d in args.range_days.split(",")], args.fixed, args.seed)
+    except ValueError as e:
+        raise SystemExit(f"Invalid date range options: {e}")
+
+    mode = f"{args.requests} requests" if args.requests else f"{args.duration:g}s"
+    rate = f"{args.rate:g}/s" if args.rate > 0 else "unlimited"
+    print(f"Load testing {args.base_url}: {mode}, concurrency {args.concurrency}, rate {rate}")
+    print("-" * 50)
+    elapsed, overall, per_endpoint = asyncio.run(run_load(args, ranges))
+
+    results = {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "base_url": args.base_url,
+        "config": {
+            "concurrency": args.concurrency, "rate": args.rate, "duration": args.duration,
+            "requests": args.requests, "start": args.start, "end": args.end,
+            "range_days": args.range_days, "fixed": args.fixed, "seed": args.seed
+        },
+        "elapsed_s": round(elapsed, 3),
+        "overall": overall.summary(elapsed),
+        "endpoints": {ep: s.summary(elapsed) for ep, s in per_endpoint.items()}
+    }
+    for ep, summary in results["endpoints"].items():
+        print_summary(ep, summary)
+    print("-" * 50)
+    print_summary("overall", results["overall"])
+    stages = results["overall"]["server_timing_ms"]
+    if stages:
+        print("server timing (mean ms): " + "  ".join(f"{k} {v['mean']}" for k, v in stages.items()))
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\nResults saved to {args.out}")
+    if args.append:
+        with open(args.append, "a", encoding="utf-8") as f:
+            f.write(json.dumps(results, ensure_ascii=False) + "\n")
+
+if __name__ == "__main__":
+    main()
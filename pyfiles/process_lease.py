@@ -0,0 +1,70 @@
+import os
+import time
+import socket
+import sqlite3
+
+# 跨进程租约 (本地 SQLite)
+# uvicorn 以多个 worker 进程运行时，每个进程都会启动自己的汇总库刷新线程和预计算调度器。
+# 同一时间只应由一个进程执行的工作，开始前先取得同名租约，取不到的进程跳过:
+#   acquire(name, ttl)  在 BEGIN IMMEDIATE 事务中检查并写入 (持有者, 过期时间)，同一时刻只有一个进程成功；
+#                       本进程已持有时再次 acquire 即续期
+#   release(name)       只释放本进程持有的租约
+# 持有者崩溃时租约在 ttl 秒后过期，由其他进程接手；长任务期间应再次 acquire 续期。
+# 持有者按 "主机名:进程号" 区分，同一进程内的多个线程需另用线程锁互斥。
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS process_lease (
+        name TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        expires REAL NOT NULL
+    )
+"""
+
+class LeaseStore:
+    def __init__(self, path, owner=None):
+        self.path = path
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        conn = self._connect()
+        try:
+            conn.execute(SCHEMA)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        # 自动提交模式，事务由 BEGIN IMMEDIATE 显式开始
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def acquire(self, name, ttl):
+        """取得或续期租约，成功返回 True；其他进程持有未过期的租约时返回 False"""
+        conn = self._connect()
+        try:
+            # BEGIN IMMEDIATE 立即取得写锁，两个进程不会同时读到 "无人持有"
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            row = conn.execute("SELECT owner, expires FROM process_lease WHERE name = ?", (name,)).fetchone()
+            if row is not None and row[0] != self.owner and row[1] > now:
+                conn.execute("ROLLBACK")
+                return False
+            conn.execute("INSERT OR REPLACE INTO process_lease VALUES (?, ?, ?)", (name, self.owner, now + ttl))
+            conn.execute("COMMIT")
+            return True
+        finally:
+            conn.close()
+
+    def release(self, name):
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM process_lease WHERE name = ? AND owner = ?", (name, self.owner))
+        finally:
+            conn.close()
+
+    def holder(self, name):
+        """当前持有租约的进程，无人持有或已过期时返回 None"""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT owner FROM process_lease WHERE name = ? AND expires > ?", (name, time.time())
+            ).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else None
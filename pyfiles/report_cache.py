@@ -0,0 +1,143 @@
+import json
+import sqlite3
+import threading
+import time
+import datetime
+import collections
+import contextlib
+
+# 报表结果缓存 (两级)
+# - 内存: 有容量上限的 LRU，条目带过期时间
+# - 磁盘: 可选的 SQLite 文件，服务重启后仍可命中；内存未命中时回查并提升到内存
+# 结束日期早于今天 (UTC) 的范围数据不再变化，按 closed_ttl 长期保存；
+# 包含今天的范围仍在变化，只保存 open_ttl 秒。
+
+class ReportCache:
+    def __init__(self, max_entries=256, closed_ttl=7 * 86400, open_ttl=300, disk_path=None):
+        self.max_entries = max_entries
+        self.closed_ttl = closed_ttl
+        self.open_ttl = open_ttl
+        self.disk_path = disk_path
+        self._memory = collections.OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        if disk_path:
+            with self._connect() as conn:
+                conn.executescript("""
+                    CREATE TABLE IF NOT EXISTS report_cache (
+                        key TEXT PRIMARY KEY,
+                        endpoint TEXT NOT NULL,
+                        start_date TEXT NOT NULL,
+                        end_date TEXT NOT NULL,
+                        expires_at REAL NOT NULL,
+                        payload TEXT NOT NULL
+                    );
+                    CREATE INDEX IF NOT EXISTS idx_report_cache_expires ON report_cache (expires_at);
+                """)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.disk_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def make_key(endpoint, start_date, end_date):
+        return f"{endpoint}|{start_date}|{end_date}"
+
+    def ttl_for(self, end_date):
+        """结束日期早于今天的范围视为不可变"""
+        try:
+            end = datetime.datetime.strptime(end_date, "%Y-%m-%d").date()
+        except (TypeError, ValueError):
+            return self.open_ttl
+        today = datetime.datetime.now(datetime.timezone.utc).date()
+        return self.closed_ttl if end < today else self.open_ttl
+
+    def get(self, endpoint, start_date, end_date):
+        """返回 (value, tier)，tier 为 "memory" / "disk"；未命中返回 None"""
+        key = self.make_key(endpoint, start_date, end_date)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return entry[1], "memory"
+                del self._memory[key]
+
+        if self.disk_path:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT expires_at, payload FROM report_cache WHERE key = ? AND expires_at > ?",
+                    (key, now)
+                ).fetchone()
+            if row is not None:
+                value = json.loads(row[1])
+                self._remember(key, row[0], value)
+                with self._lock:
+                    self.stats["disk_hits"] += 1
+                return value, "disk"
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, endpoint, start_date, end_date, value):
+        key = self.make_key(endpoint, start_date, end_date)
+        expires_at = time.time() + self.ttl_for(end_date)
+        self._remember(key, expires_at, value)
+        if self.disk_path:
+            payload = json.dumps(value, ensure_ascii=False)
+            with self._connect() as conn:
+                conn.execute("DELETE FROM report_cache WHERE expires_at <= ?", (time.time(),))
+                conn.execute(
+                    "INSERT OR REPLACE INTO report_cache VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, endpoint, start_date, end_date, expires_at, payload)
+                )
+
+    def _remember(self, key, expires_at, value):
+        with self._lock:
+            self._memory[key] = (expires_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def invalidate(self, endpoint=None, start_date=None, end_date=None):
+        """删除匹配的条目 (未指定的条件视为全部匹配)，返回删除的条目数"""
+        def match(ep, s, e):
+            return ((endpoint is None or ep == endpoint)
+                    and (start_date is None or s == start_date)
+                    and (end_date is None or e == end_date))
+
+        removed = set()
+        with self._lock:
+            for key in list(self._memory):
+                if match(*key.split("|")):
+                    del self._memory[key]
+                    removed.add(key)
+
+        if self.disk_path:
+            conds, params = [], []
+            for col, val in (("endpoint", endpoint), ("start_date", start_date), ("end_date", end_date)):
+                if val is not None:
+                    conds.append(f"{col} = ?")
+                    params.append(val)
+            where = f"WHERE {' AND '.join(conds)}" if conds else ""
+            with self._connect() as conn:
+                keys = [r[0] for r in conn.execute(f"SELECT key FROM report_cache {where}", params)]
+                conn.execute(f"DELETE FROM report_cache {where}", params)
+            removed.update(keys)
+        return len(removed)
+
+    def snapshot(self):
+        with self._lock:
+            info = dict(self.stats)
+            info["memory_entries"] = len(self._memory)
+        info["max_entries"] = self.max_entries
+        info["disk_path"] = self.disk_path
+        return info
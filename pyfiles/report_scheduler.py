@@ -0,0 +1,228 @@
+import time
+import random
+import asyncio
+import datetime
+
+# 报表预计算调度
+# 标准周期结束后立即计算并缓存报表，早上的 Dify 调用直接命中缓存。
+# 每个任务: {"name", "cron", "period", "endpoints"}
+#   cron     5 段 cron 表达式 "分 时 日 月 周" (支持 * , - /；周 0 和 7 都表示周日；日与周都限定时满足其一即可)
+#   period   触发时刻对应的报表周期，见 PERIODS: previous_week (上一个 ISO 周，周一至周日) / previous_month (上一个自然月)
+#   endpoints 依次计算的报表接口
+# 触发时间默认按 UTC 计算，与报表缓存、日汇总库判断 "已关账" 的口径一致 (结束日期早于 UTC 今天)。
+# 每个接口的计算失败后按指数退避重试 (backoff * 2^n 秒，不超过 backoff_max，加少量随机抖动)，
+# 所有任务共用 concurrency 个并发名额，避免与在线请求争抢数据库。
+# 多个 worker 进程各自运行调度器时，传入 lease (process_lease.LeaseStore): 每次执行先取得
+# "precompute.<任务>.<开始>.<结束>" 租约，同一周期同一时间只有一个进程计算，其余进程记为 skipped。
+
+FIELD_RANGES = (
+    ("minute", 0, 59),
+    ("hour", 0, 23),
+    ("day", 1, 31),
+    ("month", 1, 12),
+    ("weekday", 0, 7)
+)
+
+def _parse_field(text, low, high):
+    values = set()
+    for part in text.split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+            if step < 1:
+                raise ValueError(f"Invalid cron step: {step_text}")
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start_text, end_text = part.split("-", 1)
+            start, end = int(start_text), int(end_text)
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if not low <= start <= end <= high:
+            raise ValueError(f"Cron value out of range {low}-{high}: {part}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+class CronRule:
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression!r}")
+        self.expression = expression
+        parsed = [_parse_field(text, low, high) for text, (_, low, high) in zip(fields, FIELD_RANGES)]
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        # cron 的周: 0/7 = 周日；换成 datetime.weekday() 的口径 (0 = 周一)
+        self.weekdays = frozenset((w - 1) % 7 for w in weekdays)
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+
+    def _day_matches(self, dt):
+        in_days = dt.day in self.days
+        in_weekdays = dt.weekday() in self.weekdays
+        if self._any_day or self._any_weekday:
+            return in_days and in_weekdays
+        return in_days or in_weekdays
+
+    def matches(self, dt):
+        return (dt.minute in self.minutes and dt.hour in self.hours
+                and dt.month in self.months and self._day_matches(dt))
+
+    def next_after(self, dt):
+        """严格晚于 dt 的下一个触发时刻 (精确到分钟)"""
+        t = dt.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        limit = t + datetime.timedelta(days=366 * 5)
+        while t < limit:
+            if t.month not in self.months:
+                t = (t.replace(day=1) + datetime.timedelta(days=32)).replace(day=1, hour=0, minute=0)
+            elif not self._day_matches(t):
+                t = (t + datetime.timedelta(days=1)).replace(hour=0, minute=0)
+            elif t.hour not in self.hours:
+                t = (t + datetime.timedelta(hours=1)).replace(minute=0)
+            elif t.minute not in self.minutes:
+                t += datetime.timedelta(minutes=1)
+            else:
+                return t
+        raise ValueError(f"Cron expression never fires: {self.expression!r}")
+
+def previous_week(dt):
+    """dt 所在 ISO 周的上一周 (周一, 周日)"""
+    monday = dt.date() - datetime.timedelta(days=dt.weekday() + 7)
+    return monday, monday + datetime.timedelta(days=6)
+
+def previous_month(dt):
+    """dt 所在月的上一个自然月 (1 日, 月末)"""
+    last_day = dt.date().replace(day=1) - datetime.timedelta(days=1)
+    return last_day.replace(day=1), last_day
+
+PERIODS = {
+    "previous_week": previous_week,
+    "previous_month": previous_month
+}
+
+class ReportScheduler:
+    """
+    在事件循环中运行的调度器。run(endpoint, start_date, end_date) 为计算并缓存一个报表的协程函数，
+    返回值 (如缓存状态) 记入任务状态；抛出异常视为失败并重试。
+    """
+
+    def __init__(self, jobs, run, concurrency=1, max_attempts=4, backoff=60, backoff_max=1800, utc=True,
+                 lease=None, lease_ttl=7200):
+        self.run = run
+        self.lease = lease
+        self.lease_ttl = lease_ttl
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.utc = utc
+        self.jobs = {}
+        for job in jobs:
+            if job["period"] not in PERIODS:
+                raise ValueError(f"Unknown period {job['period']!r} in job {job['name']!r}")
+            self.jobs[job["name"]] = {
+                "name": job["name"],
+                "rule": CronRule(job["cron"]),
+                "period": job["period"],
+                "endpoints": list(job["endpoints"]),
+                "next_run": None,
+                "last_run": None
+            }
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._loop_task = None
+        self._runs = set()
+
+    def now(self):
+        if self.utc:
+            return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        return datetime.datetime.now()
+
+    def start(self, catch_up=False):
+        """在事件循环中启动；catch_up=True 时先为每个任务计算一次当前的上一周期 (已缓存的直接命中)"""
+        now = self.now()
+        for job in self.jobs.values():
+            job["next_run"] = job["rule"].next_after(now)
+            if catch_up:
+                self.trigger(job["name"], now)
+        self._loop_task = asyncio.ensure_future(self._loop())
+
+    async def stop(self):
+        tasks = [t for t in [self._loop_task, *self._runs] if t is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._loop_task = None
+
+    def trigger(self, name, at=None):
+        """立即执行一个任务，周期按 at (默认当前时刻) 计算"""
+        job = self.jobs[name]
+        start, end = PERIODS[job["period"]](at or self.now())
+        task = asyncio.ensure_future(self._run_job(job, start.isoformat(), end.isoformat()))
+        self._runs.add(task)
+        task.add_done_callback(self._runs.discard)
+        return start.isoformat(), end.isoformat()
+
+    async def _loop(self):
+        while True:
+            now = self.now()
+            for job in self.jobs.values():
+                if job["next_run"] <= now:
+                    self.trigger(job["name"], job["next_run"])
+                    job["next_run"] = job["rule"].next_after(now)
+            wake = min(job["next_run"] for job in self.jobs.values())
+            # 最多睡 60 秒后重新对时，系统时间调整后不会错过触发
+            await asyncio.sleep(min(max((wake - now).total_seconds(), 0.0), 60))
+
+    async def _run_job(self, job, start_date, end_date):
+        run = {"start_date": start_date, "end_date": end_date,
+               "started": time.strftime("%Y-%m-%d %H:%M:%S"), "finished": None, "endpoints": {}}
+        job["last_run"] = run
+        lease_name = f"precompute.{job['name']}.{start_date}.{end_date}"
+        if self.lease is not None and not await asyncio.to_thread(self.lease.acquire, lease_name, self.lease_ttl):
+            run["skipped"] = "running in another process"
+            run["finished"] = time.strftime("%Y-%m-%d %H:%M:%S")
+            return
+        try:
+            for endpoint in job["endpoints"]:
+                if self.lease is not None:
+                    # 每个接口开始前续期 (重试退避可能较长)
+                    await asyncio.to_thread(self.lease.acquire, lease_name, self.lease_ttl)
+                run["endpoints"][endpoint] = await self._run_endpoint(job["name"], endpoint, start_date, end_date)
+            run["finished"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        finally:
+            if self.lease is not None:
+                # 被取消 (停止服务) 时也释放，不在 finally 中 await
+                self.lease.release(lease_name)
+
+    async def _run_endpoint(self, name, endpoint, start_date, end_date):
+        attempt = 0
+        while True:
+            attempt += 1
+            t0 = time.perf_counter()
+            try:
+                async with self._semaphore:
+                    result = await self.run(endpoint, start_date, end_date)
+                return {"status": "ok", "result": result, "attempts": attempt,
+                        "elapsed_ms": round((time.perf_counter() - t0) * 1000, 1)}
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt >= self.max_attempts:
+                    print(f"Warning: Precompute {name}/{endpoint} {start_date}~{end_date} failed after {attempt} attempts: {e}")
+                    return {"status": "failed", "error": str(e), "attempts": attempt}
+                delay = min(self.backoff * 2 ** (attempt - 1), self.backoff_max)
+                delay += random.uniform(0, delay * 0.1)
+                print(f"Warning: Precompute {name}/{endpoint} {start_date}~{end_date} failed ({e}), retrying in {delay:.0f}s")
+                await asyncio.sleep(delay)
+
+    def status(self):
+        return {
+            name: {
+                "cron": job["rule"].expression,
+                "period": job["period"],
+                "endpoints": job["endpoints"],
+                "next_run": job["next_run"].isoformat(sep=" ") if job["next_run"] else None,
+                "last_run": job["last_run"]
+            }
+            for name, job in self.jobs.items()
+        }
@@ -0,0 +1,169 @@
+import time
+import pstats
+import cProfile
+import threading
+import functools
+import contextlib
+import contextvars
+import tracemalloc
+
+# 单次请求的分阶段计时与按需性能剖析
+# - RequestTimings: 请求开始时放入 CURRENT，查询计时 (record_query) 与 span(name) 累加到其中，最后生成 Server-Timing 响应头。
+#   阶段: connect (借用连接) / execute / fetch (纯取数) / aggregate (Python 统计) / serialize，另有按名称的 span (如 part2.classify)。
+#   同一报表中并发执行的查询各自累加，因此各阶段之和可能大于总耗时。
+# - span 在流式消费 (边取数边统计) 中使用时，扣除其间当前查询 (CURRENT_QUERY) 的取数时间，只计 Python 部分；
+#   同名 span 嵌套时只记录最外层。
+# - Profiler: cProfile + tracemalloc。被剖析的计算在独立线程的事件循环中执行 (见 api_server.profiled_report)，
+#   不与其他请求共用事件循环线程。Python 3.12 之前 cProfile 只剖析启用它的线程，因此在该线程和每个查询线程中
+#   分别启用后合并，结果只含本请求；3.12 起 cProfile 是进程级的，一个 profiler 即覆盖所有线程 (查询线程中再启用会失败，跳过)，
+#   剖析期间其他请求的执行也会计入。tracemalloc 同样是进程级的，其他请求的分配也会计入。
+
+CURRENT = contextvars.ContextVar("request_timings", default=None)
+CURRENT_QUERY = contextvars.ContextVar("current_query_timing", default=None)
+PROFILER = contextvars.ContextVar("request_profiler", default=None)
+_ACTIVE_SPANS = contextvars.ContextVar("active_spans", default=frozenset())
+
+STAGES = ("connect", "execute", "fetch", "aggregate", "serialize")
+
+class RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self._stages[stage] = self._stages.get(stage, 0.0) + seconds
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._stages)
+
+    def header(self):
+        """Server-Timing 头的值: 固定阶段在前，其余 span 按名称排序，最后是总耗时 (毫秒)"""
+        stages = self.snapshot()
+        names = [s for s in STAGES if s in stages] + sorted(s for s in stages if s not in STAGES)
+        parts = [f"{name};dur={stages[name] * 1000:.1f}" for name in names]
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(parts)
+
+def record_query(timing):
+    """把一条查询的 QueryTiming 计入当前请求"""
+    timings = CURRENT.get()
+    if timings is not None:
+        timings.add("connect", timing.acquire)
+        timings.add("execute", timing.execute)
+        timings.add("fetch", timing.fetch)
+        if timing.consume:
+            timings.add("aggregate", timing.consume)
+
+@contextlib.contextmanager
+def query_scope(timing):
+    """
+    run_query 执行单条查询期间: 记下该查询的计时供 span 扣除取数时间；
+    流式消费的耗时由 record_query 整体计入 aggregate，其中嵌套的 aggregate span 不再重复计入。
+    """
+    query_token = CURRENT_QUERY.set(timing)
+    span_token = _ACTIVE_SPANS.set(_ACTIVE_SPANS.get() | {"aggregate"})
+    try:
+        yield
+    finally:
+        _ACTIVE_SPANS.reset(span_token)
+        CURRENT_QUERY.reset(query_token)
+
+@contextlib.contextmanager
+def span(name):
+    timings = CURRENT.get()
+    active = _ACTIVE_SPANS.get()
+    if timings is None or name in active:
+        yield
+        return
+    token = _ACTIVE_SPANS.set(active | {name})
+    query = CURRENT_QUERY.get()
+    fetched = query.fetch if query is not None else 0.0
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        if query is not None:
+            elapsed -= query.fetch - fetched
+        _ACTIVE_SPANS.reset(token)
+        timings.add(name, max(elapsed, 0.0))
+
+def timed(name):
+    """函数装饰器形式的 span"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+class Profiler:
+    def __init__(self):
+        self._stats = None
+        self._snapshot = None
+        self._peak = 0
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def profile(self):
+        """在当前线程中启用 cProfile，退出时并入汇总结果"""
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+        except ValueError:
+            # 3.12+: 已有 profiler 在进程范围内生效，本线程已被覆盖
+            prof = None
+        try:
+            yield
+        finally:
+            if prof is not None:
+                prof.disable()
+                with self._lock:
+                    if self._stats is None:
+                        self._stats = pstats.Stats(prof)
+                    else:
+                        self._stats.add(prof)
+
+    @contextlib.contextmanager
+    def trace_memory(self):
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            self._snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            ))
+            self._peak = tracemalloc.get_traced_memory()[1]
+            if started:
+                tracemalloc.stop()
+
+    def report(self, top=30):
+        """自身耗时最多的 top 个函数与分配内存最多的 top 个代码行"""
+        functions = []
+        if self._stats is not None:
+            entries = sorted(self._stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:top]
+            for (filename, line, func), (_, ncalls, tottime, cumtime, _) in entries:
+                functions.append({
+                    "function": f"{filename}:{line}({func})",
+                    "ncalls": ncalls,
+                    "tottime_ms": round(tottime * 1000, 2),
+                    "cumtime_ms": round(cumtime * 1000, 2)
+                })
+        allocations = []
+        if self._snapshot is not None:
+            for stat in self._snapshot.statistics("lineno")[:top]:
+                frame = stat.traceback[0]
+                allocations.append({
+                    "location": f"{frame.filename}:{frame.lineno}",
+                    "size_kb": round(stat.size / 1024, 1),
+                    "count": stat.count
+                })
+        return {"functions": functions, "allocations": allocations, "peak_kb": round(self._peak / 1024, 1)}
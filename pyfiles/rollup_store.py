@@ -0,0 +1,333 @@
+import os
+import sqlite3
+import threading
+import time
+import datetime
+import contextlib
+
+import process_lease
+
+# 报警日汇总库 (本地 SQLite)
+# 已关账的天 (早于今天, UTC) 的报警按维度汇总为日计数后落地，报表接口的完整天范围直接读本地库，
+# 只有尚未关账的天才回查 Oracle。刷新器只拉取水位线之后的天，再加上一个复查窗口用于吸收
+# 事后补录的处理状态等迟到更新。
+# 多个 worker 进程共用同一个库时，刷新前先取得库内的跨进程租约 (见 process_lease)，同一时间只有一个进程刷新；
+# 最近一次刷新时间记在 rollup_meta 中，其他进程的定时刷新发现库刚被刷新过时直接跳过。
+
+DAY_SECONDS = 86400
+
+REFRESH_LEASE = "rollup.refresh"
+
+# alarmdes 关键词标记位，与 api_server.alarm_des_flags 口径一致
+DES_FLAG_EXT_POWER = 1   # "外电网"
+DES_FLAG_GAP = 2         # "缺口"
+DES_FLAG_MONITOR = 4     # "监测"
+
+# 日汇总维度 (alarm_daily 表中除 day / cnt 外的列)
+FACT_DIMS = (
+    "telename", "devicetype", "alarmtype", "alarmsubtype", "alarmlevel",
+    "skylight", "processed", "des_flags"
+)
+
+# Oracle 端日汇总查询 (:1 / :2 为 Unix 时间戳, 左闭右开)
+# 天窗 (maintanceflag != 0) 与处理状态 (processstatus != 0) 折算为 0/1；
+# 外电网/缺口/监测关键词在库内折算为标记位，避免按高基数的 alarmdes 分组。
+FACT_SQL = """
+    SELECT day, telename, devicetype, alarmtype, alarmsubtype, alarmlevel,
+           skylight, processed, des_flags, count(*) as cnt
+    FROM (
+        SELECT
+            FLOOR(createtime / 86400) as day,
+            telename, devicetype, alarmtype, alarmsubtype, alarmlevel,
+            case when maintanceflag != 0 then 1 else 0 end as skylight,
+            case when processstatus != 0 then 1 else 0 end as processed,
+            case when instr(alarmdes, '外电网') > 0 then 1 else 0 end
+              + case when instr(alarmdes, '缺口') > 0 then 2 else 0 end
+              + case when instr(alarmdes, '监测') > 0 then 4 else 0 end as des_flags
+        FROM ALARM
+        WHERE createtime >= :1 AND createtime < :2
+    )
+    GROUP BY day, telename, devicetype, alarmtype, alarmsubtype, alarmlevel,
+             skylight, processed, des_flags
+"""
+
+# 按描述的日计数 (第一部分 Top 10 隐患)
+DES_SQL = """
+    SELECT FLOOR(createtime / 86400) as day, alarmdes, count(*) as cnt
+    FROM ALARM
+    WHERE createtime >= :1 AND createtime < :2
+    GROUP BY FLOOR(createtime / 86400), alarmdes
+"""
+
+# 天窗报警按 (描述, 车站, 设备类型) 的日计数 (第四部分重点问题)
+SKYLIGHT_SQL = """
+    SELECT FLOOR(createtime / 86400) as day, alarmdes, telename, devicetype, count(*) as cnt
+    FROM ALARM
+    WHERE createtime >= :1 AND createtime < :2 AND maintanceflag != 0
+    GROUP BY FLOOR(createtime / 86400), alarmdes, telename, devicetype
+"""
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS alarm_daily (
+        day INTEGER NOT NULL,
+        telename TEXT,
+        devicetype INTEGER,
+        alarmtype INTEGER,
+        alarmsubtype INTEGER,
+        alarmlevel INTEGER,
+        skylight INTEGER NOT NULL,
+        processed INTEGER NOT NULL,
+        des_flags INTEGER NOT NULL,
+        cnt INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_alarm_daily_day ON alarm_daily (day);
+
+    CREATE TABLE IF NOT EXISTS alarm_daily_des (
+        day INTEGER NOT NULL,
+        alarmdes TEXT,
+        cnt INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_alarm_daily_des_day ON alarm_daily_des (day);
+
+    CREATE TABLE IF NOT EXISTS alarm_daily_skylight (
+        day INTEGER NOT NULL,
+        alarmdes TEXT,
+        telename TEXT,
+        devicetype INTEGER,
+        cnt INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_alarm_daily_skylight_day ON alarm_daily_skylight (day);
+
+    CREATE TABLE IF NOT EXISTS rollup_meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER
+    );
+"""
+
+def _strip(code):
+    return code.strip() if code else code
+
+def today_index():
+    """当前 UTC 日序号 (自 1970-01-01 起的天数)，小于它的天视为已关账"""
+    return int(time.time() // DAY_SECONDS)
+
+def project_facts(rows, dims, by_day=False):
+    """
+    把 FACT_SQL 的原始行 (含 day) 投影到 dims 维度并去掉 day 列，供未关账天与本地汇总合并；
+    by_day=True 时保留 day 作为第一列
+    """
+    idx = [FACT_DIMS.index(d) + 1 for d in dims]
+    out = []
+    for row in rows:
+        values = [row[i] for i in idx]
+        if "telename" in dims:
+            pos = dims.index("telename")
+            values[pos] = _strip(values[pos])
+        out.append((row[0], *values, row[-1]) if by_day else (*values, row[-1]))
+    return out
+
+def project_descriptions(rows):
+    """DES_SQL 原始行 -> (alarmdes, cnt)"""
+    return [(r[1], r[2]) for r in rows]
+
+def project_skylight_issues(rows):
+    """SKYLIGHT_SQL 原始行 -> (alarmdes, telename, devicetype, cnt)"""
+    return [(r[1], _strip(r[2]), r[3], r[4]) for r in rows]
+
+class AlarmRollupStore:
+    """
+    日汇总库。
+    - closed_until: 水位线 (日序号, 不含)，其之前的天均已落地
+    - min_day: 最早落地的天，早于它的范围不走汇总库
+    """
+
+    def __init__(self, path, recheck_days=3, initial_days=400, chunk_days=7, lease_ttl=600):
+        self.path = path
+        self.recheck_days = recheck_days
+        self.initial_days = initial_days
+        self.chunk_days = chunk_days
+        self.lease_ttl = lease_ttl
+        self.last_refresh = None
+        self.last_error = None
+        self._refresh_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+        self._lease = process_lease.LeaseStore(path)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """打开连接，正常退出时提交，异常时回滚，最后关闭"""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _read_meta(conn):
+        rows = dict(conn.execute("SELECT key, value FROM rollup_meta").fetchall())
+        if "closed_until" not in rows:
+            return None
+        return {"min_day": rows["min_day"], "closed_until": rows["closed_until"]}
+
+    def meta(self):
+        with self._connect() as conn:
+            return self._read_meta(conn)
+
+    def refreshed_at(self):
+        """任一进程最近一次完成刷新的时间 (Unix 时间戳)，从未刷新时为 None"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM rollup_meta WHERE key = 'refreshed_at'").fetchone()
+        return row[0] if row else None
+
+    # ---------------- 刷新 ----------------
+
+    def refresh(self, run_query, min_age=None):
+        """
+        增量刷新：从 (水位线 - 复查窗口) 拉到昨天为止，按 chunk_days 分批执行。
+        run_query(sql, binds, name=语句名) 在 Oracle 上执行查询并返回全部行。
+        返回本次刷新的天数；其他进程正在刷新，或 min_age 秒内已有进程刷新过时跳过，返回 None。
+        """
+        with self._refresh_lock:
+            if not self._lease.acquire(REFRESH_LEASE, self.lease_ttl):
+                return None
+            try:
+                refreshed_at = self.refreshed_at()
+                if min_age is not None and refreshed_at is not None and time.time() - refreshed_at < min_age:
+                    return None
+                return self._refresh(run_query)
+            finally:
+                self._lease.release(REFRESH_LEASE)
+
+    def _refresh(self, run_query):
+        """refresh 的主体，调用方已持有刷新租约"""
+        today = today_index()
+        meta = self.meta()
+        if meta is None:
+            start_day = today - self.initial_days
+            min_day = start_day
+        else:
+            min_day = meta["min_day"]
+            start_day = max(min_day, meta["closed_until"] - self.recheck_days)
+
+        day = start_day
+        try:
+            while day < today:
+                end_day = min(day + self.chunk_days, today)
+                self._refresh_chunk(run_query, day, end_day, min_day)
+                day = end_day
+                # 首次回填可能很长，每批之后续期
+                if not self._lease.acquire(REFRESH_LEASE, self.lease_ttl):
+                    raise RuntimeError("Rollup refresh lease was taken over by another process")
+            with self._connect() as conn:
+                conn.execute("INSERT OR REPLACE INTO rollup_meta VALUES ('refreshed_at', ?)", (int(time.time()),))
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+            raise
+        finally:
+            self.last_refresh = time.time()
+        return today - start_day
+
+    def _refresh_chunk(self, run_query, start_day, end_day, min_day):
+        binds = [start_day * DAY_SECONDS, end_day * DAY_SECONDS]
+        facts = run_query(FACT_SQL, binds, name="rollup.facts")
+        descs = run_query(DES_SQL, binds, name="rollup.descriptions")
+        skylight = run_query(SKYLIGHT_SQL, binds, name="rollup.skylight")
+
+        # 整批天在一个事务内替换，读者只会看到旧数据或新数据
+        with self._connect() as conn:
+            for table in ("alarm_daily", "alarm_daily_des", "alarm_daily_skylight"):
+                conn.execute(f"DELETE FROM {table} WHERE day >= ? AND day < ?", (start_day, end_day))
+            conn.executemany(
+                "INSERT INTO alarm_daily VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                ((int(r[0]), _strip(r[1]), *r[2:]) for r in facts)
+            )
+            conn.executemany(
+                "INSERT INTO alarm_daily_des VALUES (?, ?, ?)",
+                ((int(r[0]), r[1], r[2]) for r in descs)
+            )
+            conn.executemany(
+                "INSERT INTO alarm_daily_skylight VALUES (?, ?, ?, ?, ?)",
+                ((int(r[0]), r[1], _strip(r[2]), r[3], r[4]) for r in skylight)
+            )
+            closed_until = (self._read_meta(conn) or {}).get("closed_until", end_day)
+            conn.execute("INSERT OR REPLACE INTO rollup_meta VALUES ('min_day', ?)", (min_day,))
+            conn.execute(
+                "INSERT OR REPLACE INTO rollup_meta VALUES ('closed_until', ?)",
+                (max(closed_until, end_day),)
+            )
+
+    # ---------------- 查询 ----------------
+
+    def plan(self, start_ts, end_ts):
+        """
+        拆分 [start_ts, end_ts)：返回 (closed, open)
+        - closed: (起始日, 结束日) 由汇总库提供
+        - open: (起始时间戳, 结束时间戳) 尚未关账，需要回查 Oracle；没有则为 None
+        范围不是整天、早于最早落地日或完全未关账时返回 None，由调用方走原有查询。
+        """
+        if start_ts % DAY_SECONDS or end_ts % DAY_SECONDS:
+            return None
+        meta = self.meta()
+        if meta is None:
+            return None
+        start_day = start_ts // DAY_SECONDS
+        end_day = end_ts // DAY_SECONDS
+        if start_day < meta["min_day"] or start_day >= meta["closed_until"]:
+            return None
+        closed = (start_day, min(end_day, meta["closed_until"]))
+        open_range = None
+        if end_day > meta["closed_until"]:
+            open_range = (meta["closed_until"] * DAY_SECONDS, end_ts)
+        return closed, open_range
+
+    def facts(self, start_day, end_day, dims, by_day=False):
+        """按 dims 汇总 [start_day, end_day) 的日计数，返回 (*dims, cnt) 行；by_day=True 时按天分开，返回 (day, *dims, cnt)"""
+        cols = ", ".join(("day", *dims) if by_day else dims)
+        sql = f"""
+            SELECT {cols}, sum(cnt) FROM alarm_daily
+            WHERE day >= ? AND day < ?
+            GROUP BY {cols}
+        """
+        with self._connect() as conn:
+            return conn.execute(sql, (start_day, end_day)).fetchall()
+
+    def descriptions(self, start_day, end_day):
+        """[start_day, end_day) 内各 alarmdes 的报警数，返回 (alarmdes, cnt) 行"""
+        sql = """
+            SELECT alarmdes, sum(cnt) FROM alarm_daily_des
+            WHERE day >= ? AND day < ?
+            GROUP BY alarmdes
+        """
+        with self._connect() as conn:
+            return conn.execute(sql, (start_day, end_day)).fetchall()
+
+    def skylight_issues(self, start_day, end_day):
+        """[start_day, end_day) 内天窗报警按 (alarmdes, telename, devicetype) 的计数"""
+        sql = """
+            SELECT alarmdes, telename, devicetype, sum(cnt) FROM alarm_daily_skylight
+            WHERE day >= ? AND day < ?
+            GROUP BY alarmdes, telename, devicetype
+        """
+        with self._connect() as conn:
+            return conn.execute(sql, (start_day, end_day)).fetchall()
+
+    def status(self):
+        meta = self.meta()
+
+        def day_str(day):
+            return str(datetime.date(1970, 1, 1) + datetime.timedelta(days=day))
+
+        return {
+            "path": os.path.abspath(self.path),
+            "first_day": day_str(meta["min_day"]) if meta else None,
+            "closed_until": day_str(meta["closed_until"]) if meta else None,
+            "recheck_days": self.recheck_days,
+            "last_refresh": self.last_refresh,
+            "refreshed_at": self.refreshed_at(),
+            "refreshing": self._lease.holder(REFRESH_LEASE),
+            "last_error": self.last_error
+        }
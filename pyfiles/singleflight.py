@@ -0,0 +1,75 @@
+import asyncio
+import threading
+import functools
+import concurrent.futures
+
+# 相同请求的并发计算合并 (singleflight)
+# 同一 key 的计算进行中时，后到的调用不再重复计算，而是等待并共享第一个调用的结果 (异常同样共享)；
+# 计算结束即移除 key，之后的调用重新计算 (结果复用交给报表缓存)。
+# 进行中的计算以 concurrent.futures.Future 表示，由线程锁保护，因此事件循环中的协程 (do) 与
+# 线程池中的同步调用 (do_sync) 可以互相等待，跨事件循环同样适用。
+# 协程形式的计算在独立任务中执行: 发起者被取消 (如客户端断开) 时计算继续，其他等待者照常拿到结果。
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def _join(self, key):
+        """返回 (future, 是否由本调用负责计算)"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = self._calls[key] = concurrent.futures.Future()
+            self.leaders += 1
+            return future, True
+
+    def _finish(self, key, future, result=None, error=None):
+        # 先移除 key 再公布结果，之后到达的调用不会拿到已完成的旧计算
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _task_done(self, key, future, task):
+        if task.cancelled():
+            self._finish(key, future, error=asyncio.CancelledError())
+        elif task.exception() is not None:
+            self._finish(key, future, error=task.exception())
+        else:
+            self._finish(key, future, result=task.result())
+
+    async def do(self, key, fn):
+        """fn 为无参协程函数；返回 (结果, 是否共享了其他调用的计算)"""
+        future, leader = self._join(key)
+        if not leader:
+            # shield: 等待者自己被取消时不影响共享的计算
+            return await asyncio.shield(asyncio.wrap_future(future)), True
+        task = asyncio.ensure_future(fn())
+        task.add_done_callback(functools.partial(self._task_done, key, future))
+        return await asyncio.shield(task), False
+
+    def do_sync(self, key, fn):
+        """fn 为无参函数，在调用线程中执行；返回值同 do"""
+        future, leader = self._join(key)
+        if not leader:
+            return future.result(), True
+        try:
+            result = fn()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result=result)
+        return result, False
+
+    def snapshot(self):
+        with self._lock:
+            in_flight = len(self._calls)
+        return {"in_flight": in_flight, "leaders": self.leaders, "coalesced": self.coalesced}
@@ -0,0 +1,98 @@
+import os
+import json
+import time
+import logging
+import logging.handlers
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+# 慢查询记录
+# 单条 SQL (借用连接 + 执行 + 取数 + 流式统计) 耗时达到 threshold 秒时记录一行 JSON:
+#   时间、语句名、绑定变量、各阶段耗时、取回行数、状态、请求 ID，以及 SQL 文本和执行计划。
+# 同一语句名在 plan_interval 秒内只抓取一次执行计划 (抓取本身也要访问数据库)，其余记录只带耗时。
+# 写文件和抓取执行计划在单独的线程中进行，不占用查询线程；日志文件超过 max_bytes 时轮转，保留 backup_count 个旧文件。
+
+class SlowQueryLog:
+    def __init__(self, path, threshold=5.0, plan_interval=3600, max_bytes=10 * 1024 * 1024, backup_count=5):
+        self.path = path
+        self.threshold = threshold
+        self.plan_interval = plan_interval
+        self._plans = {}
+        self._lock = threading.Lock()
+        self._handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        self._handler.setFormatter(logging.Formatter("%(message)s"))
+        self._logger = logging.getLogger(f"slow_query.{os.path.abspath(path)}")
+        self._logger.setLevel(logging.INFO)
+        self._logger.propagate = False
+        self._logger.addHandler(self._handler)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slow-query")
+
+    def observe(self, name, sql, binds, timing, status, explain=None, request_id=None):
+        """
+        查询结束后调用；未达到阈值时直接返回 False。
+        timing 为 alarm_source.QueryTiming；explain(sql, binds) 返回执行计划的文本行 (数据源不支持时传 None)。
+        """
+        elapsed = timing.elapsed
+        if elapsed < self.threshold:
+            return False
+        entry = {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "name": name,
+            "elapsed_ms": round(elapsed * 1000, 1),
+            "acquire_ms": round(timing.acquire * 1000, 1),
+            "execute_ms": round(timing.execute * 1000, 1),
+            "fetch_ms": round(timing.fetch * 1000, 1),
+            "consume_ms": round(timing.consume * 1000, 1),
+            "rows": timing.rows,
+            "status": status,
+            "binds": binds,
+            "request_id": request_id
+        }
+        if explain is not None and not self._plan_due(name):
+            explain = None
+        self._executor.submit(self._write, entry, sql, explain)
+        return True
+
+    def _plan_due(self, name):
+        now = time.monotonic()
+        with self._lock:
+            last = self._plans.get(name)
+            if last is not None and now - last < self.plan_interval:
+                return False
+            self._plans[name] = now
+            return True
+
+    def _write(self, entry, sql, explain):
+        if explain is not None:
+            entry["sql"] = sql
+            try:
+                entry["plan"] = explain(sql, entry["binds"])
+            except Exception as e:
+                entry["plan_error"] = str(e)
+        try:
+            self._logger.info(json.dumps(entry, ensure_ascii=False, default=str))
+        except Exception as e:
+            print(f"Error writing slow query log: {e}")
+
+    def recent(self, limit=50, name=None):
+        """当前日志文件中最近的 limit 条记录 (新的在前)，可按语句名过滤"""
+        entries = collections.deque(maxlen=limit)
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if name is None or entry.get("name") == name:
+                        entries.append(entry)
+        except FileNotFoundError:
+            pass
+        return list(reversed(entries))
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._logger.removeHandler(self._handler)
+        self._handler.close()
@@ -0,0 +1,153 @@
+import json
+import array
+import threading
+
+import config_snapshot
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 车站维度
+# 由 station_map.json (或 Stations.xml) 构建一次，电报码 / 车间 / 电务段各自编为从 0 开始的连续整数 id:
+#   电报码 -> station_id -> workshop_id -> section_id
+# 各层映射存放在定长整数数组中，按 id 下标取值；ids() / hierarchy_ids() 可一次换算整列电报码 (numpy 可用时返回数组)。
+# Oracle CHAR 列返回的电报码带尾部空格，查找时不再逐行 strip(): 已知电报码的某种写法首次出现时规整一次，
+# 之后该写法直接命中。未知电报码不记住 (每次规整后查找)，缓存大小不随数据中的脏值增长。
+# 车间按 (电务段, 车间名) 编号，同名车间在不同电务段下是不同的车间。
+
+UNKNOWN = -1
+# station_map.json 中缺少电务段时的占位名称，统计时按未知电务段处理
+UNKNOWN_SECTION = "未知电务段"
+
+class StationDimension:
+    def __init__(self, records):
+        """records: 可迭代的 (电报码, 车站名, 车间, 电务段)，电报码为空的记录忽略"""
+        self.codes = []                         # station_id -> 电报码
+        self.names = []                         # station_id -> 车站名
+        self.workshops = []                     # workshop_id -> 车间名
+        self.sections = []                      # section_id -> 电务段名
+        self.station_workshop = array.array("i")  # station_id -> workshop_id
+        self.workshop_section = array.array("i")  # workshop_id -> section_id
+        self._ids = {}
+        self._lock = threading.Lock()
+
+        workshop_ids, section_ids = {}, {}
+        for code, name, workshop, section in records:
+            code = (code or "").strip()
+            if not code:
+                continue
+            section_id = section_ids.get(section)
+            if section_id is None:
+                section_id = section_ids[section] = len(self.sections)
+                self.sections.append(section)
+            workshop_id = workshop_ids.get((section, workshop))
+            if workshop_id is None:
+                workshop_id = workshop_ids[(section, workshop)] = len(self.workshops)
+                self.workshops.append(workshop)
+                self.workshop_section.append(section_id)
+            station_id = self._ids.get(code)
+            if station_id is None:
+                station_id = self._ids[code] = len(self.codes)
+                self.codes.append(code)
+                self.names.append(name)
+                self.station_workshop.append(workshop_id)
+            else:
+                # 重复的电报码以最后一条为准 (与 dict 构建的行为一致)
+                self.names[station_id] = name
+                self.station_workshop[station_id] = workshop_id
+
+    @classmethod
+    def from_json(cls, path):
+        """station_map.json: {电报码: {"name", "workshop", "ele_section"}}"""
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(
+            (code, info.get("name", code), info.get("workshop", "未知车间"), info.get("ele_section", UNKNOWN_SECTION))
+            for code, info in data.items()
+        )
+
+    @classmethod
+    def from_xml(cls, path):
+        """Stations.xml: <Sta telename= name= Workshop= EleSection= />，编码识别同 config_snapshot.read_xml"""
+        return cls(config_snapshot.parse_stations(path))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def records(self):
+        """{电报码: (车站名, 车间, 电务段)}，用于比较两个版本的车站表"""
+        return {
+            code: (self.names[i], self.workshops[self.station_workshop[i]],
+                   self.sections[self.workshop_section[self.station_workshop[i]]])
+            for i, code in enumerate(self.codes)
+        }
+
+    def id_of(self, telename):
+        """电报码 (可带首尾空格) -> station_id，未知时返回 UNKNOWN"""
+        station_id = self._ids.get(telename)
+        if station_id is None:
+            station_id = self._ids.get(telename.strip(), UNKNOWN) if telename else UNKNOWN
+            if station_id != UNKNOWN:
+                with self._lock:
+                    self._ids[telename] = station_id
+        return station_id
+
+    def ids(self, telenames):
+        """整列电报码 -> station_id (numpy 可用时为 int64 数组，否则为列表)"""
+        id_of = self.id_of
+        if np is not None:
+            return np.fromiter((id_of(t) for t in telenames), dtype=np.int64, count=len(telenames))
+        return [id_of(t) for t in telenames]
+
+    def hierarchy_ids(self, telenames):
+        """
+        整列电报码 -> (section_id, workshop_id) 两个 int64 数组 (需要 numpy)。
+        未知电报码以及电务段为 UNKNOWN_SECTION 的车站两者均为 UNKNOWN。
+        """
+        # 各层数组末尾补一个 UNKNOWN，UNKNOWN (-1) 作下标时取到的仍是 UNKNOWN
+        station_workshop = np.append(np.asarray(self.station_workshop, dtype=np.int64), UNKNOWN)
+        known_section = np.array([s != UNKNOWN_SECTION for s in self.sections] + [False])
+        workshop_section = np.append(np.asarray(self.workshop_section, dtype=np.int64), UNKNOWN)
+        workshop = station_workshop[self.ids(telenames)]
+        section = workshop_section[workshop]
+        known = known_section[section]
+        return np.where(known, section, UNKNOWN), np.where(known, workshop, UNKNOWN)
+
+    def name(self, telename, default=None):
+        """车站名；未知电报码返回 default (缺省为电报码本身)"""
+        station_id = self.id_of(telename)
+        if station_id == UNKNOWN:
+            return telename if default is None else default
+        return self.names[station_id]
+
+    def workshop(self, telename, default=None):
+        station_id = self.id_of(telename)
+        if station_id == UNKNOWN:
+            return default
+        return self.workshops[self.station_workshop[station_id]]
+
+    def section(self, telename, default=None):
+        station_id = self.id_of(telename)
+        if station_id == UNKNOWN:
+            return default
+        return self.sections[self.workshop_section[self.station_workshop[station_id]]]
+
+    def section_workshop(self, telename, default=(None, None)):
+        """(电务段, 车间)，未知电报码返回 default"""
+        station_id = self.id_of(telename)
+        if station_id == UNKNOWN:
+            return default
+        workshop_id = self.station_workshop[station_id]
+        return self.sections[self.workshop_section[workshop_id]], self.workshops[workshop_id]
+
+def load(json_path, xml_path=None):
+    """优先读取 station_map.json，不存在时解析 Stations.xml"""
+    try:
+        return StationDimension.from_json(json_path)
+    except FileNotFoundError:
+        if not xml_path:
+            raise
+        print(f"Warning: {json_path} not found, building station map from {xml_path}")
+        return StationDimension.from_xml(xml_path)
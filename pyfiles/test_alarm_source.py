@@ -0,0 +1,69 @@
+import random
+import collections
+
+import pytest
+
+import alarm_source
+import api_server
+from conftest import START_TS, alarm_row
+
+# Oracle -> SQLite 改写测试
+# 改写后的 SQL 在本地 SQLite 数据源上执行，结果须与直接在 Python 中按原 SQL 语义统计的结果相同。
+
+BINDS = [START_TS, START_TS + 7 * 86400]
+
+@pytest.fixture
+def rows(sqlite_source):
+    rng = random.Random(0)
+    rows = []
+    for i in range(300):
+        des = rng.choice(["道岔无表示", "电压超限", "外电网断电", "缺口,(超标)", None])
+        rows.append(alarm_row(rng, rng.choice(["HCX", "ABC", "XYZ", None]), rng.choice([1, 4, 15]),
+                              "设备", 150, 0, des, maintanceflag=i % 4 == 0))
+    sqlite_source(rows)
+    return rows
+
+def test_rownum_becomes_limit(rows):
+    sql = """
+        SELECT * FROM (
+            SELECT alarmdes, count(*) as cnt FROM ALARM
+            WHERE createtime >= :1 AND createtime < :2
+            GROUP BY alarmdes
+            ORDER BY cnt DESC, NLSSORT(alarmdes, 'NLS_SORT=BINARY') NULLS FIRST
+        ) WHERE ROWNUM <= 3
+    """
+    assert alarm_source.translate_sql(sql).endswith(") LIMIT 3")
+    counts = collections.Counter(r[6] for r in rows)
+    expected = sorted(counts.items(), key=lambda kv: (-kv[1], kv[0] is not None, alarm_source.sort_bytes(kv[0] or "")))
+    assert api_server.run_query(sql, BINDS) == expected[:3]
+
+def test_grouping_sets_expand_to_union_all(rows):
+    sql = """
+        SELECT
+            devicetype, telename,
+            GROUPING(telename) as g_station,
+            count(*) as cnt,
+            sum(case when alarmdes = '缺口,(超标)' then 1 else 0 end) as gap
+        FROM ALARM
+        WHERE createtime >= :1 AND createtime < :2 AND maintanceflag = 0
+        GROUP BY GROUPING SETS ((devicetype), (devicetype, telename))
+    """
+    translated = alarm_source.translate_sql(sql)
+    assert "GROUPING" not in translated.upper()
+    assert translated.count("UNION ALL") == 1
+
+    by_device, by_station = collections.Counter(), collections.Counter()
+    gap_device, gap_station = collections.Counter(), collections.Counter()
+    for r in rows:
+        if r[7]:
+            continue
+        by_device[r[1]] += 1
+        by_station[(r[1], r[0])] += 1
+        gap_device[r[1]] += r[6] == "缺口,(超标)"
+        gap_station[(r[1], r[0])] += r[6] == "缺口,(超标)"
+    expected = sorted(
+        [(dtype, None, 1, cnt, gap_device[dtype]) for dtype, cnt in by_device.items()]
+        + [(dtype, tele, 0, cnt, gap_station[(dtype, tele)]) for (dtype, tele), cnt in by_station.items()],
+        key=repr
+    )
+    assert sorted(api_server.run_query(sql, BINDS), key=repr) == expected
@@ -0,0 +1,58 @@
+import random
+
+import pytest
+
+import api_server
+from conftest import alarm_row, run_report
+
+# 第一部分表2 / 表3 分类测试 (本地 SQLite 数据源)
+# compile_category_case 编译的 SQL CASE 在库内分类，结果须与 Python 逐行 / 列式分类完全相同，
+# 包括从 alarm_type_config.json 热加载的其他分类表。
+
+def category_rows():
+    """覆盖分类的每个分支: 表2 映射 / 表2 other / 表3 映射 / 缺口 (设备类型 51 或描述) / 室外监测 / 监测描述 / 兜底"""
+    rng = random.Random(0)
+    classification = api_server.BASE_CONFIG.classification
+    types = (sorted(classification.table2_types) + sorted(classification.table2_other_types)
+             + sorted(t for types in classification.table3_types.values() for t in types) + [9000, None])
+    codes = api_server.BASE_CONFIG.stations.codes[:6] + ["UNKNOWN"]
+    descriptions = ["道岔无表示", "外电网断电", "缺口超标", "监测通道故障", "外电网监测异常", None]
+    rows = []
+    for _ in range(2000):
+        rows.append(alarm_row(rng, rng.choice(codes), rng.choice([1, 4, 51, 65, 23]), "设备",
+                              rng.choice(types), 0, rng.choice(descriptions), alarmlevel=rng.choice([1, 2, 3])))
+    return rows
+
+def part1_by_path(monkeypatch):
+    """库内分类、列式分类、逐行分类三种路径的第一部分结果"""
+    results = []
+    for in_sql, columnar in ((True, True), (False, True), (False, False)):
+        monkeypatch.setitem(api_server.CLASSIFY_CONFIG, "in_sql", in_sql)
+        monkeypatch.setitem(api_server.COLUMNAR_CONFIG, "enabled", columnar)
+        results.append(run_report(api_server.compute_alarm_stats))
+    return results
+
+def test_sql_case_matches_python_classifier(sqlite_source, monkeypatch):
+    sqlite_source(category_rows())
+    in_sql, columnar, by_row = part1_by_path(monkeypatch)
+    assert in_sql == columnar == by_row
+
+    def categories(table):
+        return {cat for row in by_row[table] for cat in row["breakdown"]} - {"total"}
+    classification = api_server.BASE_CONFIG.classification
+    assert categories("table2_self_diagnosis") == {"elec_char", "switch_no_rep", "safety", "other"}
+    assert categories("table3_external_interface") == set(classification.table3_types) | {"gap", "other"}
+
+def test_reloaded_classification_applies_to_every_path(sqlite_source, monkeypatch):
+    sqlite_source(category_rows())
+    default = part1_by_path(monkeypatch)[0]
+
+    classification = api_server.parse_alarm_classification({"report_classification": {
+        "table2_types": {"210": "safety", "150": "elec_char"},
+        "table2_other_types": [9000],
+        "table3_types": {"atp": [113, 201], "power": [237]}
+    }})
+    monkeypatch.setattr(api_server, "BASE_CONFIG", api_server.BASE_CONFIG._replace(classification=classification))
+    in_sql, columnar, by_row = part1_by_path(monkeypatch)
+    assert in_sql == columnar == by_row
+    assert by_row != default
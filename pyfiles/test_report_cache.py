@@ -0,0 +1,73 @@
+import asyncio
+import datetime
+import random
+
+import pytest
+from fastapi import Response
+
+import api_server
+import report_cache
+from conftest import START_DATE, END_DATE, alarm_row, run_report
+
+# 报表缓存测试 (本地 SQLite 数据源)
+# 经 cached_report 取到的结果 (MISS / 内存 HIT / 磁盘 HIT) 须与直接计算相同；过期时间按结束日期是否早于今天区分。
+
+def cached(endpoint, start_date=START_DATE, end_date=END_DATE):
+    """返回 (结果, X-Cache)"""
+    response = Response()
+    req = api_server.ReportRequest(start_date=start_date, end_date=end_date)
+    result = asyncio.run(api_server.cached_report(endpoint, req, response))
+    return result, response.headers["X-Cache"]
+
+@pytest.fixture
+def cache(sqlite_source, tmp_path, monkeypatch):
+    rng = random.Random(0)
+    codes = api_server.BASE_CONFIG.stations.codes[:5]
+    sqlite_source([alarm_row(rng, rng.choice(codes), 1, "道岔", 150, 0, "道岔无表示", maintanceflag=i % 3 == 0)
+                   for i in range(200)])
+    store = report_cache.ReportCache(max_entries=16, disk_path=str(tmp_path / "cache.db"))
+    monkeypatch.setattr(api_server, "REPORT_CACHE", store)
+    return store
+
+def test_cached_report_matches_compute_on_every_tier(cache, monkeypatch):
+    expected = run_report(api_server.compute_skylight)
+    assert cached("part4_skylight") == (expected, "MISS")
+    assert cached("part4_skylight") == (expected, "HIT")
+    # 重启后 (新的内存层) 从磁盘命中
+    monkeypatch.setattr(api_server, "REPORT_CACHE", report_cache.ReportCache(disk_path=cache.disk_path))
+    assert cached("part4_skylight") == (expected, "HIT")
+    assert api_server.REPORT_CACHE.stats["disk_hits"] == 1
+
+def test_open_range_expires_before_closed_range(cache, monkeypatch):
+    today = datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+    cached("part4_skylight")
+    cached("part4_skylight", start_date=today, end_date=today)
+
+    now = report_cache.time.time()
+    monkeypatch.setattr(report_cache.time, "time", lambda: now + cache.open_ttl + 1)
+    assert cached("part4_skylight")[1] == "HIT"
+    assert cached("part4_skylight", start_date=today, end_date=today)[1] == "MISS"
+
+    monkeypatch.setattr(report_cache.time, "time", lambda: now + cache.closed_ttl + 1)
+    assert cached("part4_skylight")[1] == "MISS"
+
+def test_invalidate_matches_each_key_part(tmp_path):
+    cache = report_cache.ReportCache(max_entries=2, disk_path=str(tmp_path / "cache.db"))
+    entries = [
+        ("part1_overview", "2024-01-01", "2024-01-07"),
+        ("part1_overview", "2024-01-08", "2024-01-14"),
+        ("trend_series_week", "2024-01-01", "2024-01-07"),
+        ("trend_series_week", "2024-01-01", "2024-03-31"),
+        ("full", "2024-01-08", "2024-01-14")
+    ]
+    # 内存只保留最后 2 条，其余只在磁盘上；两层中的同一条目只计一次
+    for entry in entries:
+        cache.put(*entry, {"key": "|".join(entry)})
+
+    assert cache.invalidate(endpoint="trend_series_week", end_date="2024-03-31") == 1
+    assert cache.invalidate(start_date="2024-01-08") == 2
+    assert cache.get("part1_overview", "2024-01-08", "2024-01-14") is None
+    assert cache.get("part1_overview", "2024-01-01", "2024-01-07") == ({"key": "part1_overview|2024-01-01|2024-01-07"}, "disk")
+    assert cache.invalidate(endpoint="part1") == 0
+    assert cache.invalidate() == 2
+    assert cache.get("trend_series_week", "2024-01-01", "2024-01-07") is None
@@ -0,0 +1,129 @@
+import json
+import random
+
+import pytest
+
+import api_server
+from conftest import alarm_row, run_report
+
+# 报表口径一致性测试 (本地 SQLite 数据源)
+# 同一份数据经不同的计算路径 (库内排名 / Python 统计) 得到的报表必须完全相同，包括计数相同时的先后次序。
+#   python -m pytest test_report_parity.py
+
+def hazard_rows():
+    """含空白描述、'#' 结尾的描述、空白车站 / 设备名以及各排名截断处计数相同的数据"""
+    rng = random.Random(0)
+    rows = []
+    # 未配置通用名的同一报警类型: 全空白描述与 "设备X#" 的通用名都是空串，应合并为一项
+    for _ in range(50):
+        rows.append(alarm_row(rng, "站A", 1, "道岔1", 9001, 0, "   "))
+        rows.append(alarm_row(rng, "站A", 1, "道岔1", 9001, 0, "设备X#"))
+    for des in ("\t", "　设备Y#断开　", None, "", " 设备Z#挤岔 "):
+        for _ in range(7):
+            rows.append(alarm_row(rng, "站B", 1, None, 9002, 0, des))
+    for telename in ("站C", " 站C ", "\t站C", "   ", None, ""):
+        for devicename in (None, "", "  ", " 道岔2 "):
+            for _ in range(3):
+                rows.append(alarm_row(rng, telename, 23, devicename, 9003, 0, "设备W#表示"))
+    # 报警类型截断处计数相同 (15 种各 4 次，只保留前 HAZARD_TOP_TYPES 种)
+    for i in range(15):
+        for _ in range(4):
+            rows.append(alarm_row(rng, f"站D{i % 3}", 4, "信号机", 9100 + i, 0, f"信号机#故障{i:02d}"))
+    # 设备与车站截断处计数相同
+    for i in range(9):
+        for _ in range(5):
+            rows.append(alarm_row(rng, f"站E{i}", 15, f"轨道{i}", 9200, 0, f"轨道{i}#红光带"))
+    # 配置了通用名的报警类型
+    mapped = [key for key, name in api_server.BASE_CONFIG.alarm_desc_map.items() if name][:2]
+    for at, ast in mapped:
+        for i in range(6):
+            rows.append(alarm_row(rng, f"站F{i}", 5, f"电源{i}", at, ast, f"电源{i}#告警"))
+    # 天窗报警不计入第二部分
+    for _ in range(20):
+        rows.append(alarm_row(rng, "站A", 1, "道岔1", 9001, 0, "设备X#", maintanceflag=1))
+    rng.shuffle(rows)
+    return rows
+
+def test_hazard_ranking_in_sql_matches_python(sqlite_source, monkeypatch):
+    sqlite_source(hazard_rows())
+    results = {}
+    for in_sql in (True, False):
+        monkeypatch.setitem(api_server.CLASSIFY_CONFIG, "hazards_top_n_in_sql", in_sql)
+        results[in_sql] = run_report(api_server.compute_hazards)
+    assert results[True] == results[False]
+
+    switch = results[False]["categories"]["switch"]["top_alarm_types"]
+    counts = {t["name"]: t["count"] for t in switch}
+    # 全空白描述按空串计，只有 NULL / 空串记为 Unknown
+    assert counts[""] == 100 + 7
+    assert counts["Unknown"] == 14
+    signal = results[False]["categories"]["signal"]["top_alarm_types"]
+    assert [t["name"] for t in signal] == [f"故障{i:02d}" for i in range(api_server.HAZARD_TOP_TYPES)]
+
+# 码位序与 GBK 字节序不同的汉字
+TIED_NAMES = ["一", "啊", "中", "阿", "保", "左", "丁", "吧", "东", "北", "西", "南", "胡"]
+
+def tied_rows():
+    """各电务段的真实车站上，第一、二、四部分的 Top 榜截断处都有大量计数相同的项"""
+    rng = random.Random(1)
+    by_section = {}
+    for code in api_server.BASE_CONFIG.stations.codes:
+        section = api_server.BASE_CONFIG.stations.section(code)
+        if section and section != "未知电务段" and len(by_section.setdefault(section, [])) < 4:
+            by_section[section].append(code)
+    stations = [code for codes in by_section.values() for code in codes]
+    rows = []
+    for i, code in enumerate(stations):
+        for j in range(4):
+            des = f"{code}{j}#{TIED_NAMES[(i + j) % len(TIED_NAMES)]}故障"
+            for _ in range(3):
+                rows.append(alarm_row(rng, code, (1, 4, 15, 5)[j], f"设备{j}", 9300 + j, 0, des, processstatus=j % 2))
+                rows.append(alarm_row(rng, code, (1, 4, 15, 5)[j], f"设备{j}", 9300 + j, 0, des, week=-1))
+            # 天窗报警: 设备类型与问题描述计数相同
+            for _ in range(2):
+                rows.append(alarm_row(rng, code, (1, 4, 15, 5, 23)[(i + j) % 5], f"设备{j}", 9400, 0, f"天窗{j}",
+                                      maintanceflag=1, processstatus=i % 2))
+    rng.shuffle(rows)
+    return rows
+
+@pytest.mark.parametrize("hazards_in_sql", [True, False])
+def test_full_report_matches_individual_endpoints(sqlite_source, monkeypatch, hazards_in_sql):
+    monkeypatch.setitem(api_server.CLASSIFY_CONFIG, "hazards_top_n_in_sql", hazards_in_sql)
+    sqlite_source(tied_rows())
+    full = run_report(api_server.compute_full_report)
+    parts = {
+        "part1_overview": api_server.compute_alarm_stats,
+        "part2_hazards": api_server.compute_hazards,
+        "part3_trends": api_server.compute_trends,
+        "part4_skylight": api_server.compute_skylight
+    }
+    for name, compute in parts.items():
+        # 完整报表首次计算时写入各部分缓存，缓存内容须与先调用哪个接口无关，因此比较序列化后的字节
+        assert json.dumps(full[name], ensure_ascii=False) == json.dumps(run_report(compute), ensure_ascii=False), name
+    assert len(full["part1_overview"]["top_issues"]) == 10
+    assert full["part1_overview"]["table1_station_stats"]
+
+def test_hazard_ties_follow_gbk_byte_order(sqlite_source, monkeypatch):
+    """计数相同的汉字名称按 GBK 字节序 (Oracle NLSSORT BINARY) 排列，而不是按 Unicode 码位"""
+    names = TIED_NAMES
+    expected = sorted(names, key=lambda n: n.encode("gbk"))
+    assert expected != sorted(names)
+    rng = random.Random(2)
+    rows = []
+    for i, name in enumerate(names):
+        for _ in range(4):
+            rows.append(alarm_row(rng, f"站{name}", 4, f"信号机{name}", 9500 + i, 0, f"信号机#{name}故障"))
+    sqlite_source(rows)
+    results = {}
+    for in_sql in (True, False):
+        monkeypatch.setitem(api_server.CLASSIFY_CONFIG, "hazards_top_n_in_sql", in_sql)
+        results[in_sql] = run_report(api_server.compute_hazards)
+    assert results[True] == results[False]
+
+    signal = results[True]["categories"]["signal"]
+    assert [t["name"] for t in signal["top_alarm_types"]] == [f"{n}故障" for n in expected[:api_server.HAZARD_TOP_TYPES]]
+    assert [t["name"] for t in signal["top_faulty_stations"]] == [f"站{n}" for n in expected[:api_server.HAZARD_TOP_STATIONS]]
+
+    # 第一部分的 Top 描述同样按字节序截断
+    top = run_report(api_server.compute_alarm_stats)["top_issues"]
+    assert [t["issue"] for t in top] == [f"信号机#{n}故障" for n in expected[:10]]
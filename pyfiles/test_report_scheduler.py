@@ -0,0 +1,92 @@
+import asyncio
+import datetime
+import random
+
+import pytest
+
+import api_server
+import process_lease
+import report_cache
+import report_scheduler
+from conftest import alarm_row, run_report
+
+# 预计算调度测试
+# CronRule 与逐分钟按 cron 语义判断的参考实现比较；预计算写入缓存的报表须与直接计算相同。
+
+def reference_next(expression, dt):
+    """逐分钟扫描的参考实现: 日与周都限定 (都不是 *) 时满足其一即可，否则须同时满足"""
+    minute, hour, day, month, weekday = expression.split()
+
+    def allowed(field, value, low, high):
+        values = set()
+        for part in field.split(","):
+            rng, _, step = part.partition("/")
+            start, end = (low, high) if rng == "*" else (int(rng.split("-")[0]), int(rng.split("-")[-1]))
+            if step and rng != "*" and "-" not in rng:
+                end = high
+            values.update(range(start, end + 1, int(step or 1)))
+        return value in values
+
+    t = dt.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+    while True:
+        cron_weekday = (t.weekday() + 1) % 7
+        in_day = allowed(day, t.day, 1, 31)
+        in_weekday = allowed(weekday, cron_weekday, 0, 7) or (cron_weekday == 0 and allowed(weekday, 7, 0, 7))
+        day_ok = in_day or in_weekday if day != "*" and weekday != "*" else in_day and in_weekday
+        if (allowed(minute, t.minute, 0, 59) and allowed(hour, t.hour, 0, 23)
+                and allowed(month, t.month, 1, 12) and day_ok):
+            return t
+        t += datetime.timedelta(minutes=1)
+
+@pytest.mark.parametrize("expression", [
+    "5 0 * * 1", "5 0 1 * *", "0 0 13 * 5", "30 6 1,15 * 1-3", "0 12 * * 0", "0 12 * * 7",
+    "*/20 8-9 * * *", "0 0 31 1/2 6", "15 3 10-12 * 2/2"
+])
+def test_next_after_matches_reference(expression):
+    rule = report_scheduler.CronRule(expression)
+    rng = random.Random(expression)
+    for _ in range(20):
+        dt = datetime.datetime(2026, 1, 1) + datetime.timedelta(minutes=rng.randrange(366 * 24 * 60))
+        assert rule.next_after(dt) == reference_next(expression, dt), dt
+
+def test_day_or_weekday():
+    # 13 日或周五: 2026-10-17 (周六) 之后先到的是 10-23 (周五)，11-13 两者同时满足
+    rule = report_scheduler.CronRule("0 0 13 * 5")
+    assert rule.next_after(datetime.datetime(2026, 10, 17)) == datetime.datetime(2026, 10, 23)
+    assert rule.next_after(datetime.datetime(2026, 11, 10)) == datetime.datetime(2026, 11, 13)
+    # 只限定其一时按该字段判断
+    assert report_scheduler.CronRule("0 0 29 2 *").next_after(datetime.datetime(2025, 3, 1)) == datetime.datetime(2028, 2, 29)
+    with pytest.raises(ValueError):
+        report_scheduler.CronRule("0 0 30 2 *").next_after(datetime.datetime(2026, 1, 1))
+
+def test_precompute_caches_reports_and_skips_claimed_periods(sqlite_source, tmp_path, monkeypatch):
+    rng = random.Random(0)
+    codes = api_server.BASE_CONFIG.stations.codes[:5]
+    sqlite_source([alarm_row(rng, rng.choice(codes), 1, "道岔", 150, 0, "道岔无表示", maintanceflag=i % 2, week=-(i % 2))
+                   for i in range(300)])
+    cache_path = str(tmp_path / "cache.db")
+    monkeypatch.setattr(api_server, "REPORT_CACHE", report_cache.ReportCache(disk_path=cache_path))
+    expected = {endpoint: run_report(api_server.REPORT_BUILDERS[endpoint])
+                for endpoint in ("part1_overview", "part2_hazards", "part3_trends", "part4_skylight")}
+    jobs = [{"name": "weekly", "cron": "5 0 * * 1", "period": "previous_week", "endpoints": ["full"]}]
+    monday = datetime.datetime(2024, 1, 8, 0, 5)
+
+    async def run_once(lease):
+        scheduler = report_scheduler.ReportScheduler(jobs, api_server.precompute_report, lease=lease)
+        scheduler.trigger("weekly", monday)
+        while not (scheduler.jobs["weekly"]["last_run"] or {}).get("finished"):
+            await asyncio.sleep(0.01)
+        return scheduler.jobs["weekly"]["last_run"]
+
+    # 其他进程持有同一周期的租约时跳过
+    other = process_lease.LeaseStore(cache_path, owner="other-host:1")
+    assert other.acquire("precompute.weekly.2024-01-01.2024-01-07", 60)
+    run = asyncio.run(run_once(process_lease.LeaseStore(cache_path)))
+    assert run["skipped"] and run["endpoints"] == {}
+    assert api_server.REPORT_CACHE.get("part1_overview", "2024-01-01", "2024-01-07") is None
+
+    other.release("precompute.weekly.2024-01-01.2024-01-07")
+    run = asyncio.run(run_once(process_lease.LeaseStore(cache_path)))
+    assert run["endpoints"]["full"]["result"] == "MISS"
+    for endpoint, result in expected.items():
+        assert api_server.REPORT_CACHE.get(endpoint, "2024-01-01", "2024-01-07")[0] == result, endpoint
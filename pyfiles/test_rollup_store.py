@@ -0,0 +1,103 @@
+import random
+
+import pytest
+
+import api_server
+import process_lease
+import rollup_store
+from conftest import START_DAY, START_TS, alarm_row, run_report
+
+# 日汇总库测试 (本地 SQLite 数据源)
+# 刷新经 api_server.run_query 从 SQLite 数据源拉取；读汇总库 (含未关账部分回查) 的报表须与直接查询的结果完全相同。
+
+DAY = rollup_store.DAY_SECONDS
+
+def mixed_rows(seed=0):
+    """真实车站上两周的报警，覆盖各报表用到的维度 (天窗、处理状态、外电网 / 缺口 / 监测关键词)"""
+    rng = random.Random(seed)
+    # 电报码按 CHAR 列的口径补齐到定宽
+    stations = [code.ljust(8) for code in api_server.BASE_CONFIG.stations.codes[:8]]
+    kinds = [(1, 150, "道岔无表示"), (4, 113, "电压超限"), (15, 210, "外电网断电"), (5, 201, "列控通信中断"),
+             (51, 9000, "缺口超标"), (65, 9001, "室外设备"), (23, 9002, "监测通道故障"), (1, 54, "道岔1#智能分析")]
+    rows = []
+    for week in (-1, 0):
+        for _ in range(600):
+            dtype, atype, des = rng.choice(kinds)
+            rows.append(alarm_row(rng, rng.choice(stations), dtype, "设备", atype, 0, des,
+                                  maintanceflag=int(rng.random() < 0.3), processstatus=int(rng.random() < 0.5),
+                                  week=week))
+    return rows
+
+def day_count(rows, day):
+    return sum(1 for r in rows if r[-1] // DAY == day)
+
+@pytest.fixture
+def rollup(sqlite_source, tmp_path, monkeypatch):
+    """数据源中装入 mixed_rows，返回 (汇总库, 设置 "今天" 的函数)"""
+    today = {"day": START_DAY + 4}
+    monkeypatch.setattr(rollup_store, "today_index", lambda: today["day"])
+    store = rollup_store.AlarmRollupStore(str(tmp_path / "rollup.db"), recheck_days=2, initial_days=14, chunk_days=3)
+    sqlite_source(mixed_rows())
+
+    def set_today(day):
+        today["day"] = day
+    return store, set_today
+
+def test_refresh_advances_watermark_and_rechecks_window(rollup, sqlite_source):
+    store, set_today = rollup
+    assert store.plan(START_TS, START_TS + 7 * DAY) is None
+    assert store.refresh(api_server.run_query) == 14
+    assert store.meta() == {"min_day": START_DAY - 10, "closed_until": START_DAY + 4}
+
+    # 数据修正: 复查窗口 (水位线前 2 天) 内的天重新拉取，更早的天保留已落地的计数
+    rows = mixed_rows()
+    changed = mixed_rows(seed=1)
+    sqlite_source(changed)
+    set_today(START_DAY + 6)
+    assert store.refresh(api_server.run_query) == 4
+    assert store.meta()["closed_until"] == START_DAY + 6
+
+    def stored(day):
+        return sum(r[-1] for r in store.facts(day, day + 1, ("telename",)))
+    assert stored(START_DAY + 1) == day_count(rows, START_DAY + 1)
+    for day in range(START_DAY + 2, START_DAY + 6):
+        assert stored(day) == day_count(changed, day)
+
+def test_plan_splits_closed_and_open_days(rollup):
+    store, _ = rollup
+    store.refresh(api_server.run_query)
+    closed_until = START_DAY + 4
+    end_ts = START_TS + 7 * DAY
+    assert store.plan(START_TS, end_ts) == ((START_DAY, closed_until), (closed_until * DAY, end_ts))
+    assert store.plan(START_TS, START_TS + 2 * DAY) == ((START_DAY, START_DAY + 2), None)
+    # 不是整天、早于最早落地日或完全未关账的范围不走汇总库
+    assert store.plan(START_TS + 3600, end_ts) is None
+    assert store.plan((START_DAY - 11) * DAY, end_ts) is None
+    assert store.plan(closed_until * DAY, end_ts) is None
+
+@pytest.mark.parametrize("today_offset", [4, 7])
+def test_reports_from_rollup_match_direct_queries(rollup, monkeypatch, today_offset):
+    """部分关账 (其余回查数据源) 与全部关账两种情况"""
+    store, set_today = rollup
+    set_today(START_DAY + today_offset)
+    store.refresh(api_server.run_query)
+    computes = [api_server.compute_alarm_stats, api_server.compute_trends, api_server.compute_skylight]
+    direct = [run_report(compute) for compute in computes]
+    direct_series = run_report(api_server.compute_trend_series, start_date="2023-12-27", bucket="day")
+
+    monkeypatch.setattr(api_server, "ROLLUP_STORE", store)
+    assert [run_report(compute) for compute in computes] == direct
+    assert run_report(api_server.compute_trend_series, start_date="2023-12-27", bucket="day") == direct_series
+
+def test_refresh_skips_while_another_process_holds_the_lease(rollup):
+    store, _ = rollup
+    other = process_lease.LeaseStore(store.path, owner="other-host:1")
+    assert other.acquire(rollup_store.REFRESH_LEASE, 60)
+    assert store.refresh(api_server.run_query) is None
+    assert store.meta() is None
+    assert store.status()["refreshing"] == "other-host:1"
+
+    other.release(rollup_store.REFRESH_LEASE)
+    assert store.refresh(api_server.run_query) == 14
+    # 其他进程刚刷新过时，定时刷新 (min_age) 跳过
+    assert store.refresh(api_server.run_query, min_age=60) is None
@@ -0,0 +1,122 @@
+import asyncio
+import random
+import threading
+
+import pytest
+from fastapi import Response
+
+import api_server
+import singleflight
+from conftest import alarm_row, run_report
+
+# 并发请求合并测试
+# 同一 key 的并发调用只计算一次，结果、异常与取消都由所有等待者共享。
+
+def test_concurrent_reports_compute_once(sqlite_source, monkeypatch):
+    rng = random.Random(0)
+    codes = api_server.BASE_CONFIG.stations.codes[:5]
+    sqlite_source([alarm_row(rng, rng.choice(codes), 1, "道岔", 150, 0, "道岔无表示") for _ in range(200)])
+    expected = run_report(api_server.compute_hazards)
+
+    flights = singleflight.SingleFlight()
+    monkeypatch.setattr(api_server, "REPORT_FLIGHTS", flights)
+    monkeypatch.setattr(api_server, "REPORT_CACHE", None)
+    calls = []
+    compute = api_server.REPORT_BUILDERS["part2_hazards"]
+
+    async def counted(req):
+        calls.append(req)
+        await asyncio.sleep(0.05)
+        return await compute(req)
+    monkeypatch.setitem(api_server.REPORT_BUILDERS, "part2_hazards", counted)
+
+    async def main():
+        req = api_server.ReportRequest(start_date="2024-01-01", end_date="2024-01-07")
+        responses = [Response() for _ in range(5)]
+        results = await asyncio.gather(*(api_server.cached_report("part2_hazards", req, r) for r in responses))
+        return results, [r.headers.get("X-Cache") for r in responses]
+
+    results, statuses = asyncio.run(main())
+    assert len(calls) == 1
+    assert results == [expected] * 5
+    # 未启用缓存时计算者不带 X-Cache，其余为 COALESCED
+    assert statuses.count("COALESCED") == 4 and statuses.count(None) == 1
+    assert flights.snapshot() == {"in_flight": 0, "leaders": 1, "coalesced": 4}
+
+def test_exception_is_shared_and_key_released():
+    flights = singleflight.SingleFlight()
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def main():
+        results = await asyncio.gather(*(flights.do("k", failing) for _ in range(3)), return_exceptions=True)
+        assert [type(r) for r in results] == [ValueError] * 3 and len({id(r) for r in results}) == 1
+        # 计算结束后 key 已移除，再次调用重新计算
+        with pytest.raises(ValueError):
+            await flights.do("k", failing)
+
+    asyncio.run(main())
+    assert len(calls) == 2
+
+def test_cancelled_leader_does_not_cancel_shared_computation():
+    flights = singleflight.SingleFlight()
+    started = None
+
+    async def compute():
+        started.set()
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def main():
+        nonlocal started
+        started = asyncio.Event()
+        leader = asyncio.ensure_future(flights.do("k", compute))
+        await started.wait()
+        follower = asyncio.ensure_future(flights.do("k", compute))
+        await asyncio.sleep(0)
+        leader.cancel()
+        assert await follower == ("result", True)
+        assert leader.cancelled()
+
+    asyncio.run(main())
+
+def test_cancelled_computation_cancels_waiters():
+    flights = singleflight.SingleFlight()
+
+    async def compute():
+        await asyncio.sleep(0.01)
+        raise asyncio.CancelledError()
+
+    async def main():
+        waiters = [asyncio.ensure_future(flights.do("k", compute)) for _ in range(3)]
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        assert all(isinstance(r, asyncio.CancelledError) for r in results)
+        assert flights.snapshot()["in_flight"] == 0
+
+    asyncio.run(main())
+
+def test_sync_caller_shares_async_computation():
+    flights = singleflight.SingleFlight()
+    release = threading.Event()
+    results = []
+
+    async def compute():
+        await asyncio.get_running_loop().run_in_executor(None, release.wait)
+        return 42
+
+    async def main():
+        leader = asyncio.ensure_future(flights.do("k", compute))
+        await asyncio.sleep(0)
+        thread = threading.Thread(target=lambda: results.append(flights.do_sync("k", lambda: -1)))
+        thread.start()
+        await asyncio.sleep(0.01)
+        release.set()
+        assert await leader == (42, False)
+        await asyncio.get_running_loop().run_in_executor(None, thread.join)
+
+    asyncio.run(main())
+    assert results == [(42, True)]
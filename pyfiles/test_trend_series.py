@@ -0,0 +1,98 @@
+import random
+import datetime
+
+import pytest
+
+import api_server
+import rollup_store
+from conftest import START_DAY, alarm_row, run_report
+
+# 多周期趋势测试 (本地 SQLite 数据源)
+# 首尾桶截取到查询范围内；库内分桶与日汇总库两条路径的结果都须与按原始行逐桶统计的结果相同。
+
+DAY = rollup_store.DAY_SECONDS
+EPOCH = datetime.date(1970, 1, 1)
+
+def day_index(date):
+    return (datetime.date.fromisoformat(date) - EPOCH).days
+
+def test_series_buckets_trim_edges():
+    # 周中开始、周中结束: 首尾两个 ISO 周不满 7 天
+    assert api_server.series_buckets("2024-01-03", "2024-01-16", "week") == [
+        ("2024-W01", day_index("2024-01-03"), day_index("2024-01-08")),
+        ("2024-W02", day_index("2024-01-08"), day_index("2024-01-15")),
+        ("2024-W03", day_index("2024-01-15"), day_index("2024-01-17")),
+    ]
+    # 标签按 ISO 周年: 2024-12-30 属于 2025-W01
+    assert [label for label, _, _ in api_server.series_buckets("2024-12-25", "2025-01-06", "week")] == \
+        ["2024-W52", "2025-W01", "2025-W02"]
+    assert api_server.series_buckets("2024-01-20", "2024-03-05", "month") == [
+        ("2024-01", day_index("2024-01-20"), day_index("2024-02-01")),
+        ("2024-02", day_index("2024-02-01"), day_index("2024-03-01")),
+        ("2024-03", day_index("2024-03-01"), day_index("2024-03-06")),
+    ]
+    assert api_server.series_buckets("2024-02-28", "2024-03-01", "day") == [
+        ("2024-02-28", day_index("2024-02-28"), day_index("2024-02-29")),
+        ("2024-02-29", day_index("2024-02-29"), day_index("2024-03-01")),
+        ("2024-03-01", day_index("2024-03-01"), day_index("2024-03-02")),
+    ]
+    assert api_server.series_buckets("2024-01-10", "2024-01-10", "month") == [
+        ("2024-01", day_index("2024-01-10"), day_index("2024-01-11"))
+    ]
+
+def series_rows():
+    """上一周与本周的报警；查询范围从上一周的周三开始，之前两天的数据应被排除"""
+    rng = random.Random(0)
+    codes = api_server.BASE_CONFIG.stations.codes[:8]
+    rows = []
+    for week in (-1, 0):
+        for _ in range(500):
+            rows.append(alarm_row(rng, rng.choice(codes), rng.choice([1, 4, 15, 51, 65]), "设备", 150, 0, "道岔无表示",
+                                  maintanceflag=int(rng.random() < 0.3), processstatus=int(rng.random() < 0.5),
+                                  week=week))
+    return rows
+
+def expected_kpis(rows, result):
+    expected = []
+    for item in result["series"]:
+        start = day_index(item["start_date"]) * DAY
+        end = (day_index(item["end_date"]) + 1) * DAY
+        in_bucket = [r for r in rows if start <= r[-1] < end]
+        expected.append(api_server.series_kpi([
+            len(in_bucket), sum(1 for r in in_bucket if r[7]), sum(1 for r in in_bucket if r[8])
+        ]))
+    return expected
+
+@pytest.mark.parametrize("bucket, labels", [
+    ("day", None),
+    ("week", ["2023-W52", "2024-W01"]),
+    ("month", ["2023-12", "2024-01"]),
+])
+def test_series_totals_match_rows(sqlite_source, bucket, labels):
+    rows = series_rows()
+    sqlite_source(rows)
+    result = run_report(api_server.compute_trend_series, start_date="2023-12-27", bucket=bucket)
+    series = result["series"]
+    assert series[0]["start_date"] == "2023-12-27" and series[-1]["end_date"] == "2024-01-07"
+    assert sum(item["days"] for item in series) == 12
+    if labels:
+        assert [item["bucket"] for item in series] == labels
+    kpis = [{k: v for k, v in item["kpi"].items() if k != "daily_avg_total"} for item in series]
+    assert kpis == expected_kpis(rows, result)
+    # 按车间 / 设备大类的拆分之和等于桶的总数
+    for item in series:
+        assert sum(kpi["total"] for kpi in item["workshops"].values()) == item["kpi"]["total"]
+        assert sum(kpi["total"] for kpi in item["device_categories"].values()) == item["kpi"]["total"]
+
+@pytest.mark.parametrize("bucket", ["week", "month"])
+def test_rollup_series_matches_sql_series(sqlite_source, tmp_path, monkeypatch, bucket):
+    monkeypatch.setattr(rollup_store, "today_index", lambda: START_DAY + 5)
+    sqlite_source(series_rows())
+    direct = run_report(api_server.compute_trend_series, start_date="2023-12-27", bucket=bucket)
+
+    store = rollup_store.AlarmRollupStore(str(tmp_path / "rollup.db"), recheck_days=2, initial_days=14, chunk_days=7)
+    store.refresh(api_server.run_query)
+    # 部分关账: 已关账的天读汇总库，其余回查数据源
+    assert store.plan(day_index("2023-12-27") * DAY, (START_DAY + 7) * DAY)[1] is not None
+    monkeypatch.setattr(api_server, "ROLLUP_STORE", store)
+    assert run_report(api_server.compute_trend_series, start_date="2023-12-27", bucket=bucket) == direct